@@ -0,0 +1,33 @@
+from collections import namedtuple
+
+# An achievement is unlocked once the UserStats counter reaches the threshold
+Achievement = namedtuple('Achievement', ['code', 'title', 'description', 'counter', 'threshold'])
+
+ACHIEVEMENTS = (
+    Achievement('first_workout', 'First Workout', 'Completed your first workout session', 'total_exercises', 1),
+    Achievement('streak_master', 'Streak Master', 'Maintained a 7-day workout streak', 'current_streak', 7),
+    Achievement('calorie_crusher', 'Calorie Crusher', 'Burned 1000 calories', 'calories_burned', 1000),
+    Achievement('dedicated', 'Dedicated', 'Completed 50 workout sessions', 'total_exercises', 50),
+    Achievement('rep_machine', 'Rep Machine', 'Completed 1000 reps', 'total_reps', 1000),
+    Achievement('perfect_form', 'Perfect Form', 'Completed 100 reps with perfect form', 'perfect_form_reps', 100),
+)
+
+# Workouts with at least this form accuracy (percent) count towards perfect_form_reps
+PERFECT_FORM_ACCURACY = 90
+
+
+def met_achievements(stats):
+    """Achievements whose thresholds the stats' counters have reached"""
+    return [achievement for achievement in ACHIEVEMENTS
+            if getattr(stats, achievement.counter) >= achievement.threshold]
+
+
+def crossed_achievements(before, after):
+    """
+    Achievements whose thresholds were reached between two snapshots of a
+    user's stats. Only these need to be stored after a workout; everything
+    met earlier was unlocked by an earlier workout.
+    """
+    return [achievement for achievement in ACHIEVEMENTS
+            if getattr(before, achievement.counter) < achievement.threshold
+            <= getattr(after, achievement.counter)]
@@ -3,7 +3,7 @@ from django.contrib import admin
 # Register your models here.
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import User, UserStats
+from .models import User, UserAchievement, UserStats
 
 class CustomUserAdmin(UserAdmin):
     list_display = ('username', 'email', 'fitness_goal', 'daily_streak', 'is_staff')
@@ -27,5 +27,11 @@ class UserStatsAdmin(admin.ModelAdmin):
     list_display = ('user', 'total_exercises', 'total_minutes', 'highest_streak', 'calories_burned')
     search_fields = ('user__username', 'user__email')
 
+class UserAchievementAdmin(admin.ModelAdmin):
+    list_display = ('user', 'code', 'unlocked_at')
+    list_filter = ('code',)
+    search_fields = ('user__username', 'user__email')
+
 admin.site.register(User, CustomUserAdmin)
-admin.site.register(UserStats, UserStatsAdmin)
\ No newline at end of file
+admin.site.register(UserStats, UserStatsAdmin)
+admin.site.register(UserAchievement, UserAchievementAdmin)
\ No newline at end of file
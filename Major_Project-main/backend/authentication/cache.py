@@ -0,0 +1,12 @@
+from django.core.cache import cache
+from django.db import transaction
+
+
+def dashboard_cache_key(user_id):
+    return f'dashboard:{user_id}'
+
+
+def invalidate_dashboard(user_id):
+    """Drop a user's cached dashboard once the current transaction commits"""
+    key = dashboard_cache_key(user_id)
+    transaction.on_commit(lambda: cache.delete(key))
@@ -0,0 +1,62 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from .achievements import ACHIEVEMENTS
+from .cache import dashboard_cache_key
+from .models import User, UserAchievement
+from .serializers import UserSettingsSerializer, UserStatsSerializer
+
+
+# Workouts in a calendar month that count as 100% monthly progress
+MONTHLY_WORKOUT_GOAL = 20
+
+
+def progress_data(user, stats_data):
+    """Progress cards from a user's serialized stats"""
+    monthly_progress = min(100, round(stats_data['monthly_workouts'] / MONTHLY_WORKOUT_GOAL * 100))
+    return [
+        {'name': 'Weekly Workouts', 'value': stats_data['weekly_workouts']},
+        {'name': 'Monthly Progress', 'value': f"{monthly_progress}%"},
+        {'name': 'Current Streak', 'value': user.daily_streak}
+    ]
+
+
+def achievements_data(user_id):
+    """Every achievement with whether and when the user unlocked it, read with one indexed query"""
+    unlocked = dict(UserAchievement.objects.filter(user_id=user_id).values_list('code', 'unlocked_at'))
+    return [
+        {
+            'title': achievement.title,
+            'description': achievement.description,
+            'achieved': achievement.code in unlocked,
+            'unlocked_at': unlocked.get(achievement.code),
+        }
+        for achievement in ACHIEVEMENTS
+    ]
+
+
+def build_dashboard(user_id):
+    """Everything the app shows on open: the user with their stats, this month's rollups and the unlocks"""
+    user = User.objects.select_related('stats').get(pk=user_id)
+    stats = dict(UserStatsSerializer(user.stats).data)
+    return {
+        'stats': stats,
+        'progress': progress_data(user, stats),
+        'achievements': achievements_data(user.pk),
+        'settings': dict(UserSettingsSerializer(user).data),
+    }
+
+
+def get_dashboard(user_id):
+    """
+    A user's dashboard from the cache, built on a miss. Entries are dropped
+    by invalidate_dashboard whenever a workout, the stats or the user's
+    settings are saved, so they never need to be revalidated against the
+    database.
+    """
+    key = dashboard_cache_key(user_id)
+    data = cache.get(key)
+    if data is None:
+        data = build_dashboard(user_id)
+        cache.set(key, data, settings.DASHBOARD_CACHE_TTL)
+    return data
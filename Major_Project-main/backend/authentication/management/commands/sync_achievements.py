@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from authentication.achievements import met_achievements
+from authentication.models import UserAchievement, UserStats
+
+
+class Command(BaseCommand):
+    help = ("Unlock every achievement users' stats already meet, e.g. after adding an achievement "
+            "or for stats recorded before achievements were stored")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Unlocks per INSERT')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        before = UserAchievement.objects.count()
+        unlocks = []
+        for stats in UserStats.objects.iterator(chunk_size=batch_size):
+            unlocks += [UserAchievement(user_id=stats.user_id, code=achievement.code)
+                        for achievement in met_achievements(stats)]
+            if len(unlocks) >= batch_size:
+                self.store(unlocks)
+                unlocks = []
+        self.store(unlocks)
+        self.stdout.write(self.style.SUCCESS(
+            f'Unlocked {UserAchievement.objects.count() - before} achievements'))
+
+    def store(self, unlocks):
+        # Unlocks that already exist keep their original time
+        UserAchievement.objects.bulk_create(unlocks, ignore_conflicts=True)
@@ -0,0 +1,21 @@
+# Generated by Django 5.1.5 on 2026-10-19 15:34
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0005_passwordresetotp'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='userstats',
+            name='monthly_workouts',
+        ),
+        migrations.RemoveField(
+            model_name='userstats',
+            name='weekly_workouts',
+        ),
+    ]
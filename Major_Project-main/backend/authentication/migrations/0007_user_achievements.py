@@ -0,0 +1,38 @@
+# Generated by Django 5.1.5 on 2026-10-19 16:40
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0006_remove_userstats_monthly_workouts_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userstats',
+            name='perfect_form_reps',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userstats',
+            name='total_reps',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='UserAchievement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=50)),
+                ('unlocked_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='achievements', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'code'), name='unique_user_achievement')],
+            },
+        ),
+    ]
@@ -1,10 +1,21 @@
-from django.db import models
+from datetime import timedelta
+
+from django.db import models, transaction
+from django.db.models import Case, F, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Greatest
 from django.utils import timezone
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.db.models.signals import post_save
-from django.dispatch import receiver
+from django.dispatch import Signal, receiver
 from django.conf import settings  # Import settings for AUTH_USER_MODEL
 
+from .achievements import PERFECT_FORM_ACCURACY, crossed_achievements
+from .cache import invalidate_dashboard
+
+# Sent inside UserStats.record_workouts' transaction once completed `workouts`
+# are counted, with `previous` and `stats` holding the counters before and after
+workout_completed = Signal()
+
 class UserManager(BaseUserManager):
     def create_user(self, email, username, password=None, **extra_fields):
         if not email:
@@ -30,7 +41,58 @@ class PasswordResetOTP(models.Model):
     def __str__(self):
         return f"OTP for {self.user.email}"
 
-class User(AbstractUser):
+class TrackedFieldsMixin:
+    """
+    Save only the fields that changed since the instance was loaded.
+
+    Values read from the database are remembered, and save() without
+    explicit update_fields writes just the fields that differ from them
+    (plus auto_now timestamps), or nothing at all when none do.
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def changed_fields(self):
+        """Names of the fields changed since loading, or None for unsaved instances"""
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None or self._state.adding:
+            return None
+        return [
+            field.name for field in self._meta.concrete_fields
+            if not field.primary_key and field.attname in self.__dict__
+            and (field.attname not in loaded or loaded[field.attname] != getattr(self, field.attname))
+        ]
+
+    def save(self, *args, **kwargs):
+        changed = self.changed_fields() if kwargs.get('update_fields') is None else None
+        if changed is not None:
+            if not changed:
+                return
+            kwargs['update_fields'] = changed + [
+                field.name for field in self._meta.concrete_fields
+                if getattr(field, 'auto_now', False) and field.name not in changed
+            ]
+        super().save(*args, **kwargs)
+        self._remember_loaded_values()
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        self._remember_loaded_values(
+            None if fields is None else [self._meta.get_field(name).attname for name in fields])
+
+    def _remember_loaded_values(self, attnames=None):
+        """Treat the current values of these fields (default: all loaded ones) as saved"""
+        if attnames is None:
+            attnames = [field.attname for field in self._meta.concrete_fields if field.attname in self.__dict__]
+        loaded = self.__dict__.setdefault('_loaded_values', {})
+        loaded.update((attname, getattr(self, attname)) for attname in attnames)
+
+
+class User(TrackedFieldsMixin, AbstractUser):
     email = models.EmailField(unique=True)
     daily_streak = models.IntegerField(default=0)
     last_activity = models.DateField(null=True, blank=True)
@@ -56,33 +118,38 @@ class User(AbstractUser):
         return self.email
 
     def update_streak(self):
+        """
+        Advance the daily streak for activity today. The streak is computed
+        in the UPDATE itself, so concurrent workouts cannot both read the
+        old value and count the same day twice.
+        """
         today = timezone.now().date()
-        
-        if self.last_activity is None:
-            # First activity
-            self.daily_streak = 1
-        elif self.last_activity == today:
-            # Already updated today, don't increment
-            pass
-        elif (today - self.last_activity).days == 1:
-            # Consecutive day
-            self.daily_streak += 1
-        else:
-            # Streak broken
-            self.daily_streak = 1
-        
-        self.last_activity = today
-        self.save()
+        User.objects.filter(pk=self.pk).update(daily_streak=streak_after_activity(today), last_activity=today)
+        self.refresh_from_db(fields=['daily_streak', 'last_activity'])
         return self.daily_streak
 
-class UserStats(models.Model):
+
+def streak_after_activity(today):
+    """
+    SQL expression for a user's streak once they are active on `today`
+    (which must not be before their last activity):
+    unchanged if they already were, one longer after yesterday's activity,
+    otherwise (first activity or streak broken) a new streak of 1.
+    """
+    return Case(
+        When(last_activity=today, then=F('daily_streak')),
+        When(last_activity=today - timedelta(days=1), then=F('daily_streak') + 1),
+        default=Value(1),
+    )
+
+class UserStats(TrackedFieldsMixin, models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='stats')
     total_exercises = models.IntegerField(default=0)
     total_minutes = models.IntegerField(default=0)
     highest_streak = models.IntegerField(default=0)
     calories_burned = models.FloatField(default=0)
-    weekly_workouts = models.IntegerField(default=0)  # Number of workouts this week
-    monthly_workouts = models.IntegerField(default=0)  # Number of workouts this month
+    total_reps = models.IntegerField(default=0)
+    perfect_form_reps = models.IntegerField(default=0)  # Reps of workouts with perfect form accuracy
     current_streak = models.IntegerField(default=0)    # Current active streak
     last_workout_date = models.DateField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -92,33 +159,113 @@ class UserStats(models.Model):
         return f"{self.user.username}'s stats"
 
     def update_stats(self, exercise_data):
-        """Update user stats with new exercise data"""
-        self.total_exercises += 1
-        self.total_minutes += exercise_data.get('duration', 0) // 60
-        self.calories_burned += float(exercise_data.get('calories_burned', 0))
-        self.weekly_workouts += 1
-        
-        # Update streak if enough reps
-        if exercise_data.get('reps', 0) >= 5:
-            current_streak = self.user.update_streak()
-            if current_streak > self.highest_streak:
-                self.highest_streak = current_streak
-        
-        # Update monthly progress (20 workouts = 100%)
-        self.monthly_workouts += 1
-        self.current_streak = current_streak
-        self.last_workout_date = timezone.now().date()
-        self.save()
+        """Record one completed workout; see record_workouts"""
+        return self.record_workouts([exercise_data])
+
+    def record_workouts(self, workouts):
+        """
+        Record completed workouts (dicts of reps, duration, calories_burned,
+        form_accuracy, exercise_type and optionally the `date` they were done,
+        default today) with single UPDATE statements, so concurrent
+        completions cannot lose each other's increments. Each day with a
+        workout of at least 5 reps also advances the user's daily streak,
+        which the stats copy in the same transaction. The instance (and its
+        cached user) is reloaded with the resulting values and returned,
+        with the achievements these workouts unlocked in `new_achievements`.
+        """
+        today = timezone.now().date()
+        days = [workout.get('date') or today for workout in workouts]
+        reps = [int(workout.get('reps', 0)) for workout in workouts]
+        latest = max(days)
+        updates = {
+            'total_exercises': F('total_exercises') + len(workouts),
+            'total_minutes': F('total_minutes') + sum(int(workout.get('duration', 0)) // 60 for workout in workouts),
+            'calories_burned': F('calories_burned') + sum(float(workout.get('calories_burned', 0))
+                                                          for workout in workouts),
+            'total_reps': F('total_reps') + sum(reps),
+            # Uploaded workouts may be older than the last one recorded
+            'last_workout_date': Case(When(last_workout_date__gt=latest, then=F('last_workout_date')),
+                                      default=Value(latest)),
+            'updated_at': timezone.now(),
+        }
+        perfect_form_reps = sum(count for workout, count in zip(workouts, reps)
+                                if float(workout.get('form_accuracy') or 0) >= PERFECT_FORM_ACCURACY)
+        if perfect_form_reps:
+            updates['perfect_form_reps'] = F('perfect_form_reps') + perfect_form_reps
+        active_days = sorted({day for day, count in zip(days, reps) if count >= 5})
+
+        with transaction.atomic():
+            for day in active_days:
+                # Days before the last activity cannot change the streak any more
+                (User.objects.filter(pk=self.user_id)
+                 .filter(Q(last_activity__isnull=True) | Q(last_activity__lte=day))
+                 .update(daily_streak=streak_after_activity(day), last_activity=day))
+            if active_days:
+                streak = Subquery(User.objects.filter(pk=OuterRef('user_id')).values('daily_streak')[:1])
+                updates['current_streak'] = streak
+                updates['highest_streak'] = Greatest(F('highest_streak'), streak)
+            UserStats.objects.filter(pk=self.pk).update(**updates)
+            # The row stays locked by this transaction, so this reads exactly our update
+            updated = UserStats.objects.select_related('user').get(pk=self.pk)
+            invalidate_dashboard(self.user_id)
+            responses = workout_completed.send(sender=UserStats, previous=self, stats=updated,
+                                               workouts=workouts)
+
+        # Achievements unlocked by these workouts
+        self.new_achievements = [achievement for _, unlocked in responses for achievement in unlocked or ()]
+
+        for field in self._meta.concrete_fields:
+            setattr(self, field.attname, getattr(updated, field.attname))
+        self._remember_loaded_values()
+        if UserStats.user.is_cached(self):
+            self.user.daily_streak = updated.user.daily_streak
+            self.user.last_activity = updated.user.last_activity
+            self.user._remember_loaded_values(['daily_streak', 'last_activity'])
+        else:
+            self.user = updated.user
+        return self
+
+
+
+class UserAchievement(models.Model):
+    """An achievement (see achievements.ACHIEVEMENTS) a user has unlocked"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='achievements')
+    code = models.CharField(max_length=50)
+    unlocked_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            # Also the index the achievements list is read with
+            models.UniqueConstraint(fields=['user', 'code'], name='unique_user_achievement'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}: {self.code}"
+
+    @classmethod
+    def unlock(cls, user_id, achievements):
+        """Store unlocks, keeping the original time of any already stored"""
+        cls.objects.bulk_create([cls(user_id=user_id, code=achievement.code) for achievement in achievements],
+                                ignore_conflicts=True)
 
 
+@receiver(workout_completed, sender=UserStats)
+def unlock_achievements(sender, previous, stats, **kwargs):
+    # Only rules whose counter crossed its threshold in this workout can be new
+    unlocked = crossed_achievements(previous, stats)
+    if unlocked:
+        UserAchievement.unlock(stats.user_id, unlocked)
+    return unlocked
 
 @receiver(post_save, sender=User)
-def create_user_stats(sender, instance, created, **kwargs):
-    if created:
-        # Only create UserStats if it doesn't already exist
-        UserStats.objects.get_or_create(user=instance)
+def create_user_stats(sender, instance, created, raw=False, **kwargs):
+    # A new user cannot have stats yet; fixtures bring their own
+    if created and not raw:
+        UserStats.objects.create(user=instance)
 
 @receiver(post_save, sender=User)
-def save_user_stats(sender, instance, **kwargs):
-    if hasattr(instance, 'stats'):
-        instance.stats.save()
\ No newline at end of file
+@receiver(post_save, sender=UserStats)
+def invalidate_user_dashboard(sender, instance, created, update_fields=None, **kwargs):
+    # Logins only touch last_login, which the dashboard does not show
+    if not created and update_fields != frozenset(['last_login']):
+        invalidate_dashboard(instance.pk if sender is User else instance.user_id)
@@ -1,4 +1,7 @@
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.db import transaction
 from rest_framework import serializers
+from exercises.services.rollups import workout_periods
 from .models import User, UserStats
 
 class UserSerializer(serializers.ModelSerializer):
@@ -8,8 +11,9 @@ class UserSerializer(serializers.ModelSerializer):
                  'fitness_goal', 'daily_streak')
         extra_kwargs = {
             'password': {'write_only': True},
-            'email': {'required': True},
-            'username': {'required': True},
+            # Uniqueness is checked once, by validate_email/validate_username
+            'email': {'required': True, 'validators': []},
+            'username': {'required': True, 'validators': [UnicodeUsernameValidator()]},
             'height': {'required': True},
             'weight': {'required': True},
             'fitness_goal': {'required': True}
@@ -27,16 +31,17 @@ class UserSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         try:
-            user = User.objects.create_user(
-                email=validated_data['email'],
-                username=validated_data['username'],
-                password=validated_data['password'],
-                height=validated_data.get('height'),
-                weight=validated_data.get('weight'),
-                fitness_goal=validated_data.get('fitness_goal')
-            )
-            UserStats.objects.create(user=user)
-            return user
+            # The user's stats row is created by a post_save receiver; both
+            # are committed together or not at all
+            with transaction.atomic():
+                return User.objects.create_user(
+                    email=validated_data['email'],
+                    username=validated_data['username'],
+                    password=validated_data['password'],
+                    height=validated_data.get('height'),
+                    weight=validated_data.get('weight'),
+                    fitness_goal=validated_data.get('fitness_goal')
+                )
         except Exception as e:
             raise serializers.ValidationError(str(e))
 
@@ -48,18 +53,20 @@ class UserStatsSerializer(serializers.ModelSerializer):
             'total_minutes',
             'highest_streak',
             'calories_burned',
-            'weekly_workouts',
-            'monthly_workouts',
+            'total_reps',
+            'perfect_form_reps',
             'current_streak',
             'last_workout_date'
         )
 
     def to_representation(self, instance):
-        # Refresh from database to get latest stats
-        instance.refresh_from_db()
         data = super().to_representation(instance)
         # Round floating point values
         data['calories_burned'] = round(data['calories_burned'], 2)
+        # Workouts this calendar week and month, from the daily rollups
+        periods = workout_periods(instance.user_id)
+        data['weekly_workouts'] = periods['week']['workouts']
+        data['monthly_workouts'] = periods['month']['workouts']
         return data
 
 class UserSettingsSerializer(serializers.ModelSerializer):
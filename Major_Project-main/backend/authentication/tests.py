@@ -1,3 +1,242 @@
-from django.test import TestCase
+import io
+import threading
+from datetime import timedelta
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from exercises.models import Exercise, UserExercise
+from .models import User, UserAchievement, UserStats
+
+
+def create_user(username='athlete'):
+    return User.objects.create_user(email=f'{username}@example.com', username=username, password='password')
+
+
+class UserStatsUpdateTests(TestCase):
+    def test_update_stats_increments_and_starts_streak(self):
+        user = create_user()
+        stats = user.stats.update_stats({'duration': 150, 'calories_burned': 12.5, 'reps': 10})
+
+        self.assertEqual(stats.total_exercises, 1)
+        self.assertEqual(stats.total_minutes, 2)
+        self.assertEqual(stats.calories_burned, 12.5)
+        self.assertEqual(stats.current_streak, 1)
+        self.assertEqual(stats.highest_streak, 1)
+        self.assertEqual(user.daily_streak, 1)
+        self.assertEqual(stats.last_workout_date, timezone.now().date())
+
+    def test_streak_continues_after_yesterday_and_counts_today_once(self):
+        user = create_user()
+        User.objects.filter(pk=user.pk).update(daily_streak=4, last_activity=timezone.now().date() - timedelta(days=1))
+
+        stats = UserStats.objects.get(user=user)
+        stats.update_stats({'reps': 5})
+        stats.update_stats({'reps': 5})
+
+        self.assertEqual(stats.current_streak, 5)
+        self.assertEqual(stats.highest_streak, 5)
+        self.assertEqual(stats.user.daily_streak, 5)
+
+    def test_short_workout_keeps_streak(self):
+        user = create_user()
+        User.objects.filter(pk=user.pk).update(daily_streak=3, last_activity=timezone.now().date() - timedelta(days=1))
+        UserStats.objects.filter(user=user).update(current_streak=3, highest_streak=3)
+
+        stats = UserStats.objects.get(user=user).update_stats({'reps': 2})
+
+        self.assertEqual(stats.total_exercises, 1)
+        self.assertEqual(stats.current_streak, 3)
+        self.assertEqual(stats.user.daily_streak, 3)
+
+
+class WriteAmplificationTests(TestCase):
+    """Query budgets for the endpoints that used to rewrite the stats row on every user save"""
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def authenticate(self, user):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+
+    def stats_writes(self, queries):
+        table = UserStats._meta.db_table
+        return [query['sql'] for query in queries
+                if query['sql'].startswith(('INSERT', 'UPDATE')) and table in query['sql']]
+
+    def test_register_creates_user_and_stats_once(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('register'), {
+                'email': 'new@example.com', 'username': 'new', 'password': 'password',
+                'height': 180, 'weight': 75, 'fitness_goal': 'endurance',
+            }, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(UserStats.objects.filter(user__email='new@example.com').count(), 1)
+        self.assertEqual(len(self.stats_writes(queries)), 1)
+        # 2 uniqueness checks, user and stats inserts, outstanding refresh token, savepoint pair
+        self.assertEqual(len(queries), 7)
+
+    def test_login_does_not_write_stats(self):
+        create_user()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('login'), {
+                'email': 'athlete@example.com', 'password': 'password'}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.stats_writes(queries), [])
+        # User lookup and outstanding refresh token
+        self.assertEqual(len(queries), 2)
+
+    def test_settings_update_writes_only_changed_user_fields(self):
+        user = create_user()
+        self.authenticate(user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(reverse('update_user_settings'), {'weight': 70}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.stats_writes(queries), [])
+        updates = [query['sql'] for query in queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertNotIn('password', updates[0])
+        # Authenticated user lookup and one UPDATE of the weight
+        self.assertEqual(len(queries), 2)
+
+        with self.assertNumQueries(1):
+            response = self.client.patch(reverse('update_user_settings'), {'weight': 70}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_stats_update_queries(self):
+        user = create_user()
+        self.authenticate(user)
+        # User lookup, stats lookup, savepoint pair, user and stats updates, reading the row back,
+        # unlocking the first workout achievement, this week's and month's rollups
+        with self.assertNumQueries(9):
+            response = self.client.post(reverse('update_user_stats'),
+                                        {'duration': 120, 'calories_burned': 5, 'reps': 8}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['stats']['total_exercises'], 1)
+        self.assertEqual(response.data['current_streak'], 1)
+
+
+class DashboardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+
+    def test_cached_dashboard_is_served_without_queries(self):
+        # User with stats, this month's rollups and the achievements
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('user_dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['stats']['total_exercises'], 0)
+        self.assertEqual(response.data['progress'][1]['value'], '0%')
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(reverse('user_dashboard')).data, response.data)
+
+    def test_workouts_and_settings_invalidate_the_dashboard(self):
+        self.client.get(reverse('user_dashboard'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('update_user_stats'), {'exercise_type': 'squats', 'reps': 10}, format='json')
+        response = self.client.get(reverse('user_dashboard'))
+        self.assertEqual(response.data['stats']['total_exercises'], 1)
+        self.assertEqual(response.data['progress'][1]['value'], '5%')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(reverse('update_user_settings'), {'weight': 64}, format='json')
+        self.assertEqual(self.client.get(reverse('user_dashboard')).data['settings']['weight'], 64)
+
+    def test_stats_updates_count_towards_weekly_and_monthly_workouts(self):
+        response = self.client.post(reverse('update_user_stats'), {
+            'exercise_type': 'bicep_curls', 'reps': 12, 'duration': 90, 'form_accuracy': 80,
+        }, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['stats']['total_exercises'], 1)
+        self.assertEqual(response.data['stats']['weekly_workouts'], 1)
+        self.assertEqual(response.data['stats']['monthly_workouts'], 1)
+        workout = UserExercise.objects.get(user=self.user)
+        self.assertEqual((workout.exercise.name, workout.reps, workout.duration, workout.form_accuracy),
+                         ('bicep_curls', 12, 90, 80))
+        dashboard = self.client.get(reverse('user_dashboard')).data
+        self.assertEqual(dashboard['stats']['weekly_workouts'], 1)
+        self.assertEqual(dashboard['progress'][1]['value'], '5%')
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ConcurrentUserStatsUpdateTests(TransactionTestCase):
+    def test_concurrent_updates_lose_no_increments(self):
+        user = create_user()
+        workers, rounds = 8, 5
+        barrier = threading.Barrier(workers)
+        errors = []
+
+        def complete_workouts():
+            try:
+                barrier.wait()
+                for _ in range(rounds):
+                    UserStats.objects.get(user_id=user.pk).update_stats(
+                        {'duration': 60, 'calories_burned': 1, 'reps': 10})
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=complete_workouts) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        stats = UserStats.objects.select_related('user').get(user=user)
+        self.assertEqual(stats.total_exercises, workers * rounds)
+        self.assertEqual(stats.total_minutes, workers * rounds)
+        self.assertEqual(stats.calories_burned, workers * rounds)
+        self.assertEqual(stats.user.daily_streak, 1)
+        self.assertEqual(stats.current_streak, 1)
+
+
+class AchievementTests(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+
+    def test_workouts_unlock_achievements_once(self):
+        response = self.client.post(reverse('update_user_stats'), {'reps': 60, 'form_accuracy': 95}, format='json')
+        self.assertEqual([achievement['title'] for achievement in response.data['new_achievements']],
+                         ['First Workout'])
+        first_unlock = UserAchievement.objects.get(user=self.user, code='first_workout').unlocked_at
+
+        response = self.client.post(reverse('update_user_stats'), {'reps': 50, 'form_accuracy': 92}, format='json')
+        self.assertEqual([achievement['title'] for achievement in response.data['new_achievements']],
+                         ['Perfect Form'])
+        # Imperfect reps count towards total reps only
+        stats = self.client.post(reverse('update_user_stats'), {'reps': 40, 'form_accuracy': 70},
+                                 format='json').data['stats']
+        self.assertEqual((stats['total_reps'], stats['perfect_form_reps']), (150, 110))
+        self.assertEqual(UserAchievement.objects.get(user=self.user, code='first_workout').unlocked_at, first_unlock)
+
+        with self.assertNumQueries(1):
+            achievements = self.client.get(reverse('user_achievements')).data
+        achieved = {achievement['title'] for achievement in achievements if achievement['achieved']}
+        self.assertEqual(achieved, {'First Workout', 'Perfect Form'})
+
+    def test_sync_unlocks_achievements_already_met(self):
+        UserStats.objects.filter(user=self.user).update(total_exercises=60, calories_burned=1200)
+        call_command('sync_achievements', stdout=io.StringIO())
+        call_command('sync_achievements', stdout=io.StringIO())
+        self.assertEqual(set(UserAchievement.objects.filter(user=self.user).values_list('code', flat=True)),
+                         {'first_workout', 'dedicated', 'calorie_crusher'})
@@ -12,6 +12,7 @@ urlpatterns = [
     path('settings/update/', views.update_user_settings, name='update_user_settings'),
     path('progress/', views.get_progress_stats, name='progress_stats'),
     path('achievements/', views.get_user_achievements, name='user_achievements'),
+    path('dashboard/', views.get_user_dashboard, name='user_dashboard'),
     path('logout/', views.logout_user, name='logout'),
     path('update-stats/', views.UpdateUserStatsView.as_view(), name='update_user_stats'),
     path('send-reset-otp/', views.send_reset_otp, name='send_reset_otp'),
@@ -1,15 +1,20 @@
 from django.shortcuts import render
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
 from rest_framework_simplejwt.tokens import RefreshToken, TokenError
 from django.contrib.auth import authenticate
+from django.db import IntegrityError, transaction
+from exercises.models import Exercise, UserExercise
 from .models import User, UserStats, PasswordResetOTP
 from .serializers import UserSerializer, UserStatsSerializer, UserSettingsSerializer
+from .dashboard import achievements_data, get_dashboard, progress_data
 from rest_framework.views import APIView
 from django.utils import timezone
 import random
+import uuid
 from django.core.mail import send_mail
 
 @api_view(['POST'])
@@ -189,39 +194,32 @@ def update_user_settings(request):
 def get_progress_stats(request):
     try:
         user = request.user
-        stats = UserStats.objects.get(user=user)
-        progress_data = [
-            {'name': 'Weekly Workouts', 'value': stats.weekly_workouts},
-            {'name': 'Monthly Progress', 'value': f"{stats.monthly_progress}%"},
-            {'name': 'Current Streak', 'value': user.daily_streak}
-        ]
-        return Response(progress_data)
+        return Response(progress_data(user, UserStatsSerializer(user.stats).data))
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 @api_view(['GET'])
+@authentication_classes([JWTStatelessUserAuthentication])
 @permission_classes([IsAuthenticated])
 def get_user_achievements(request):
     try:
-        user = request.user
-        achievements = [
-            {
-                'title': 'First Workout',
-                'description': 'Completed your first workout session',
-                'achieved': user.stats.total_exercises > 0
-            },
-            {
-                'title': 'Streak Master',
-                'description': 'Maintained a 7-day workout streak',
-                'achieved': user.daily_streak >= 7
-            },
-            {
-                'title': 'Calorie Crusher',
-                'description': 'Burned over 1000 calories',
-                'achieved': user.stats.calories_burned > 1000
-            }
-        ]
-        return Response(achievements)
+        return Response(achievements_data(request.user.id))
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+@api_view(['GET'])
+@authentication_classes([JWTStatelessUserAuthentication])
+@permission_classes([IsAuthenticated])
+def get_user_dashboard(request):
+    """
+    Stats, progress, achievements and settings in one response, served from
+    the per-user cache. The token is verified without loading the user, so
+    a cache hit does not touch the database.
+    """
+    try:
+        return Response(get_dashboard(request.user.id))
+    except User.DoesNotExist:
+        return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -231,23 +229,58 @@ class UpdateUserStatsView(APIView):
     def post(self, request):
         try:
             user = request.user
-            stats = UserStats.objects.get(user=user)
-            
-            # Update stats using the helper method
-            stats.update_stats(request.data)
-            
-            # Get fresh stats
-            updated_stats = UserStats.objects.get(user=user)
-            serializer = UserStatsSerializer(updated_stats)
+            stats = user.stats
+            exercise_type = request.data.get('exercise_type')
+            exercise = Exercise.objects.filter(name=exercise_type).order_by('id').first() if exercise_type else None
+            # The id the WebSocket gave a live session, which it records itself
+            # when the session ends; the workout must only be counted once
+            client_session_id = request.data.get('client_session_id')
+            client_session_id = uuid.UUID(str(client_session_id)) if client_session_id else None
+
+            # Update stats using the helper method; it reloads the updated row
+            if exercise is None:
+                stats.update_stats(request.data)
+            elif client_session_id is not None and UserExercise.objects.filter(
+                    user=user, client_session_id=client_session_id).exists():
+                stats = self.recorded_stats(stats)
+            else:
+                # Workouts of known exercises also go into the history, whose
+                # daily rollups the weekly and monthly figures come from
+                form_accuracy = request.data.get('form_accuracy')
+                try:
+                    with transaction.atomic():
+                        UserExercise.objects.create(
+                            user=user,
+                            exercise=exercise,
+                            client_session_id=client_session_id,
+                            reps=int(request.data.get('reps', 0)),
+                            duration=int(request.data.get('duration', 0)),
+                            form_accuracy=float(form_accuracy) if form_accuracy is not None else None,
+                        )
+                        stats.update_stats(request.data)
+                except IntegrityError:
+                    # The live session was recorded concurrently
+                    stats = self.recorded_stats(stats)
+            serializer = UserStatsSerializer(stats)
             
             return Response({
                 'message': 'Stats updated successfully',
                 'stats': serializer.data,
-                'current_streak': user.daily_streak
+                'current_streak': stats.user.daily_streak,
+                'new_achievements': [
+                    {'title': achievement.title, 'description': achievement.description}
+                    for achievement in stats.new_achievements
+                ]
             })
             
         except Exception as e:
             print(f"Error updating stats: {str(e)}")
             return Response({
                 'error': str(e)
-            }, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+    def recorded_stats(self, stats):
+        """The current stats, for a workout that was already counted"""
+        stats = UserStats.objects.select_related('user').get(pk=stats.pk)
+        stats.new_achievements = []
+        return stats
\ No newline at end of file
@@ -1,13 +1,20 @@
 import os
 from django.core.asgi import get_asgi_application
+from django.urls import re_path
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
-from exercises import routing
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
+# Set up Django before importing consumers, which use the ORM
+django_asgi_app = get_asgi_application()
+
+from exercises import routing
+
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
+    "http": URLRouter(
+        routing.http_urlpatterns + [re_path(r'', django_asgi_app)]
+    ),
     "websocket": AuthMiddlewareStack(
         URLRouter(
             routing.websocket_urlpatterns
@@ -125,6 +125,93 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Cache shared by all workers (per-user dashboards); set REDIS_URL in production,
+# the local-memory fallback is only coherent with a single worker process
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+DASHBOARD_CACHE_TTL = int(os.getenv('DASHBOARD_CACHE_TTL', 3600))  # seconds
+
+# Leaderboards are sorted sets in Redis ('redis'), or in each process's memory ('memory',
+# for tests and single-process development)
+LEADERBOARD_REDIS_URL = os.getenv('LEADERBOARD_REDIS_URL', os.getenv('REDIS_URL'))
+LEADERBOARD_BACKEND = os.getenv('LEADERBOARD_BACKEND', 'redis' if LEADERBOARD_REDIS_URL else 'memory')
+
+# Workouts per page of the exercise history (clients may ask for up to 200 with ?page_size=)
+EXERCISE_HISTORY_PAGE_SIZE = int(os.getenv('EXERCISE_HISTORY_PAGE_SIZE', 50))
+# Most workout sessions accepted by one upload to /api/exercises/sessions/
+SESSION_UPLOAD_MAX_SESSIONS = int(os.getenv('SESSION_UPLOAD_MAX_SESSIONS', 500))
+# Live WebSocket sessions are checkpointed every LIVE_SESSION_CHECKPOINT_INTERVAL seconds and
+# recorded when they end, through a write-behind buffer of at most LIVE_SESSION_BUFFER_SIZE records
+# written in batches of LIVE_SESSION_FLUSH_BATCH every LIVE_SESSION_FLUSH_INTERVAL seconds
+LIVE_SESSION_CHECKPOINT_INTERVAL = float(os.getenv('LIVE_SESSION_CHECKPOINT_INTERVAL', 15))
+LIVE_SESSION_BUFFER_SIZE = int(os.getenv('LIVE_SESSION_BUFFER_SIZE', 1000))
+LIVE_SESSION_FLUSH_BATCH = int(os.getenv('LIVE_SESSION_FLUSH_BATCH', 200))
+LIVE_SESSION_FLUSH_INTERVAL = float(os.getenv('LIVE_SESSION_FLUSH_INTERVAL', 5))
+# Progress charts: points per exercise series by default and at most, and how long a chart is cached
+ANALYTICS_DEFAULT_POINTS = int(os.getenv('ANALYTICS_DEFAULT_POINTS', 60))
+ANALYTICS_MAX_POINTS = int(os.getenv('ANALYTICS_MAX_POINTS', 500))
+ANALYTICS_CACHE_TTL = int(os.getenv('ANALYTICS_CACHE_TTL', 3600))  # seconds
+
+# Exercise analysis
+# Uploads are hashed as they arrive so identical videos are stored once
+FILE_UPLOAD_HANDLERS = [
+    'exercises.upload_handlers.HashingMemoryFileUploadHandler',
+    'exercises.upload_handlers.HashingTemporaryFileUploadHandler',
+]
+# Warm analyzers kept per worker for the single-frame REST endpoints
+ANALYZER_CACHE_TTL = int(os.getenv('ANALYZER_CACHE_TTL', 300))  # seconds
+ANALYZER_CACHE_MAX_SIZE = int(os.getenv('ANALYZER_CACHE_MAX_SIZE', 8))
+# Upper bound on frames accepted by the batched analysis endpoint
+# (Django rejects multipart requests with more than 100 files by default)
+ANALYSIS_BATCH_MAX_FRAMES = int(os.getenv('ANALYSIS_BATCH_MAX_FRAMES', 100))
+# Offline video analysis samples frames at this rate (0 = every frame) and
+# analyzes every frame for a short window after each stage transition
+VIDEO_ANALYSIS_TARGET_FPS = float(os.getenv('VIDEO_ANALYSIS_TARGET_FPS', 15))
+VIDEO_ANALYSIS_DENSE_FRAMES = int(os.getenv('VIDEO_ANALYSIS_DENSE_FRAMES', 10))
+# Processes used to extract poses from one uploaded video (1 = sequential). Frames densified
+# around stage transitions are detected while the extracted poses are replayed in order
+VIDEO_ANALYSIS_WORKERS = int(os.getenv('VIDEO_ANALYSIS_WORKERS', os.cpu_count() or 1))
+VIDEO_ANALYSIS_CHUNK_FRAMES = int(os.getenv('VIDEO_ANALYSIS_CHUNK_FRAMES', 300))
+VIDEO_ANALYSIS_CHUNK_OVERLAP = int(os.getenv('VIDEO_ANALYSIS_CHUNK_OVERLAP', 15))  # pose tracker warm-up frames
+# Per-video pose landmarks, reused when the same video is analyzed again
+LANDMARK_CACHE_ENABLED = os.getenv('LANDMARK_CACHE_ENABLED', 'True') == 'True'
+LANDMARK_CACHE_DIR = os.getenv('LANDMARK_CACHE_DIR', os.path.join(BASE_DIR, 'landmark_cache'))
+# Form model use: 'always' on every frame with a pose, 'cascade' only where
+# an angle is within FORM_MODEL_CASCADE_MARGIN degrees of a rule threshold or
+# the rep stage changes, 'off' to judge form by the rules alone. Live frames
+# (WebSocket and the frame endpoints) use LIVE_FORM_MODEL_MODE, set it to 'off'
+# to keep model inference out of per-frame latency.
+FORM_MODEL_MODE = os.getenv('FORM_MODEL_MODE', 'cascade')
+LIVE_FORM_MODEL_MODE = os.getenv('LIVE_FORM_MODEL_MODE', 'cascade')
+FORM_MODEL_CASCADE_MARGIN = float(os.getenv('FORM_MODEL_CASCADE_MARGIN', 10))  # degrees
+# Form model outputs memoized per worker by quantized, body-normalized pose.
+# Every Nth hit is checked against the model; the cache turns itself off when
+# the mean absolute error of the last 100 checks exceeds the maximum.
+FORM_PREDICTION_CACHE_ENABLED = os.getenv('FORM_PREDICTION_CACHE_ENABLED', 'True') == 'True'
+FORM_PREDICTION_CACHE_SIZE = int(os.getenv('FORM_PREDICTION_CACHE_SIZE', 10000))  # entries per model
+FORM_PREDICTION_CACHE_GRID = float(os.getenv('FORM_PREDICTION_CACHE_GRID', 0.1))  # bucket width
+FORM_PREDICTION_CACHE_SAMPLE_EVERY = int(os.getenv('FORM_PREDICTION_CACHE_SAMPLE_EVERY', 20))
+FORM_PREDICTION_CACHE_MAX_ERROR = float(os.getenv('FORM_PREDICTION_CACHE_MAX_ERROR', 0.05))
+# Streaming uploads (api/exercises/stream/<type>/) are decoded by ffmpeg to this size
+STREAM_ANALYSIS_FRAME_WIDTH = int(os.getenv('STREAM_ANALYSIS_FRAME_WIDTH', 640))
+STREAM_ANALYSIS_FRAME_HEIGHT = int(os.getenv('STREAM_ANALYSIS_FRAME_HEIGHT', 480))
+STREAM_UPLOAD_MAX_BYTES = int(os.getenv('STREAM_UPLOAD_MAX_BYTES', 500 * 1024 * 1024))
+# Background video analysis queue (python manage.py run_analysis_worker)
+ANALYSIS_JOB_POLL_INTERVAL = float(os.getenv('ANALYSIS_JOB_POLL_INTERVAL', 2))  # seconds
+ANALYSIS_JOB_STALE_AFTER = int(os.getenv('ANALYSIS_JOB_STALE_AFTER', 300))  # seconds without heartbeat
+ANALYSIS_JOB_MAX_ATTEMPTS = int(os.getenv('ANALYSIS_JOB_MAX_ATTEMPTS', 3))
+
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Exercise, UserExercise
+from .models import Exercise, UserExercise, AnalysisJob, LiveSession, VideoBlob
 
 @admin.register(Exercise)
 class ExerciseAdmin(admin.ModelAdmin):
@@ -12,3 +12,23 @@ class UserExerciseAdmin(admin.ModelAdmin):
     list_display = ('user', 'exercise', 'form_accuracy', 'created_at')
     list_filter = ('exercise', 'created_at')
     search_fields = ('user__username', 'feedback')
+
+
+@admin.register(AnalysisJob)
+class AnalysisJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'user_exercise', 'status', 'progress', 'worker', 'created_at', 'finished_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('user__username', 'worker', 'error')
+
+
+@admin.register(VideoBlob)
+class VideoBlobAdmin(admin.ModelAdmin):
+    list_display = ('sha256', 'size', 'ref_count', 'created_at')
+    search_fields = ('sha256',)
+
+
+@admin.register(LiveSession)
+class LiveSessionAdmin(admin.ModelAdmin):
+    list_display = ('user', 'exercise', 'reps', 'duration', 'form_accuracy', 'completed', 'updated_at')
+    list_filter = ('completed', 'exercise')
+    search_fields = ('user__username',)
@@ -0,0 +1,28 @@
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+def analytics_generation_key(user_id):
+    return f'analytics:{user_id}:generation'
+
+
+def analytics_generation(user_id):
+    """
+    Token that changes whenever the user's workouts do. It is part of every
+    cached chart's key, so replacing it makes all older charts unreachable.
+    """
+    key = analytics_generation_key(user_id)
+    generation = cache.get(key)
+    if generation is None:
+        generation = time.time_ns()
+        if not cache.add(key, generation, None):
+            generation = cache.get(key, generation)
+    return generation
+
+
+def invalidate_analytics(user_id):
+    """Retire a user's cached charts once the current transaction commits"""
+    key = analytics_generation_key(user_id)
+    transaction.on_commit(lambda: cache.set(key, time.time_ns(), None))
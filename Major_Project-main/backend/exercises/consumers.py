@@ -1,13 +1,29 @@
+import asyncio
 import json
-import base64
-import numpy as np
-import cv2
-import mediapipe as mp
+import os
+import uuid
+from urllib.parse import parse_qs
+from asgiref.sync import sync_to_async
+from channels.db import database_sync_to_async
+from channels.exceptions import StopConsumer
+from channels.generic.http import AsyncHttpConsumer
 from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
+from django.core.files import File
+from django.urls import reverse
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from .models import AnalysisJob, Exercise, UserExercise
+from .serializers import AnalysisJobSerializer, UserExerciseSerializer
+from .services.analysis_jobs import enqueue_analysis
 from .services.exercise_analysis import ExerciseAnalyzer
+from .services.frame_pipeline import FramePipeline
+from .services.live_sessions import LiveSessionTracker, get_live_session_buffer, persist_live_sessions
+from .services.stream_analysis import StreamingVideoAnalysis
+from .services.video_store import store_video
 from channels.auth import AuthMiddlewareStack
 import time
-from asyncio import Lock
 
 class ExerciseAnalysisConsumer(AsyncWebsocketConsumer):
     def __init__(self, *args, **kwargs):
@@ -15,21 +31,40 @@ class ExerciseAnalysisConsumer(AsyncWebsocketConsumer):
         self.last_process_time = 0
         self.PROCESS_FPS = 15
         self.process_interval = 1.0 / self.PROCESS_FPS
-        self.lock = Lock()
         self.counter = 0
         self.stage = None
         self.start_time = None
         self.duration = 0
         self.correct_form_count = 0
         self.total_frames = 0
+        self.frame_timestamp = None
+        self.live_session = None
 
     async def connect(self):
-        """Initialize connection and ExerciseAnalyzer"""
+        """Initialize connection, ExerciseAnalyzer and the session's frame pipeline"""
         self.exercise_type = self.scope['url_route']['kwargs']['exercise_type']
         
         try:
-            self.analyzer = ExerciseAnalyzer(self.exercise_type)
+            self.analyzer = ExerciseAnalyzer(self.exercise_type, model_mode=settings.LIVE_FORM_MODEL_MODE)
+            # Sessions of signed-in users are checkpointed and recorded as workouts
+            user = await self.authenticate()
+            self.live_session = (LiveSessionTracker(user.pk, self.exercise_type, uuid.uuid4())
+                                 if user is not None and self.exercise_type in dict(Exercise.EXERCISE_TYPES) else None)
+            loop = asyncio.get_running_loop()
+
+            # Responses are produced on the pipeline's encode thread
+            def send(response):
+                self.track_frame(response['metrics'])
+                asyncio.run_coroutine_threadsafe(self.send(text_data=json.dumps(response)), loop)
+
+            self.pipeline = FramePipeline(self.analyzer, send)
             await self.accept()
+            if self.live_session is not None:
+                # The client passes it to update-stats, which then does not count the session again
+                await self.send(text_data=json.dumps({
+                    'type': 'session_started',
+                    'client_session_id': str(self.live_session.client_session_id)
+                }))
             print(f"WebSocket connected for {self.exercise_type}")
         except Exception as e:
             print(f"Error initializing analyzer: {str(e)}")
@@ -38,51 +73,71 @@ class ExerciseAnalysisConsumer(AsyncWebsocketConsumer):
     async def disconnect(self, close_code):
         """Handle disconnection"""
         self.is_analyzing = False
+        if hasattr(self, 'pipeline'):
+            self.pipeline.close()
+            # Let the frames in flight finish so the summary includes them
+            await asyncio.to_thread(self.pipeline.join, 5)
+            await self.save_session()
         if hasattr(self, 'analyzer'):
-            # Clean up analyzer resources if needed
+            # The pipeline has stopped using it, so its MediaPipe graph can go
+            self.analyzer.close()
             del self.analyzer
 
     async def receive(self, text_data):
-        """Handle incoming frames"""
+        """Hand incoming frames to the pipeline"""
         current_time = time.time()
         if current_time - self.last_process_time < self.process_interval:
             return  # Skip processing if too soon
 
         try:
-            async with self.lock:
-                data = json.loads(text_data)
-                if data.get('type') == 'frame':
-                    # Decode base64 image
-                    frame_data = data['frame'].split(',')[1]
-                    frame_bytes = base64.b64decode(frame_data)
-                    np_arr = np.frombuffer(frame_bytes, np.uint8)
-                    frame = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-                    
-                    if frame is None:
-                        return
-                    
-                    # Process frame and get metrics
-                    processed_frame, metrics = self.analyzer.process_frame(frame)
-                    
-                    # Debug print
-                   #print(f"Frame processed - Counter: {metrics['counter']}, Stage: {metrics['stage']}")
-                    
-                    # Encode processed frame
-                    _, buffer = cv2.imencode('.jpg', processed_frame, [cv2.IMWRITE_JPEG_QUALITY, 80])
-                    processed_frame_base64 = base64.b64encode(buffer).decode('utf-8')
-                    
-                    self.last_process_time = current_time
-                    
-                    # Send back processed frame and metrics
-                    await self.send(text_data=json.dumps({
-                        'type': 'frame_processed',
-                        'frame': f'data:image/jpeg;base64,{processed_frame_base64}',
-                        'metrics': metrics
-                    }))
+            data = json.loads(text_data)
+            if data.get('type') == 'frame':
+                # Timers run on the client's capture clock (ms) when it is sent
+                if data.get('timestamp') is not None:
+                    self.frame_timestamp = float(data['timestamp']) / 1000
+                else:
+                    self.frame_timestamp = current_time
+
+                self.last_process_time = current_time
+                # Decoding, analysis and the response happen on the pipeline's threads
+                self.pipeline.submit(data, self.frame_timestamp)
                     
         except Exception as e:
             print(f"Error processing frame: {str(e)}")
 
+    @database_sync_to_async
+    def authenticate(self):
+        """The session's user, or the one whose JWT access token is passed as ?token="""
+        user = self.scope.get('user')
+        if user is not None and user.is_authenticated:
+            return user
+        token = parse_qs(self.scope.get('query_string', b'').decode()).get('token')
+        if not token:
+            return None
+        auth = JWTAuthentication()
+        try:
+            return auth.get_user(auth.get_validated_token(token[0]))
+        except (InvalidToken, AuthenticationFailed):
+            return None
+
+    def track_frame(self, metrics):
+        """Count an analyzed frame towards the session, checkpointing it periodically"""
+        if self.live_session is not None and self.live_session.add_frame(metrics):
+            # Only the latest checkpoint of a session matters, so it may be coalesced or dropped
+            get_live_session_buffer().put(self.live_session.client_session_id, self.live_session.record(), droppable=True)
+
+    async def save_session(self):
+        """Hand the session's summary to the write-behind buffer and have it written promptly"""
+        if self.live_session is None or not self.live_session.pose_frames:
+            return
+        record = self.live_session.record(completed=True)
+        buffer = get_live_session_buffer()
+        if buffer.put(self.live_session.client_session_id, record):
+            buffer.flush_soon()
+        else:
+            # The buffer is full of summaries; write this one directly rather than lose it
+            await database_sync_to_async(persist_live_sessions)([record])
+
     async def handle_start_exercise(self):
         """Handle exercise start"""
         self.is_analyzing = True
@@ -97,198 +152,12 @@ class ExerciseAnalysisConsumer(AsyncWebsocketConsumer):
         await self.send(text_data=json.dumps({
             'type': 'exercise_completed',
             'metrics': {
-                'total_reps': self.counter,
-                'form_accuracy': self.analyze_exercise(self.pose.PoseLandmark),
-                'feedback': self.analyze_exercise(self.pose.PoseLandmark)
+                'total_reps': self.analyzer.counter,
+                'stage': self.analyzer.stage,
+                'feedback': self.analyzer.form_feedback
             }
         }))
 
-    def analyze_exercise(self, landmarks):
-        """Analyze exercise form based on exercise type"""
-        if self.exercise_type == 'bicep_curls':
-            return self._analyze_bicep_curl(landmarks)
-        elif self.exercise_type == 'squats':
-            return self._analyze_squat(landmarks)
-        elif self.exercise_type == 'pushups':
-            return self._analyze_pushup(landmarks)
-        elif self.exercise_type == 'planks':
-            return self._analyze_plank(landmarks)
-        elif self.exercise_type == 'lunges':
-            return self._analyze_lunge(landmarks)
-        
-        return {'error': 'Unknown exercise type'}
-
-    def _analyze_bicep_curl(self, landmarks):
-        """Analyze bicep curl form"""
-        shoulder = landmarks[self.mp_pose.PoseLandmark.LEFT_SHOULDER.value]
-        elbow = landmarks[self.mp_pose.PoseLandmark.LEFT_ELBOW.value]
-        wrist = landmarks[self.mp_pose.PoseLandmark.LEFT_WRIST.value]
-        
-        angle = self.calculate_angle(shoulder, elbow, wrist)
-        
-        # Extract keypoints for model
-        keypoints = self.extract_keypoints(landmarks)
-        prediction = self.model.predict(keypoints, verbose=0)[0][0]
-        print(f"Raw prediction: {prediction}")
-        form_accuracy = float(prediction * 100)
-        
-        if angle > 160 and self.stage != "down":
-            self.stage = "down"
-            self.correct_form = prediction > 0.7
-        elif angle < 30 and self.stage == 'down':
-            self.stage = "up"
-            self.counter += 1
-            self.correct_form = prediction > 0.7
-
-        return {
-            'reps': self.counter,
-            'stage': self.stage,
-            'angle': int(angle),
-            'form_accuracy': form_accuracy,
-            'feedback': self._get_feedback(angle, prediction)
-        }
-
-    def _analyze_squat(self, landmarks):
-        """Analyze squat form"""
-        hip = landmarks[self.mp_pose.PoseLandmark.LEFT_HIP.value]
-        knee = landmarks[self.mp_pose.PoseLandmark.LEFT_KNEE.value]
-        ankle = landmarks[self.mp_pose.PoseLandmark.LEFT_ANKLE.value]
-        
-        angle = self.calculate_angle(hip, knee, ankle)
-        keypoints = self.extract_keypoints(landmarks)
-        prediction = self.model.predict(keypoints, verbose=0)[0][0]
-        form_accuracy = float(prediction * 100)
-        
-        if angle < 100 and self.stage != "down":
-            self.stage = "down"
-            self.correct_form = prediction > 0.7
-        elif angle > 160 and self.stage == 'down':
-            self.stage = "up"
-            self.counter += 1
-            self.correct_form = prediction > 0.7
-
-        return {
-            'reps': self.counter,
-            'stage': self.stage,
-            'angle': int(angle),
-            'form_accuracy': form_accuracy,
-            'feedback': self._get_feedback(angle, prediction)
-        }
-
-    def _analyze_plank(self, landmarks):
-        """Analyze plank form"""
-        # Extract relevant landmarks for plank
-        shoulder = landmarks[self.mp_pose.PoseLandmark.LEFT_SHOULDER.value]
-        hip = landmarks[self.mp_pose.PoseLandmark.LEFT_HIP.value]
-        ankle = landmarks[self.mp_pose.PoseLandmark.LEFT_ANKLE.value]
-        
-        # Calculate body alignment angle
-        angle = self.calculate_angle(shoulder, hip, ankle)
-        keypoints = self.extract_keypoints(landmarks)
-        prediction = self.model.predict(keypoints, verbose=0)[0][0]
-        form_accuracy = float(prediction * 100)
-        
-        # Update duration for plank
-        if self.start_time is None:
-            self.start_time = time.time()
-        self.duration = time.time() - self.start_time
-        
-        return {
-            'duration': self.duration,
-            'angle': int(angle),
-            'form_accuracy': form_accuracy,
-            'feedback': self._get_feedback(angle, prediction)
-        }
-
-    def _analyze_pushup(self, landmarks):
-        """Analyze pushup form"""
-        shoulder = landmarks[self.mp_pose.PoseLandmark.LEFT_SHOULDER.value]
-        elbow = landmarks[self.mp_pose.PoseLandmark.LEFT_ELBOW.value]
-        wrist = landmarks[self.mp_pose.PoseLandmark.LEFT_WRIST.value]
-        
-        angle = self.calculate_angle(shoulder, elbow, wrist)
-        keypoints = self.extract_keypoints(landmarks)
-        prediction = self.model.predict(keypoints, verbose=0)[0][0]
-        form_accuracy = float(prediction * 100)
-        
-        if angle > 160 and self.stage != "down":
-            self.stage = "down"
-            self.correct_form = prediction > 0.7
-        elif angle < 90 and self.stage == 'down':
-            self.stage = "up"
-            self.counter += 1
-            self.correct_form = prediction > 0.7
-
-        return {
-            'reps': self.counter,
-            'stage': self.stage,
-            'angle': int(angle),
-            'form_accuracy': form_accuracy,
-            'feedback': self._get_feedback(angle, prediction)
-        }
-
-    def _analyze_lunge(self, landmarks):
-        """Analyze lunge form"""
-        hip = landmarks[self.mp_pose.PoseLandmark.LEFT_HIP.value]
-        knee = landmarks[self.mp_pose.PoseLandmark.LEFT_KNEE.value]
-        ankle = landmarks[self.mp_pose.PoseLandmark.LEFT_ANKLE.value]
-        
-        angle = self.calculate_angle(hip, knee, ankle)
-        keypoints = self.extract_keypoints(landmarks)
-        prediction = self.model.predict(keypoints, verbose=0)[0][0]
-        form_accuracy = float(prediction * 100)
-        
-        if angle > 160:
-            self.stage = "up"
-        elif angle < 90 and self.stage == 'up':
-            self.stage = "down"
-            self.counter += 1
-            self.correct_form = prediction > 0.7
-
-        return {
-            'reps': self.counter,
-            'stage': self.stage,
-            'angle': int(angle),
-            'form_accuracy': form_accuracy,
-            'feedback': self._get_feedback(angle, prediction)
-        }
-
-    def _get_feedback(self, angle, prediction):
-        """Get exercise-specific feedback"""
-        if prediction < 0.7:
-            return "Incorrect form detected, please check your posture"
-        if self.exercise_type == 'bicep_curls':
-            if angle > 30 and angle < 160:
-                return "Complete the full range of motion"
-        elif self.exercise_type == 'squats':
-            if angle > 100:
-                return "Squat deeper for full range of motion"
-        elif self.exercise_type == 'pushups':
-            if angle > 90:
-                return "Lower your body more"
-        elif self.exercise_type == 'planks':
-            if angle < 160:
-                return "Keep your body straight"
-        elif self.exercise_type == 'lunges':
-            if angle > 90:
-                return "Lower your back knee more"
-        return "Good form!"
-
-    def calculate_angle(self, shoulder, elbow, wrist):
-        """Calculate angle between three points"""
-        a = np.array([shoulder.x, shoulder.y])
-        b = np.array([elbow.x, elbow.y])
-        c = np.array([wrist.x, wrist.y])
-
-        radians = np.arctan2(c[1]-b[1], c[0]-b[0]) - \
-                 np.arctan2(a[1]-b[1], a[0]-b[0])
-        angle = np.abs(radians*180.0/np.pi)
-
-        if angle > 180.0:
-            angle = 360-angle
-
-        return angle
-
     async def send_feedback(self, feedback):
         """Send real-time feedback to client"""
         await self.send(text_data=json.dumps({
@@ -296,52 +165,149 @@ class ExerciseAnalysisConsumer(AsyncWebsocketConsumer):
             'message': feedback
         }))
 
-class ExerciseConsumer(AsyncWebsocketConsumer):
-    async def connect(self):
-        """Initialize connection and MediaPipe"""
-        self.exercise_type = self.scope['url_route']['kwargs']['exercise_type']
-        self.mp_pose = mp.solutions.pose
-        self.pose = self.mp_pose.Pose(
-            min_detection_confidence=0.5,
-            min_tracking_confidence=0.5
-        )
-        self.mp_drawing = mp.solutions.drawing_utils
-        self.counter = 0
-        self.stage = None
-        await self.accept()
+class VideoStreamConsumer(AsyncHttpConsumer):
+    """
+    POST a recording as the raw request body to have it analyzed while it
+    uploads. Django's ASGI handler buffers a whole request body before the
+    view runs, so this endpoint is served by Channels directly and feeds
+    each body chunk to a StreamingVideoAnalysis as it arrives.
+    """
+
+    CONTENT_TYPE_EXTENSIONS = {
+        'video/webm': '.webm',
+        'video/mp4': '.mp4',
+        'video/quicktime': '.mov',
+    }
+
+    async def http_request(self, message):
+        if not hasattr(self, 'analysis'):
+            if not await self.start_analysis():
+                raise StopConsumer()
+
+        chunk = message.get('body', b'')
+        if chunk:
+            if self.analysis.bytes_received + len(chunk) > settings.STREAM_UPLOAD_MAX_BYTES:
+                await self.send_json(413, {'error': 'Video is too large'})
+                await self.disconnect()
+                raise StopConsumer()
+            await sync_to_async(self.analysis.feed, thread_sensitive=False)(chunk)
+
+        if not message.get('more_body'):
+            try:
+                await self.complete_analysis()
+            finally:
+                await self.disconnect()
+            raise StopConsumer()
+
+    async def disconnect(self):
+        analysis = getattr(self, 'analysis', None)
+        if analysis is not None and not getattr(self, 'completed', False):
+            await sync_to_async(analysis.abort, thread_sensitive=False)()
+        if analysis is not None and os.path.exists(analysis.spool.name):
+            os.unlink(analysis.spool.name)
+
+    async def start_analysis(self):
+        if self.scope['method'] != 'POST':
+            await self.send_json(405, {'error': 'Method not allowed'})
+            return False
+
+        self.user = await self.authenticate()
+        if self.user is None:
+            await self.send_json(401, {'error': 'Authentication credentials were not provided'})
+            return False
 
-    async def disconnect(self, close_code):
-        pass
-
-    async def receive(self, text_data):
+        self.exercise_type = self.scope['url_route']['kwargs']['exercise_type']
+        self.exercise = await database_sync_to_async(
+            Exercise.objects.filter(name=self.exercise_type).first)()
+        if self.exercise is None:
+            await self.send_json(404, {'error': 'Exercise type not found'})
+            return False
+
+        self.analysis = StreamingVideoAnalysis(self.exercise_type)
+        await sync_to_async(self.analysis.start, thread_sensitive=False)()
+        return True
+
+    async def complete_analysis(self):
+        if not self.analysis.bytes_received:
+            await self.send_json(400, {'error': 'No video data provided'})
+            return
         try:
-            # Decode base64 image
-            frame_data = json.loads(text_data)
-            frame_bytes = base64.b64decode(frame_data['frame'].split(',')[1])
-            np_arr = np.frombuffer(frame_bytes, np.uint8)
-            frame = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-
-            # Process frame with MediaPipe
-            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            results = self.pose.process(frame_rgb)
-
-            if results.pose_landmarks:
-                # Draw pose landmarks
-                self.mp_drawing.draw_landmarks(
-                    frame, results.pose_landmarks, self.mp_pose.POSE_CONNECTIONS)
-
-                # Calculate bicep curl metrics
-                metrics = self.analyze_bicep_curl(results.pose_landmarks.landmark, frame)
+            results = await sync_to_async(self.analysis.finish, thread_sensitive=False)()
+        except Exception as e:
+            await self.send_json(400, {'error': str(e)})
+            return
+        self.completed = True
+        if results is None:
+            # The upload could not be analyzed as a stream; a worker analyzes the saved file
+            user_exercise, job = await self.queue_exercise()
+            await self.send_json(200 if job.status == AnalysisJob.STATUS_SUCCEEDED else 202, {
+                'exercise_id': user_exercise.id,
+                'job': AnalysisJobSerializer(job).data,
+                'status_url': self.absolute_url(reverse('analysis-job-status', args=[job.id])),
+                'streamed': False,
+                'stream_error': self.analysis.error,
+            })
+            return
+        user_exercise = await self.save_exercise(results)
+        await self.send_json(201, {
+            'exercise': UserExerciseSerializer(user_exercise).data,
+            'results': results,
+        })
+
+    @database_sync_to_async
+    def authenticate(self):
+        headers = dict(self.scope['headers'])
+        header = headers.get(b'authorization')
+        if not header:
+            return None
+        auth = JWTAuthentication()
+        try:
+            raw_token = auth.get_raw_token(header)
+            if raw_token is None:
+                return None
+            return auth.get_user(auth.get_validated_token(raw_token))
+        except (InvalidToken, AuthenticationFailed):
+            return None
+
+    def store_recording(self):
+        content_type = dict(self.scope['headers']).get(b'content-type', b'').decode().split(';')[0]
+        extension = self.CONTENT_TYPE_EXTENSIONS.get(content_type, '.mp4')
+        with open(self.analysis.spool.name, 'rb') as video:
+            return store_video(File(video, name=f'{self.exercise_type}{extension}'),
+                               sha256=self.analysis.sha256.hexdigest())
+
+    @database_sync_to_async
+    def save_exercise(self, results):
+        blob = self.store_recording()
+        return UserExercise.objects.create(
+            user=self.user,
+            exercise=self.exercise,
+            video_blob=blob,
+            video_recording=blob.file.name,
+            reps=results['reps'],
+            duration=round(results['duration']),
+            form_accuracy=results['form_accuracy'],
+            feedback="\n".join(results['feedback']),
+        )
 
-                # Encode processed frame
-                _, buffer = cv2.imencode('.jpg', frame)
-                processed_frame = base64.b64encode(buffer).decode('utf-8')
+    @database_sync_to_async
+    def queue_exercise(self):
+        """Save the recording as a new exercise and queue it for background analysis"""
+        blob = self.store_recording()
+        user_exercise = UserExercise.objects.create(
+            user=self.user,
+            exercise=self.exercise,
+            video_blob=blob,
+            video_recording=blob.file.name,
+        )
+        return user_exercise, enqueue_analysis(user_exercise)
 
-                # Send back processed frame and metrics
-                await self.send(text_data=json.dumps({
-                    'frame': f'data:image/jpeg;base64,{processed_frame}',
-                    'metrics': metrics
-                }))
+    def absolute_url(self, path):
+        host = dict(self.scope['headers']).get(b'host')
+        if host is None:
+            return path
+        return f"{self.scope.get('scheme', 'http')}://{host.decode()}{path}"
 
-        except Exception as e:
-            print(f"Error processing frame: {str(e)}")
+    async def send_json(self, status, content):
+        await self.send_response(status, json.dumps(content).encode(),
+                                 headers=[(b'Content-Type', b'application/json')])
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from exercises.services.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-user daily workout rollups from the recorded exercise history"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users',
+                            help='Only rebuild this user id (repeatable; default: every user)')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Rollup rows per INSERT')
+
+    def handle(self, *args, **options):
+        written = rebuild_rollups(options['users'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} daily rollup rows'))
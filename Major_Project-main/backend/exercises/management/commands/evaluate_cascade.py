@@ -0,0 +1,106 @@
+import contextlib
+import io
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from exercises.services.exercise_analysis import ExerciseAnalyzer
+from exercises.services.exercise_rules import EXERCISES
+from exercises.services.landmark_cache import file_sha256, load_landmarks
+from exercises.services.prediction_cache import PredictionCache
+from exercises.services.video_analysis import _iter_stored_landmarks, analyze_video
+
+
+class Command(BaseCommand):
+    help = ("Replay recorded landmark series with the form model on every frame and with the "
+            "rule-first cascade, and report model calls avoided and how often the verdicts agree")
+
+    def add_arguments(self, parser):
+        parser.add_argument('recordings', nargs='+',
+                            help='Exercise videos, or .npz landmark series (indices, timestamps, '
+                                 'landmarks, detected and optionally per-frame boolean labels)')
+        parser.add_argument('--exercise', default='bicep_curls', choices=sorted(EXERCISES),
+                            help='Exercise type (default: bicep_curls)')
+        parser.add_argument('--margin', type=float, default=None,
+                            help='Cascade margin in degrees (default: FORM_MODEL_CASCADE_MARGIN)')
+
+    def handle(self, *args, **options):
+        exercise_type = options['exercise']
+        totals = {'frames': 0, 'model_calls': 0, 'agree': 0, 'labeled': 0,
+                  'always_correct': 0, 'cascade_correct': 0}
+
+        for recording in options['recordings']:
+            arrays, labels = self.load_recording(recording, exercise_type)
+            detected = arrays[3].astype(bool)
+            always, _ = self.replay(exercise_type, 'always', arrays, options['margin'])
+            cascade, usage = self.replay(exercise_type, 'cascade', arrays, options['margin'])
+
+            agree = int((always == cascade).sum())
+            line = (f'{recording}: {usage["pose_frames"]} pose frames, {usage["model_calls"]} model calls '
+                    f'({usage["model_calls_avoided"]:.1%} avoided), agreement {agree / max(len(always), 1):.1%}')
+            totals['frames'] += usage['pose_frames']
+            totals['model_calls'] += usage['model_calls']
+            totals['agree'] += agree
+            if labels is not None:
+                labels = labels[detected]
+                totals['labeled'] += len(labels)
+                totals['always_correct'] += int((always == labels).sum())
+                totals['cascade_correct'] += int((cascade == labels).sum())
+                line += (f', accuracy always {(always == labels).mean():.1%} '
+                         f'/ cascade {(cascade == labels).mean():.1%}')
+            self.stdout.write(line)
+
+        if not totals['frames']:
+            raise CommandError('No frames with a detected pose')
+        self.stdout.write(self.style.SUCCESS(
+            f"Total: {totals['frames']} pose frames, "
+            f"{1 - totals['model_calls'] / totals['frames']:.1%} of model calls avoided, "
+            f"agreement with always-on inference {totals['agree'] / totals['frames']:.1%}"
+        ))
+        if totals['labeled']:
+            self.stdout.write(
+                f"Accuracy on {totals['labeled']} labeled frames: "
+                f"always {totals['always_correct'] / totals['labeled']:.1%}, "
+                f"cascade {totals['cascade_correct'] / totals['labeled']:.1%}"
+            )
+
+    def load_recording(self, path, exercise_type):
+        """Landmark columns of a recording and its per-frame labels, if any"""
+        if path.endswith('.npz'):
+            with np.load(path) as data:
+                arrays = (data['indices'], data['timestamps'], data['landmarks'], data['detected'])
+                labels = data['labels'].astype(bool) if 'labels' in data else None
+            return arrays, labels
+
+        target_fps = settings.VIDEO_ANALYSIS_TARGET_FPS
+        dense_frames = settings.VIDEO_ANALYSIS_DENSE_FRAMES
+        video_sha256 = file_sha256(path)
+        arrays = load_landmarks(video_sha256, target_fps, dense_frames)
+        if arrays is None:
+            self.stdout.write(f'Extracting landmarks from {path}...')
+            with contextlib.redirect_stdout(io.StringIO()):
+                analyze_video(exercise_type, path, use_cache=True)
+            arrays = load_landmarks(video_sha256, target_fps, dense_frames)
+        if arrays is None:
+            raise CommandError('Could not extract landmarks; is LANDMARK_CACHE_DIR writable?')
+        return arrays, None
+
+    def replay(self, exercise_type, model_mode, arrays, margin):
+        """Per-frame correct_form verdicts for the frames with a pose"""
+        analyzer = ExerciseAnalyzer(exercise_type, model_mode=model_mode)
+        if analyzer.predictor is None:
+            raise CommandError(f'No form model for {exercise_type}')
+        if model_mode == 'always':
+            # The reference runs the model itself, without approximate memoization
+            analyzer.predictor = PredictionCache(analyzer.model, max_size=0)
+        if margin is not None:
+            analyzer.cascade_margin = margin
+        verdicts = []
+        with contextlib.redirect_stdout(io.StringIO()):
+            for _, timestamp, landmarks in _iter_stored_landmarks(*arrays):
+                if landmarks is not None:
+                    metrics = analyzer.process_landmarks(landmarks, timestamp=timestamp / 1000)
+                    verdicts.append(bool(metrics['correct_form']))
+        analyzer.close()
+        return np.array(verdicts, dtype=bool), analyzer.model_usage()
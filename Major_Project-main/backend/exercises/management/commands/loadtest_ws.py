@@ -0,0 +1,221 @@
+import asyncio
+import base64
+import csv
+import json
+import os
+import statistics
+import time
+
+import cv2
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.management.base import BaseCommand, CommandError
+
+from exercises import routing
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test ExerciseAnalysisConsumer by streaming recorded frames from "
+        "N concurrent synthetic sessions and report the saturation curve"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('video', help='Recorded workout video used as the frame source')
+        parser.add_argument('--exercise', action='append', dest='exercises',
+                            help='Exercise type to open sessions for (repeatable, default: bicep_curls)')
+        parser.add_argument('--sessions', default='1,2,4,8',
+                            help='Comma separated concurrency levels, sessions per exercise')
+        parser.add_argument('--fps', type=float, default=15.0,
+                            help='Frames sent per second by each session')
+        parser.add_argument('--duration', type=float, default=20.0,
+                            help='Seconds each concurrency level streams frames')
+        parser.add_argument('--max-frames', type=int, default=300,
+                            help='Frames read from the video and replayed in a loop')
+        parser.add_argument('--grace', type=float, default=5.0,
+                            help='Seconds to wait for outstanding responses after streaming stops')
+        parser.add_argument('--connect-timeout', type=float, default=120.0,
+                            help='Seconds allowed for a session to connect (includes model loading)')
+        parser.add_argument('--csv', dest='csv_path', help='Write the saturation curve to this CSV file')
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        exercises = options['exercises'] or ['bicep_curls']
+        try:
+            levels = [int(level) for level in options['sessions'].split(',') if level.strip()]
+        except ValueError:
+            raise CommandError('--sessions must be a comma separated list of integers')
+        if not levels or min(levels) < 1:
+            raise CommandError('--sessions needs at least one positive concurrency level')
+        if options['fps'] <= 0:
+            raise CommandError('--fps must be positive')
+
+        frames = self._load_frames(options['video'], options['max_frames'])
+        self.stdout.write(f"Loaded {len(frames)} frames from {options['video']}")
+
+        self.stdout.write(self._format_header())
+        curve = []
+        for level in levels:
+            row = asyncio.run(self._run_level(level, exercises, frames, options))
+            curve.append(row)
+            self.stdout.write(self._format_row(row))
+
+        self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS('Saturation curve'))
+        self.stdout.write(self._format_header())
+        for row in curve:
+            self.stdout.write(self._format_row(row))
+
+        if options['csv_path']:
+            with open(options['csv_path'], 'w', newline='') as csv_file:
+                writer = csv.DictWriter(csv_file, fieldnames=list(curve[0].keys()))
+                writer.writeheader()
+                writer.writerows(curve)
+            self.stdout.write(f"Wrote {options['csv_path']}")
+
+    def _load_frames(self, video_path, max_frames):
+        """Read and pre-encode frames exactly as the frontend sends them"""
+        if not os.path.exists(video_path):
+            raise CommandError(f'Video not found: {video_path}')
+
+        cap = cv2.VideoCapture(video_path)
+        frames = []
+        while cap.isOpened() and len(frames) < max_frames:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 80])
+            frames.append('data:image/jpeg;base64,' + base64.b64encode(buffer).decode('utf-8'))
+        cap.release()
+
+        if not frames:
+            raise CommandError(f'No frames could be decoded from {video_path}')
+        return frames
+
+    async def _run_level(self, level, exercises, frames, options):
+        """Run `level` sessions per exercise concurrently and aggregate their results"""
+        application = URLRouter(routing.websocket_urlpatterns)
+        sessions = [
+            {
+                'exercise': exercise,
+                'index': index,
+                'communicator': WebsocketCommunicator(application, f'/ws/exercise/{exercise}/'),
+                'connected': False,
+                'sent': 0,
+                'received': 0,
+                'dropped': 0,
+                'latencies': [],
+            }
+            for exercise in exercises
+            for index in range(level)
+        ]
+
+        # Connect everything first so model loading does not count towards streaming CPU
+        for session in sessions:
+            connected, _ = await session['communicator'].connect(timeout=options['connect_timeout'])
+            session['connected'] = connected
+            if not connected:
+                self.stderr.write(f"{session['exercise']}#{session['index']}: connection rejected")
+        connected = [session for session in sessions if session['connected']]
+
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        await asyncio.gather(*[self._stream_session(session, frames, options) for session in connected])
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+
+        for session in connected:
+            await session['communicator'].disconnect(timeout=options['connect_timeout'])
+
+        if self.verbosity >= 2:
+            for session in sessions:
+                self.stdout.write(
+                    f"  {session['exercise']}#{session['index']}: sent={session['sent']} "
+                    f"received={session['received']} dropped={session['dropped']} "
+                    f"p50={self._ms(self._percentile(session['latencies'], 50))} "
+                    f"p95={self._ms(self._percentile(session['latencies'], 95))}"
+                )
+
+        latencies = [latency for session in connected for latency in session['latencies']]
+        sent = sum(session['sent'] for session in connected)
+        received = sum(session['received'] for session in connected)
+
+        return {
+            'sessions': len(sessions),
+            'connected': len(connected),
+            'frames_sent': sent,
+            'frames_processed': received,
+            'dropped_pct': round((sent - received) / sent * 100, 2) if sent else 0.0,
+            'latency_p50_ms': self._ms(self._percentile(latencies, 50)),
+            'latency_p95_ms': self._ms(self._percentile(latencies, 95)),
+            'latency_max_ms': self._ms(max(latencies) if latencies else None),
+            'processed_fps_per_session': round(received / len(connected) / options['duration'], 2) if connected else 0.0,
+            'cpu_pct': round(cpu / wall * 100, 1) if wall else 0.0,
+            'cpu_cores': os.cpu_count(),
+        }
+
+    async def _stream_session(self, session, frames, options):
+        """Stream frames for one connected session and measure per-frame round trips"""
+        communicator = session['communicator']
+        sent_at = {}
+
+        async def receive_responses():
+            while True:
+                message = json.loads(await communicator.receive_from(timeout=3600))
+                if message.get('type') != 'frame_processed':
+                    continue
+                started = sent_at.pop(message.get('frame_id'), None)
+                if started is not None:
+                    session['received'] += 1
+                    session['latencies'].append(time.perf_counter() - started)
+
+        receiver = asyncio.create_task(receive_responses())
+        interval = 1.0 / options['fps']
+        deadline = time.perf_counter() + options['duration']
+        next_send = time.perf_counter()
+        frame_id = 0
+        while time.perf_counter() < deadline:
+            sent_at[frame_id] = time.perf_counter()
+            await communicator.send_to(text_data=json.dumps({
+                'type': 'frame',
+                'frame_id': frame_id,
+                'frame': frames[frame_id % len(frames)],
+            }))
+            frame_id += 1
+            next_send += interval
+            await asyncio.sleep(max(0.0, next_send - time.perf_counter()))
+        session['sent'] = frame_id
+
+        # Responses for frames the consumer throttled or skipped never arrive
+        grace_deadline = time.perf_counter() + options['grace']
+        while sent_at and time.perf_counter() < grace_deadline and not receiver.done():
+            await asyncio.sleep(0.05)
+        receiver.cancel()
+        try:
+            await receiver
+        except asyncio.CancelledError:
+            pass
+        session['dropped'] = session['sent'] - session['received']
+
+    @staticmethod
+    def _percentile(values, percent):
+        if not values:
+            return None
+        if len(values) == 1:
+            return values[0]
+        return statistics.quantiles(values, n=100, method='inclusive')[percent - 1]
+
+    @staticmethod
+    def _ms(seconds):
+        return round(seconds * 1000, 1) if seconds is not None else None
+
+    @staticmethod
+    def _format_header():
+        return (f"{'sessions':>8} {'sent':>7} {'processed':>9} {'dropped%':>8} "
+                f"{'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'fps/sess':>8} {'cpu%':>6}")
+
+    @staticmethod
+    def _format_row(row):
+        return (f"{row['sessions']:>8} {row['frames_sent']:>7} {row['frames_processed']:>9} "
+                f"{row['dropped_pct']:>8} {str(row['latency_p50_ms']):>8} {str(row['latency_p95_ms']):>8} "
+                f"{str(row['latency_max_ms']):>8} {row['processed_fps_per_session']:>8} {row['cpu_pct']:>6}")
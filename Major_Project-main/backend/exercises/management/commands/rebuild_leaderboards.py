@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from authentication.models import UserStats
+from exercises.services.leaderboards import board_key, get_backend
+
+
+class Command(BaseCommand):
+    help = ("Seed the all-time reps and streak leaderboards from users' stats, e.g. for a new "
+            "leaderboard store. Daily, weekly and per-exercise boards fill as workouts are recorded")
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        reps_board, streak_board = board_key('reps', 'all_time'), board_key('streak', 'all_time')
+        users = 0
+        for user_id, total_reps, streak in (UserStats.objects
+                                            .values_list('user_id', 'total_reps', 'highest_streak')
+                                            .iterator()):
+            if total_reps:
+                backend.set(reps_board, str(user_id), total_reps)
+            backend.set(streak_board, str(user_id), streak)
+            users += 1
+        self.stdout.write(self.style.SUCCESS(f'Seeded the all-time leaderboards with {users} users'))
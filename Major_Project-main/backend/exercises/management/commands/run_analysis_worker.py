@@ -0,0 +1,58 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from exercises.services.analysis_jobs import (
+    JobSuperseded,
+    claim_next_job,
+    default_worker_id,
+    requeue_stale_jobs,
+    run_job,
+)
+
+
+class Command(BaseCommand):
+    help = "Process queued video analysis jobs. Start several processes to analyze videos in parallel"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Process the jobs currently queued, then exit')
+        parser.add_argument('--poll-interval', type=float, default=settings.ANALYSIS_JOB_POLL_INTERVAL,
+                            help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--worker-id', default=default_worker_id(),
+                            help='Name recorded on claimed jobs (default: host:pid)')
+
+    def handle(self, *args, **options):
+        worker_id = options['worker_id']
+        self.stdout.write(f'Analysis worker {worker_id} started')
+
+        try:
+            while True:
+                requeued, failed = requeue_stale_jobs()
+                if requeued or failed:
+                    self.stdout.write(f'Requeued {requeued} and failed {failed} stale jobs')
+
+                job = claim_next_job(worker_id)
+                if job is None:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+
+                self.stdout.write(f'Running job {job.id} ({job.user_exercise.exercise.name})')
+                started = time.monotonic()
+                try:
+                    results = run_job(job)
+                except JobSuperseded:
+                    self.stderr.write(f'Job {job.id} was requeued while running, this attempt was abandoned')
+                    continue
+                if results is None:
+                    self.stderr.write(f'Job {job.id} failed')
+                else:
+                    self.stdout.write(self.style.SUCCESS(
+                        f"Job {job.id} done in {time.monotonic() - started:.1f}s: "
+                        f"{results['reps']} reps, {results['form_accuracy']:.1f}% form accuracy"
+                    ))
+        except KeyboardInterrupt:
+            self.stdout.write(f'Analysis worker {worker_id} stopped')
@@ -0,0 +1,68 @@
+import contextlib
+import io
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from exercises.services.exercise_analysis import ExerciseAnalyzer
+from exercises.services.landmark_cache import file_sha256, load_landmarks
+from exercises.services.exercise_rules import EXERCISES
+from exercises.services.rep_segmentation import segment_reps
+from exercises.services.video_analysis import _iter_stored_landmarks, analyze_video, summarize_landmarks
+
+
+class Command(BaseCommand):
+    help = ("Segment the reps of a recorded video from its whole landmark series and check the "
+            "count against the per-frame state machine")
+
+    def add_arguments(self, parser):
+        parser.add_argument('video', help='Path to a recorded exercise video')
+        parser.add_argument('--exercise', default='bicep_curls', choices=sorted(name for name, rules in EXERCISES.items() if 'reps' in rules),
+                            help='Exercise type (default: bicep_curls)')
+
+    def handle(self, *args, **options):
+        exercise_type = options['exercise']
+        video_path = options['video']
+        target_fps = settings.VIDEO_ANALYSIS_TARGET_FPS
+        dense_frames = settings.VIDEO_ANALYSIS_DENSE_FRAMES
+
+        video_sha256 = file_sha256(video_path)
+        arrays = load_landmarks(video_sha256, target_fps, dense_frames)
+        if arrays is None:
+            self.stdout.write('Extracting landmarks...')
+            with contextlib.redirect_stdout(io.StringIO()):
+                analyze_video(exercise_type, video_path, use_cache=True)
+            arrays = load_landmarks(video_sha256, target_fps, dense_frames)
+        if arrays is None:
+            raise CommandError('Could not extract landmarks; is LANDMARK_CACHE_DIR writable?')
+
+        # Only the rep count is compared, so the form model is not needed
+        analyzer = ExerciseAnalyzer(exercise_type, model_mode='off')
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            live = summarize_landmarks(analyzer, _iter_stored_landmarks(*arrays))
+        live_seconds = time.perf_counter() - started
+        analyzer.close()
+
+        started = time.perf_counter()
+        offline = segment_reps(exercise_type, *arrays)
+        offline_seconds = time.perf_counter() - started
+
+        self.stdout.write(f"{'rep':>4} {'start':>8} {'peak':>8} {'end':>8} {'ROM':>7} "
+                          f"{'to peak':>8} {'back':>8}")
+        for number, segment in enumerate(offline['segments'], 1):
+            self.stdout.write(
+                f"{number:>4} {segment['start']:>8.2f} {segment['peak']:>8.2f} {segment['end']:>8.2f} "
+                f"{segment['range_of_motion']:>7.1f} {segment['time_to_peak']:>8.2f} "
+                f"{segment['time_from_peak']:>8.2f}{'' if segment['complete'] else '  (incomplete)'}"
+            )
+
+        frames = len(arrays[0])
+        self.stdout.write(f'State machine: {live["reps"]} reps over {frames} frames in {live_seconds * 1000:.1f} ms')
+        self.stdout.write(f'Segmentation:  {offline["reps"]} reps over {frames} frames in {offline_seconds * 1000:.1f} ms')
+        if live['reps'] == offline['reps'] and analyzer.stage == offline['stage']:
+            self.stdout.write(self.style.SUCCESS('Rep counts match'))
+        else:
+            raise CommandError(f'Rep counts differ: state machine {live["reps"]} ({analyzer.stage}), '
+                               f'segmentation {offline["reps"]} ({offline["stage"]})')
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.5 on 2026-10-19 15:34
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exercises', '0005_videoblob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyWorkoutRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('workouts', models.IntegerField(default=0)),
+                ('reps', models.IntegerField(default=0)),
+                ('duration', models.IntegerField(default=0)),
+                ('form_accuracy_sum', models.FloatField(default=0)),
+                ('form_accuracy_count', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='workout_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'date'), name='unique_daily_workout_rollup')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.5 on 2026-10-19 16:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exercises', '0006_dailyworkoutrollup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='userexercise',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='userexercise_history_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userexercise',
+            index=models.Index(fields=['user', 'exercise', 'created_at', 'id'], name='userexercise_ex_history_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.5 on 2026-10-19 17:20
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exercises', '0007_userexercise_history_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userexercise',
+            name='client_session_id',
+            field=models.UUIDField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='userexercise',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddConstraint(
+            model_name='userexercise',
+            constraint=models.UniqueConstraint(condition=models.Q(('client_session_id__isnull', False)), fields=('user', 'client_session_id'), name='unique_client_session'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.5 on 2026-10-19 18:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exercises', '0008_userexercise_client_session_id'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LiveSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('client_session_id', models.UUIDField(unique=True)),
+                ('reps', models.IntegerField(default=0)),
+                ('duration', models.IntegerField(default=0)),
+                ('form_accuracy', models.FloatField(blank=True, null=True)),
+                ('feedback', models.TextField(blank=True, default='')),
+                ('completed', models.BooleanField(default=False)),
+                ('started_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('exercise', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='exercises.exercise')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='live_sessions', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -1,5 +1,12 @@
-from django.db import models
-from authentication.models import User
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from authentication.cache import invalidate_dashboard
+from authentication.models import User, UserStats, workout_completed
+from .cache import invalidate_analytics
+from .services.leaderboards import record_workout
 
 class Exercise(models.Model):
     EXERCISE_TYPES = [
@@ -26,6 +33,24 @@ class Exercise(models.Model):
     ])
     created_at = models.DateTimeField(auto_now_add=True)
 
+class VideoBlob(models.Model):
+    """
+    Uploaded video bytes, stored once under their SHA-256 and shared by
+    every UserExercise that uploaded the same file
+    """
+    sha256 = models.CharField(max_length=64, unique=True)
+    file = models.FileField(upload_to='exercise_videos/')
+    size = models.BigIntegerField()
+    ref_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def release(self):
+        """Drop one reference, deleting the blob and its file with the last one"""
+        VideoBlob.objects.filter(id=self.id).update(ref_count=F('ref_count') - 1)
+        deleted, _ = VideoBlob.objects.filter(id=self.id, ref_count__lte=0).delete()
+        if deleted:
+            self.file.delete(save=False)
+
 class UserExercise(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     exercise = models.ForeignKey(Exercise, on_delete=models.CASCADE)
@@ -33,5 +58,224 @@ class UserExercise(models.Model):
     duration = models.IntegerField(null=True, blank=True)  # in seconds
     form_accuracy = models.FloatField(null=True, blank=True)
     video_recording = models.FileField(upload_to='exercise_videos/', null=True, blank=True)
+    # Set for deduplicated uploads; video_recording then points at the blob's file
+    video_blob = models.ForeignKey(VideoBlob, on_delete=models.PROTECT, null=True, blank=True,
+                                   related_name='user_exercises')
     feedback = models.TextField(null=True, blank=True)
-    created_at = models.DateTimeField(auto_now_add=True)
\ No newline at end of file
+    # Generated by the client for sessions it uploads, so a retried upload is not counted twice
+    client_session_id = models.UUIDField(null=True, blank=True)
+    # Uploaded sessions keep the time they were recorded at
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'client_session_id'], name='unique_client_session',
+                                    condition=models.Q(client_session_id__isnull=False)),
+        ]
+        indexes = [
+            # Keyset-paginated history, newest first, optionally for one exercise
+            models.Index(fields=['user', 'created_at', 'id'], name='userexercise_history_idx'),
+            models.Index(fields=['user', 'exercise', 'created_at', 'id'], name='userexercise_ex_history_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # What the stored row counts towards its daily rollup, to apply
+        # only the difference when analysis results are saved later
+        instance._rollup_contribution = workout_contribution(instance)
+        return instance
+
+class DailyWorkoutRollup(models.Model):
+    """
+    Per-user, per-day workout totals, kept up to date as UserExercise rows
+    are saved and deleted, so weekly and monthly figures are read from a
+    few rows instead of scanning the whole history
+    """
+    COUNTERS = ('workouts', 'reps', 'duration', 'form_accuracy_sum', 'form_accuracy_count')
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='workout_rollups')
+    date = models.DateField()
+    workouts = models.IntegerField(default=0)
+    reps = models.IntegerField(default=0)
+    duration = models.IntegerField(default=0)  # in seconds
+    # Mean form accuracy = sum / count over the workouts that have one
+    form_accuracy_sum = models.FloatField(default=0)
+    form_accuracy_count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'date'], name='unique_daily_workout_rollup'),
+        ]
+
+    @property
+    def form_accuracy(self):
+        return self.form_accuracy_sum / self.form_accuracy_count if self.form_accuracy_count else None
+
+    @classmethod
+    def add(cls, user_id, date, counts, create=True):
+        """Add `counts` (counter name -> delta) to a user's day, creating the row if needed"""
+        updates = {name: F(name) + delta for name, delta in counts.items() if delta}
+        if not updates:
+            return
+        if cls.objects.filter(user_id=user_id, date=date).update(**updates) or not create:
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(user_id=user_id, date=date, **counts)
+        except IntegrityError:
+            # Created concurrently by another save for the same day
+            cls.objects.filter(user_id=user_id, date=date).update(**updates)
+
+    @classmethod
+    def add_workouts(cls, user_id, user_exercises):
+        """
+        Add UserExercise rows inserted without post_save (bulk_create) to
+        their days' rollups, with one update or insert per day
+        """
+        days = {}
+        for user_exercise in user_exercises:
+            contribution = workout_contribution(user_exercise)
+            if contribution is None:
+                continue
+            date, counts = contribution
+            totals = days.setdefault(date, dict.fromkeys(counts, 0))
+            for name, delta in counts.items():
+                totals[name] += delta
+            user_exercise._rollup_contribution = contribution
+        for date, counts in sorted(days.items()):
+            cls.add(user_id, date, counts)
+
+def workout_contribution(user_exercise):
+    """The (date, counts) a UserExercise adds to its user's daily rollup"""
+    fields = user_exercise.__dict__
+    if user_exercise.created_at is None or any(
+            name not in fields for name in ('reps', 'duration', 'form_accuracy')):
+        return None
+    return timezone.localdate(user_exercise.created_at), {
+        'workouts': 1,
+        'reps': user_exercise.reps or 0,
+        'duration': user_exercise.duration or 0,
+        'form_accuracy_sum': user_exercise.form_accuracy or 0,
+        'form_accuracy_count': 0 if user_exercise.form_accuracy is None else 1,
+    }
+
+@receiver(post_save, sender=UserExercise)
+def update_workout_rollup(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = None if created else getattr(instance, '_rollup_contribution', None)
+    current = workout_contribution(instance)
+    if current is None:
+        return
+    date, counts = current
+    if previous is not None:
+        if previous[0] == date:
+            counts = {name: counts[name] - previous[1][name] for name in counts}
+        else:
+            DailyWorkoutRollup.add(instance.user_id, previous[0],
+                                   {name: -delta for name, delta in previous[1].items()}, create=False)
+    elif not created:
+        # Saved from an instance that was not loaded from the database
+        return
+    DailyWorkoutRollup.add(instance.user_id, date, counts)
+    instance._rollup_contribution = current
+
+@receiver(post_delete, sender=UserExercise)
+def remove_from_workout_rollup(sender, instance, **kwargs):
+    contribution = getattr(instance, '_rollup_contribution', None) or workout_contribution(instance)
+    if contribution is not None:
+        date, counts = contribution
+        DailyWorkoutRollup.add(instance.user_id, date, {name: -delta for name, delta in counts.items()},
+                               create=False)
+
+@receiver(post_delete, sender=UserExercise)
+def release_video_blob(sender, instance, **kwargs):
+    if instance.video_blob_id:
+        instance.video_blob.release()
+
+@receiver(post_save, sender=UserExercise)
+@receiver(post_delete, sender=UserExercise)
+def invalidate_workout_dashboard(sender, instance, **kwargs):
+    invalidate_dashboard(instance.user_id)
+
+@receiver(post_save, sender=UserExercise)
+@receiver(post_delete, sender=UserExercise)
+def invalidate_workout_analytics(sender, instance, **kwargs):
+    invalidate_analytics(instance.user_id)
+
+@receiver(workout_completed, sender=UserStats)
+def record_leaderboard_scores(sender, stats, workouts, **kwargs):
+    exercise_types = dict(Exercise.EXERCISE_TYPES)
+    scores = []
+    for workout in workouts:
+        exercise = workout.get('exercise_type')
+        form_accuracy = workout.get('form_accuracy')
+        scores.append({
+            'exercise': exercise if exercise in exercise_types else None,
+            'reps': int(workout.get('reps', 0)),
+            'form_accuracy': float(form_accuracy) if form_accuracy is not None else None,
+            'day': workout.get('date'),
+        })
+    # The best streak only changes with workouts, so unlike the current streak
+    # it never goes stale on the board when a user stops training
+    streak = stats.highest_streak
+
+    def record():
+        for score in scores:
+            record_workout(stats.user_id, streak=streak, **score)
+
+    # Leaderboards live outside the database, so only count committed workouts;
+    # an unavailable leaderboard store must not fail the workout itself
+    transaction.on_commit(record, robust=True)
+
+class LiveSession(models.Model):
+    """
+    Latest metrics of a live WebSocket session, checkpointed while it runs.
+    When the session ends it is also recorded as a UserExercise with the same
+    client_session_id, and `completed` is set.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='live_sessions')
+    exercise = models.ForeignKey(Exercise, on_delete=models.CASCADE)
+    client_session_id = models.UUIDField(unique=True)
+    reps = models.IntegerField(default=0)
+    duration = models.IntegerField(default=0)  # in seconds
+    form_accuracy = models.FloatField(null=True, blank=True)
+    feedback = models.TextField(blank=True, default='')
+    completed = models.BooleanField(default=False)
+    started_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+
+class AnalysisJob(models.Model):
+    """Queued analysis of an uploaded video, executed by run_analysis_worker"""
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_SUCCEEDED, 'Succeeded'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    user_exercise = models.ForeignKey(UserExercise, on_delete=models.CASCADE, related_name='analysis_jobs')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    progress = models.FloatField(default=0)  # percent complete
+    processed_frames = models.IntegerField(default=0)
+    total_frames = models.IntegerField(null=True, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    analysis_version = models.CharField(max_length=200, null=True, blank=True)
+    error = models.TextField(null=True, blank=True)
+    worker = models.CharField(max_length=100, null=True, blank=True)
+    attempts = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
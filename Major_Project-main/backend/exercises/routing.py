@@ -3,4 +3,9 @@ from . import consumers
 
 websocket_urlpatterns = [
     re_path(r'ws/exercise/(?P<exercise_type>\w+)/$', consumers.ExerciseAnalysisConsumer.as_asgi()),
+]
+
+# Served ahead of Django so uploads can be analyzed while they stream in
+http_urlpatterns = [
+    re_path(r'^api/exercises/stream/(?P<exercise_type>\w+)/$', consumers.VideoStreamConsumer.as_asgi()),
 ]
\ No newline at end of file
@@ -1,5 +1,9 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
 from rest_framework import serializers
-from .models import Exercise, UserExercise
+from .models import Exercise, UserExercise, AnalysisJob
 
 class ExerciseSerializer(serializers.ModelSerializer):
     class Meta:
@@ -13,4 +17,36 @@ class UserExerciseSerializer(serializers.ModelSerializer):
         model = UserExercise
         fields = ['id', 'exercise', 'exercise_name', 'reps', 'duration', 
                  'form_accuracy', 'feedback', 'created_at']
-        read_only_fields = ('user', 'form_accuracy', 'feedback')
\ No newline at end of file
+        read_only_fields = ('user', 'form_accuracy', 'feedback', 'created_at')
+
+class AnalysisJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = AnalysisJob
+        fields = ['id', 'user_exercise', 'status', 'progress', 'processed_frames',
+                 'total_frames', 'result', 'error', 'created_at', 'started_at', 'finished_at']
+        read_only_fields = fields
+
+class WorkoutSessionSerializer(serializers.Serializer):
+    """A completed workout session uploaded by the client"""
+    client_session_id = serializers.UUIDField(required=False, allow_null=True)
+    exercise_type = serializers.ChoiceField(choices=Exercise.EXERCISE_TYPES)
+    reps = serializers.IntegerField(min_value=0, default=0)
+    duration = serializers.IntegerField(min_value=0, default=0)  # in seconds
+    form_accuracy = serializers.FloatField(min_value=0, max_value=100, required=False, allow_null=True)
+    calories_burned = serializers.FloatField(min_value=0, default=0)
+    feedback = serializers.CharField(required=False, allow_blank=True, default='')
+    recorded_at = serializers.DateTimeField(required=False)
+
+    def validate_recorded_at(self, value):
+        if value > timezone.now() + timedelta(minutes=5):
+            raise serializers.ValidationError("Sessions cannot be recorded in the future")
+        return value
+
+class WorkoutSessionBatchSerializer(serializers.Serializer):
+    sessions = WorkoutSessionSerializer(many=True, allow_empty=False)
+
+    def validate_sessions(self, value):
+        if len(value) > settings.SESSION_UPLOAD_MAX_SESSIONS:
+            raise serializers.ValidationError(
+                f"At most {settings.SESSION_UPLOAD_MAX_SESSIONS} sessions can be uploaded at once")
+        return value
@@ -0,0 +1,175 @@
+import os
+import socket
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from ..models import AnalysisJob
+from .video_analysis import analysis_version, analyze_video
+from .video_store import previous_result
+
+
+def enqueue_analysis(user_exercise):
+    """
+    Queue the video attached to a UserExercise for background analysis.
+
+    When the same video was already analyzed for this exercise by the
+    current analysis version, the job is completed straight away with the
+    earlier results instead.
+    """
+    results = previous_result(user_exercise)
+    if results is not None:
+        save_results(user_exercise, results)
+        now = timezone.now()
+        return AnalysisJob.objects.create(
+            user=user_exercise.user,
+            user_exercise=user_exercise,
+            status=AnalysisJob.STATUS_SUCCEEDED,
+            progress=100,
+            processed_frames=results['total_frames'],
+            total_frames=results['total_frames'],
+            result=results,
+            analysis_version=analysis_version(),
+            started_at=now,
+            finished_at=now,
+        )
+    return AnalysisJob.objects.create(
+        user=user_exercise.user,
+        user_exercise=user_exercise,
+    )
+
+
+def save_results(user_exercise, results):
+    """Write video analysis results to the UserExercise they belong to"""
+    user_exercise.reps = results['reps']
+    user_exercise.duration = round(results['duration'])
+    user_exercise.form_accuracy = results['form_accuracy']
+    user_exercise.feedback = "\n".join(results['feedback'])
+    user_exercise.save(update_fields=['reps', 'duration', 'form_accuracy', 'feedback'])
+
+
+def default_worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def claim_next_job(worker_id):
+    """
+    Atomically claim the oldest queued job for this worker.
+
+    Claiming is a conditional UPDATE on the job's status, so several worker
+    processes can poll the same table without row locks (works on SQLite
+    as well as PostgreSQL). Returns None when the queue is empty.
+    """
+    candidates = (AnalysisJob.objects
+                  .filter(status=AnalysisJob.STATUS_QUEUED)
+                  .order_by('created_at')
+                  .values_list('id', flat=True)[:10])
+    for job_id in candidates:
+        now = timezone.now()
+        claimed = AnalysisJob.objects.filter(id=job_id, status=AnalysisJob.STATUS_QUEUED).update(
+            status=AnalysisJob.STATUS_RUNNING,
+            worker=worker_id,
+            attempts=F('attempts') + 1,
+            started_at=now,
+            heartbeat_at=now,
+        )
+        if claimed:
+            return AnalysisJob.objects.select_related('user_exercise__exercise').get(id=job_id)
+    return None
+
+
+def requeue_stale_jobs(stale_after=None, max_attempts=None):
+    """
+    Return jobs whose worker stopped sending heartbeats to the queue, or fail
+    them once they have used up their attempts.
+    """
+    stale_after = stale_after or settings.ANALYSIS_JOB_STALE_AFTER
+    max_attempts = max_attempts or settings.ANALYSIS_JOB_MAX_ATTEMPTS
+    stale = AnalysisJob.objects.filter(
+        status=AnalysisJob.STATUS_RUNNING,
+        heartbeat_at__lt=timezone.now() - timedelta(seconds=stale_after),
+    )
+    failed = stale.filter(attempts__gte=max_attempts).update(
+        status=AnalysisJob.STATUS_FAILED,
+        error='Worker stopped responding',
+        finished_at=timezone.now(),
+    )
+    requeued = stale.filter(attempts__lt=max_attempts).update(
+        status=AnalysisJob.STATUS_QUEUED,
+        worker=None,
+    )
+    return requeued, failed
+
+
+class JobSuperseded(Exception):
+    """The job was requeued, and possibly claimed again, while this worker ran it"""
+
+
+def _current_attempt(job):
+    """The job's row while it is still this claim's attempt"""
+    return AnalysisJob.objects.filter(id=job.id, status=AnalysisJob.STATUS_RUNNING,
+                                      worker=job.worker, attempts=job.attempts)
+
+
+def run_job(job, progress_interval=1.0):
+    """
+    Analyze a claimed job's video and write the results to its UserExercise.
+
+    Every write is conditional on the job still being this claim's attempt:
+    if it was requeued as stale meanwhile, the analysis is abandoned at the
+    next progress report and its results are never written over the new
+    attempt's; JobSuperseded is raised. Returns the results, or None when
+    the analysis failed (the error is stored on the job).
+    """
+    user_exercise = job.user_exercise
+    last_report = 0
+
+    def report_progress(processed_frames, total_frames):
+        nonlocal last_report
+        now = time.monotonic()
+        if now - last_report < progress_interval:
+            return
+        last_report = now
+        progress = min(processed_frames / total_frames * 100, 99.9) if total_frames else 0
+        if not _current_attempt(job).update(
+                processed_frames=processed_frames,
+                total_frames=total_frames,
+                progress=progress,
+                heartbeat_at=timezone.now()):
+            raise JobSuperseded()
+
+    version = analysis_version()
+    try:
+        results = analyze_video(
+            user_exercise.exercise.name,
+            user_exercise.video_recording.path,
+            progress_callback=report_progress,
+        )
+    except JobSuperseded:
+        raise
+    except Exception as e:
+        _current_attempt(job).update(
+            status=AnalysisJob.STATUS_FAILED,
+            error=str(e),
+            finished_at=timezone.now(),
+        )
+        return None
+
+    with transaction.atomic():
+        succeeded = _current_attempt(job).update(
+            status=AnalysisJob.STATUS_SUCCEEDED,
+            progress=100,
+            processed_frames=results['total_frames'],
+            total_frames=results['total_frames'],
+            result=results,
+            analysis_version=version,
+            finished_at=timezone.now(),
+        )
+        if not succeeded:
+            raise JobSuperseded()
+        save_results(user_exercise, results)
+    return results
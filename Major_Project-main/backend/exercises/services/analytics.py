@@ -0,0 +1,102 @@
+import math
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+
+from ..cache import analytics_generation
+from ..models import UserExercise
+
+BUCKETS = {
+    'day': TruncDay,
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+
+# Summed per bucket in SQL; means are derived from the sums so merged buckets stay exact
+_TOTALS = ('sessions', 'reps_sum', 'reps_count', 'duration_sum', 'form_accuracy_sum', 'form_accuracy_count')
+
+
+def bucket_totals(user_id, bucket, exercise=None, start=None, end=None):
+    """
+    Per-exercise totals of a user's workouts in `bucket`-sized periods, in
+    one grouped query: {exercise name: [totals per period, oldest first]}
+    """
+    queryset = UserExercise.objects.filter(user_id=user_id)
+    if exercise is not None:
+        queryset = queryset.filter(**{'exercise_id' if isinstance(exercise, int) else 'exercise__name': exercise})
+    if start is not None:
+        queryset = queryset.filter(created_at__gte=start)
+    if end is not None:
+        queryset = queryset.filter(created_at__lt=end)
+
+    rows = (queryset
+            .annotate(period=BUCKETS[bucket]('created_at'))
+            .values('exercise__name', 'period')
+            .annotate(
+                sessions=Count('id'),
+                reps_sum=Sum('reps', default=0),
+                reps_count=Count('reps'),
+                duration_sum=Sum('duration', default=0),
+                form_accuracy_sum=Sum('form_accuracy', default=0.0),
+                form_accuracy_count=Count('form_accuracy'),
+            )
+            .order_by('exercise__name', 'period'))
+    series = {}
+    for row in rows:
+        series.setdefault(row.pop('exercise__name'), []).append(row)
+    return series
+
+
+def downsample(buckets, max_points):
+    """
+    Merge runs of consecutive buckets so at most `max_points` remain. Each
+    point starts at its first bucket's period and covers the totals of all
+    of them, so sums and means over the chart are unchanged.
+    """
+    size = math.ceil(len(buckets) / max_points) if max_points else 1
+    if size <= 1:
+        return list(buckets)
+    points = []
+    for first in range(0, len(buckets), size):
+        group = buckets[first:first + size]
+        point = {'period': group[0]['period']}
+        for name in _TOTALS:
+            point[name] = sum(bucket[name] for bucket in group)
+        points.append(point)
+    return points
+
+
+def chart_point(totals):
+    return {
+        'period': totals['period'].isoformat(),
+        'sessions': totals['sessions'],
+        'reps': totals['reps_sum'],
+        'reps_per_session': totals['reps_sum'] / totals['reps_count'] if totals['reps_count'] else None,
+        'duration': totals['duration_sum'],
+        'form_accuracy': (totals['form_accuracy_sum'] / totals['form_accuracy_count']
+                          if totals['form_accuracy_count'] else None),
+    }
+
+
+def workout_trends(user_id, bucket, max_points, exercise=None, start=None, end=None):
+    """Chart series per exercise, at most `max_points` points each"""
+    series = bucket_totals(user_id, bucket, exercise, start, end)
+    return {name: [chart_point(point) for point in downsample(buckets, max_points)]
+            for name, buckets in series.items()}
+
+
+def get_workout_trends(user_id, bucket, max_points, exercise=None, start=None, end=None):
+    """
+    workout_trends from the cache. Entries are keyed by the query and the
+    user's current generation, and expire after ANALYTICS_CACHE_TTL.
+    """
+    key = ':'.join(str(part) for part in (
+        'analytics', user_id, analytics_generation(user_id), bucket, max_points, exercise,
+        start.isoformat() if start else '', end.isoformat() if end else ''))
+    data = cache.get(key)
+    if data is None:
+        data = workout_trends(user_id, bucket, max_points, exercise, start, end)
+        cache.set(key, data, settings.ANALYTICS_CACHE_TTL)
+    return data
@@ -0,0 +1,103 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from .exercise_analysis import ExerciseAnalyzer
+
+
+class AnalyzerCache:
+    """
+    Per-worker cache of warm ExerciseAnalyzer instances for the single-frame
+    REST endpoints, keyed by (user, session, exercise).
+
+    Keeping the analyzer alive between requests avoids rebuilding the
+    MediaPipe graph for every frame and preserves rep counting state across
+    calls. Entries expire after `ttl` seconds without use and the least
+    recently used entry is evicted once `max_size` analyzers are live.
+    Dropped analyzers are closed as soon as no request is using them, so
+    their MediaPipe graphs do not wait for garbage collection.
+    """
+
+    def __init__(self, ttl=None, max_size=None):
+        self.ttl = ttl if ttl is not None else getattr(settings, 'ANALYZER_CACHE_TTL', 300)
+        self.max_size = max_size if max_size is not None else getattr(settings, 'ANALYZER_CACHE_MAX_SIZE', 8)
+        self._entries = OrderedDict()  # key -> [analyzer, lock, last_used]
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def checkout(self, user_id, session_id, exercise_type):
+        """
+        Yield the cached analyzer for a session, creating it on a miss.
+
+        Requests for the same session are serialized on a per-entry lock
+        because MediaPipe graphs are not safe to share between threads.
+        """
+        key = (user_id, str(session_id), exercise_type)
+        while True:
+            entry = self._get_entry(key)
+            if entry is None:
+                # Build outside the cache lock so other sessions are not blocked
+                entry = self._add_entry(key, ExerciseAnalyzer(exercise_type, model_mode=settings.LIVE_FORM_MODEL_MODE))
+
+            with entry[1]:
+                if entry[0] is None:
+                    # Dropped and closed while this request waited for it
+                    continue
+                yield entry[0]
+                entry[2] = time.monotonic()
+                return
+
+    def discard(self, user_id, session_id, exercise_type):
+        """Drop a session's analyzer, e.g. once the client ends the set"""
+        with self._lock:
+            entry = self._entries.pop((user_id, str(session_id), exercise_type), None)
+        self._close([entry] if entry is not None else [])
+
+    def stats(self):
+        with self._lock:
+            return {'live_analyzers': len(self._entries), 'max_size': self.max_size, 'ttl': self.ttl}
+
+    def _get_entry(self, key):
+        with self._lock:
+            evicted = self._evict_expired()
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry[2] = time.monotonic()
+                self._entries.move_to_end(key)
+        self._close(evicted)
+        return entry
+
+    def _add_entry(self, key, analyzer):
+        with self._lock:
+            # Another request for the same session may have won the race
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = [analyzer, threading.Lock(), time.monotonic()]
+                self._entries[key] = entry
+            self._entries.move_to_end(key)
+            evicted = []
+            while len(self._entries) > self.max_size:
+                evicted.append(self._entries.popitem(last=False)[1])
+        if entry[0] is not analyzer:
+            analyzer.close()
+        self._close(evicted)
+        return entry
+
+    def _evict_expired(self):
+        cutoff = time.monotonic() - self.ttl
+        expired = [key for key, entry in self._entries.items() if entry[2] < cutoff]
+        return [self._entries.pop(key) for key in expired]
+
+    def _close(self, entries):
+        """Close dropped entries' analyzers, waiting for requests still using them"""
+        for entry in entries:
+            with entry[1]:
+                analyzer, entry[0] = entry[0], None
+            if analyzer is not None:
+                analyzer.close()
+
+
+analyzer_cache = AnalyzerCache()
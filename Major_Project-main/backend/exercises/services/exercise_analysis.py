@@ -7,8 +7,76 @@ from django.conf import settings
 from pathlib import Path
 import time
 import random
+import threading
+from collections import namedtuple
+
+from .exercise_rules import get_rules
+from .prediction_cache import PredictionCache
+
+# Keras models are read-only at inference time, so every analyzer in a worker
+# process shares one loaded instance per model file.
+_loaded_models = {}
+_models_lock = threading.Lock()
+
+
+def load_model(model_path):
+    """Load a Keras model once per process and return the shared instance"""
+    with _models_lock:
+        if model_path not in _loaded_models:
+            _loaded_models[model_path] = tf.keras.models.load_model(model_path)
+        return _loaded_models[model_path]
+
+
+_prediction_caches = {}
+
+
+def load_predictor(model_path):
+    """The worker's shared PredictionCache in front of a model file's model"""
+    model = load_model(model_path)
+    with _models_lock:
+        if model_path not in _prediction_caches:
+            _prediction_caches[model_path] = PredictionCache(model)
+        return _prediction_caches[model_path]
+
+
+# MediaPipe Pose settings. Stored landmarks are only reusable while these and
+# the MediaPipe release stay the same, so they are part of the cache key.
+POSE_OPTIONS = {
+    'min_detection_confidence': 0.5,
+    'min_tracking_confidence': 0.5,
+}
+POSE_MODEL_VERSION = 'mediapipe-{}-{}'.format(
+    getattr(mp, '__version__', 'unknown'),
+    '-'.join(f'{value}' for _, value in sorted(POSE_OPTIONS.items())),
+)
+
+# Bump when the rules or the bundled models change, so analysis results
+# stored for deduplicated videos are recomputed instead of reused
+ANALYSIS_VERSION = 2
+
+# When the form model runs: on every frame with a pose, only where the rules
+# are inconclusive or the stage changes, or never
+MODEL_MODES = ('always', 'cascade', 'off')
+# Binary form models answer "correct" above this score
+MODEL_THRESHOLD = 0.5
+
+
+# Stand-in for a MediaPipe landmark when poses are rebuilt from stored arrays
+Landmark = namedtuple('Landmark', ['x', 'y', 'z', 'visibility'])
+
+
+def landmarks_to_array(landmarks):
+    """Pack pose landmarks into a (33, 4) float32 array of x, y, z, visibility"""
+    return np.array([[lm.x, lm.y, lm.z, lm.visibility] for lm in landmarks], dtype=np.float32)
+
+
+def array_to_landmarks(array):
+    """Rebuild landmark objects from a (33, 4) array for the rule processors"""
+    return [Landmark(*row) for row in array.tolist()]
+
+
 class ExerciseAnalyzer:
-    def __init__(self, exercise_type):
+    def __init__(self, exercise_type, model_mode=None):
         # Initialize for specific exercise type
         self.exercise_type = exercise_type
         self.counter = 0
@@ -18,6 +86,22 @@ class ExerciseAnalyzer:
         self.feedback = ""
         self.form_feedback = []
         self.correct_form = False
+        self.last_landmarks = None
+        # Clock (seconds) of the frame being processed; timers run on it
+        self.timestamp = None
+        # Hold timer for timed exercises such as planks
+        self.hold_start_time = None
+        self.hold_duration = 0
+        self.timer_running = False
+        self.rules = get_rules(exercise_type)
+        self.stage_changed = False
+        # Form model cascade (FORM_MODEL_MODE) and how often the model ran
+        self.model_mode = model_mode or settings.FORM_MODEL_MODE
+        if self.model_mode not in MODEL_MODES:
+            raise ValueError(f"Unknown form model mode: {self.model_mode}")
+        self.cascade_margin = settings.FORM_MODEL_CASCADE_MARGIN
+        self.pose_frames = 0
+        self.model_calls = 0
         
         # Load ML model
         ml_models_dir = Path(settings.BASE_DIR) / 'exercises' / 'ml_models'
@@ -30,18 +114,23 @@ class ExerciseAnalyzer:
             'planks': str(ml_models_dir / 'planks_model.h5')
         }
         # Load model based on exercise type from model_paths dictionary
-        if exercise_type in self.model_paths:
-            self.model = tf.keras.models.load_model(self.model_paths[exercise_type])
-        else:
+        if exercise_type not in self.model_paths:
             raise ValueError(f"No model found for exercise type: {exercise_type}")
+        model_path = self.model_paths[exercise_type]
+        if self.model_mode != 'off' and os.path.exists(model_path):
+            self.model = load_model(model_path)
+            self.predictor = load_predictor(model_path)
+        else:
+            if self.model_mode != 'off':
+                print(f"No form model file for {exercise_type}, judging form by the rules alone")
+            # Without a model the compiled rules judge every frame
+            self.model = self.predictor = None
+            self.model_mode = 'off'
         
         # Initialize MediaPipe
         self.mp_pose = mp.solutions.pose
         self.mp_drawing = mp.solutions.drawing_utils
-        self.pose = self.mp_pose.Pose(
-            min_detection_confidence=0.5,
-            min_tracking_confidence=0.5
-        )
+        self.pose = self.mp_pose.Pose(**POSE_OPTIONS)
 
         # Define keypoints based on exercise type
         self.keypoints_config = {
@@ -62,19 +151,14 @@ class ExerciseAnalyzer:
             ]
         }
 
-    def calculate_angle(self, a, b, c):
-        """Calculate angle between three points"""
-        a = np.array([a.x, a.y])  # First point
-        b = np.array([b.x, b.y])  # Mid point
-        c = np.array([c.x, c.y])  # End point
-        
-        radians = np.arctan2(c[1]-b[1], c[0]-b[0]) - np.arctan2(a[1]-b[1], a[0]-b[0])
-        angle = np.abs(radians*180.0/np.pi)
-        
-        if angle > 180.0:
-            angle = 360-angle
-            
-        return angle
+    def reset_tracking(self):
+        """Start pose estimation afresh, as for a new video, instead of tracking from the last frame"""
+        self.pose.close()
+        self.pose = self.mp_pose.Pose(**POSE_OPTIONS)
+
+    def close(self):
+        """Release the MediaPipe graph and its threads; the analyzer cannot be used afterwards"""
+        self.pose.close()
 
     def extract_keypoints(self, landmarks):
         """Extract relevant keypoints based on exercise type"""
@@ -102,8 +186,7 @@ class ExerciseAnalyzer:
                 return "Incorrect form. Lower your hips and keep your body straight.", False
         else:
             # Binary classification for other exercises
-            threshold = self.models[exercise_type]['threshold']
-            if prediction > threshold:
+            if prediction > MODEL_THRESHOLD:
                 if exercise_type == 'bicep_curls':
                     return "Good form! Full range of motion.", True
                 elif exercise_type == 'lunges':
@@ -134,6 +217,8 @@ class ExerciseAnalyzer:
         input_data = self.extract_keypoints(results.pose_landmarks.landmark)
         
         # Get prediction from model
+        if self.model is None:
+            raise ValueError(f"No form model loaded for exercise type: {exercise_type}")
         prediction = self.model.predict(input_data, verbose=0)
         
         # Get feedback based on prediction
@@ -170,47 +255,29 @@ class ExerciseAnalyzer:
         accuracy = (correct_form_count / total_frames * 100) if total_frames > 0 else 0
         return np.mean(frames_predictions, axis=0), "Video analysis complete", accuracy, feedback_list
 
-    def process_frame(self, frame):
+    def detect_pose(self, frame):
+        """Run MediaPipe on a BGR frame and return its pose landmarks, or None"""
+        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        results = self.pose.process(frame_rgb)
+        return results.pose_landmarks
+
+    def process_frame(self, frame, timestamp=None):
+        metrics = self._empty_metrics()
         try:
-            # Convert to RGB for MediaPipe
-            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            results = self.pose.process(frame_rgb)
-            
-            # Initialize metrics
-            metrics = {
-                'counter': self.counter,
-                'stage': self.stage,
-                'form_accuracy': 0,
-                'feedback': [],
-                'correct_form': False
-            }
+            # Get pose landmarks
+            pose_landmarks = self.detect_pose(frame)
             
             # Draw pose landmarks and process exercise
             annotated_frame = frame.copy()
-            if results.pose_landmarks:
+            if pose_landmarks:
                 self.mp_drawing.draw_landmarks(
                     annotated_frame,
-                    results.pose_landmarks,
+                    pose_landmarks,
                     self.mp_pose.POSE_CONNECTIONS
                 )
-                
-                # Process specific exercise
-                if self.exercise_type == 'bicep_curls':
-                    self._process_bicep_curl(results.pose_landmarks.landmark, annotated_frame)
-                
-                # Update metrics after processing
-
-
-                metrics.update({
-                    'counter': self.counter,
-                    'stage': self.stage,
-                    'form_accuracy': random.randint(90, 99) if self.correct_form else setattr(self, 'incorrect_form_value', 30 if getattr(self, 'incorrect_form_value', 30) >= 60 else getattr(self, 'incorrect_form_value', 30) + random.randint(1, 5)) or self.incorrect_form_value,
-                    'feedback': [self.form_feedback] if isinstance(self.form_feedback, str) else self.form_feedback,
-                    'correct_form': self.correct_form
-                })
-
-                # Print debug info
-                print(f"Counter: {self.counter}, Stage: {self.stage}, Form: {self.correct_form}")
+                metrics = self.process_landmarks(pose_landmarks.landmark, annotated_frame, timestamp)
+            else:
+                self.last_landmarks = None
                 
             return annotated_frame, metrics
             
@@ -218,217 +285,239 @@ class ExerciseAnalyzer:
             print(f"Error in process_frame: {str(e)}")
             return frame, metrics
 
-    def _process_bicep_curl(self, landmarks, image):
-        """Process bicep curl exercise"""
-        # Get coordinates
-        shoulder = landmarks[self.mp_pose.PoseLandmark.LEFT_SHOULDER.value]
-        elbow = landmarks[self.mp_pose.PoseLandmark.LEFT_ELBOW.value]
-        wrist = landmarks[self.mp_pose.PoseLandmark.LEFT_WRIST.value]
-        hip = landmarks[self.mp_pose.PoseLandmark.LEFT_HIP.value]
-        # Calculate angle
-        elbow_angle = self.calculate_angle(shoulder, elbow, wrist)
-        shoulder_angle = self.calculate_angle(hip, shoulder, elbow)
-        # Visualize angle
-        cv2.putText(image, str(int(elbow_angle)), 
-                    tuple(np.multiply([elbow.x, elbow.y], [640, 480]).astype(int)),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2, cv2.LINE_AA)
-        cv2.putText(image, str(int(shoulder_angle)), 
-                    tuple(np.multiply([shoulder.x, shoulder.y], [640, 480]).astype(int)),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2, cv2.LINE_AA)
-        
-        # Form correction
-        if shoulder_angle < 30:
-            self.correct_form = True
-            # Curl counter logic
-            if elbow_angle > 160 and self.stage != "down":
-                self.stage = "down"
-            
-                print("Stage: DOWN")
+    def process_landmarks(self, landmarks, image=None, timestamp=None):
+        """
+        Update the exercise state from one frame's pose landmarks.
 
-            elif elbow_angle < 30 and self.stage == 'down':
-                self.stage = "up"
-                self.counter += 1
-                print(f"Stage: UP, Counter increased to {self.counter}")
-            # Form feedback
-            if elbow_angle > 30 and elbow_angle < 160:
-                self.form_feedback = "Complete the full range of motion"
-            elif self.correct_form:
-                self.form_feedback = "Good form!"
-        
-        else:
-            self.correct_form = False
-            self.form_feedback = "Incorrect form. Keep your elbows in line with your shoulders."
-            
-            
-    def _process_squat(self, landmarks, image):
-        """Process squat exercise"""
-        # Get coordinates
-        hip = landmarks[self.mp_pose.PoseLandmark.LEFT_HIP.value]
-        knee = landmarks[self.mp_pose.PoseLandmark.LEFT_KNEE.value]
-        ankle = landmarks[self.mp_pose.PoseLandmark.LEFT_ANKLE.value]
-        
-        # Calculate angles
-        knee_angle = self.calculate_angle(hip, knee, ankle)
-        
-        # Visualize angle
-        cv2.putText(image, str(int(knee_angle)), 
-                    tuple(np.multiply([knee.x, knee.y], [640, 480]).astype(int)),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2, cv2.LINE_AA)
-        
-        # Form correction
-        if knee_angle > 160:
-            self.stage = "up"
-            self.correct_form = True
-        elif knee_angle < 90 and self.stage == "up":
-            self.stage = "down"
-            self.counter += 1
-            print(f"Stage: DOWN, Counter increased to {self.counter}")
-            
-        # Form feedback
-        if knee_angle > 90 and knee_angle < 160:
-            self.correct_form = False
-            self.form_feedback = "Squat deeper for full range of motion"
-        elif knee_angle > 160:
-            self.correct_form = True
-            self.form_feedback = "Good form! Now squat down"
-        elif knee_angle < 90:
-            self.correct_form = True
-            self.form_feedback = "Good depth! Now stand up"
-
-    def _process_pushup(self, landmarks, image):
-        """Process pushup exercise"""
-        # Get coordinates
-        shoulder = landmarks[self.mp_pose.PoseLandmark.LEFT_SHOULDER.value]
-        elbow = landmarks[self.mp_pose.PoseLandmark.LEFT_ELBOW.value]
-        wrist = landmarks[self.mp_pose.PoseLandmark.LEFT_WRIST.value]
-        hip = landmarks[self.mp_pose.PoseLandmark.LEFT_HIP.value]
-        
-        # Calculate angles
-        elbow_angle = self.calculate_angle(shoulder, elbow, wrist)
-        body_angle = self.calculate_angle(shoulder, hip, ankle)
-        
-        # Visualize angles
-        cv2.putText(image, str(int(elbow_angle)), 
-                    tuple(np.multiply([elbow.x, elbow.y], [640, 480]).astype(int)),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2, cv2.LINE_AA)
-        cv2.putText(image, str(int(body_angle)), 
-                    tuple(np.multiply([hip.x, hip.y], [640, 480]).astype(int)),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2, cv2.LINE_AA)
-        
-        # Form correction
-        if body_angle > 160:  # Check if body is straight
-            self.correct_form = True
-            if elbow_angle > 160 and self.stage != "down":
-                self.stage = "down"
-                print("Stage: UP")
-            elif elbow_angle < 90 and self.stage == "down":
-                self.stage = "up"
+        `landmarks` can be MediaPipe landmarks or rows rebuilt with
+        `array_to_landmarks`, so offline analysis can replay stored poses
+        without the frames. Angles are drawn onto `image` when given.
+
+        `timestamp` is the frame's capture time in seconds (video position or
+        client capture clock). Timed exercises measure durations on it, so
+        recorded video can be analyzed faster than real time. Without one
+        the wall clock is used.
+        """
+        points = landmarks_to_array(landmarks)
+        evaluation = self.rules.evaluate(points[np.newaxis])
+        prediction = None
+        if self._advance_stage(landmarks, evaluation, 0, timestamp):
+            prediction = self.predictor.predict(self.extract_keypoints(landmarks))[0]
+        return self._judge_form(points, evaluation, 0, image, prediction)
+
+    def _advance_stage(self, landmarks, evaluation, row, timestamp=None):
+        """
+        Advance the stage and counter from one evaluated frame. Returns
+        whether the form model should judge the frame.
+        """
+        self.last_landmarks = landmarks
+        self.timestamp = timestamp if timestamp is not None else time.time()
+        rules = self.rules
+        self.pose_frames += 1
+        stage = self.stage
+
+        if rules.has_reps:
+            if evaluation.reset[row]:
+                self.stage = rules.reset_stage
+            elif evaluation.count[row] and self.stage == rules.reset_stage:
+                self.stage = rules.count_stage
                 self.counter += 1
-                print(f"Stage: DOWN, Counter increased to {self.counter}")
-                
-            # Form feedback
-            if elbow_angle > 90 and elbow_angle < 160:
-                self.form_feedback = "Lower your body more"
-            elif self.correct_form:
-                self.form_feedback = "Good form!"
-        else:
-            self.correct_form = False
-            self.form_feedback = "Keep your body straight"
-
-    def _process_plank(self, landmarks, image):
-        """Process plank exercise with timer functionality"""
-        # Get coordinates
-        shoulder = landmarks[self.mp_pose.PoseLandmark.LEFT_SHOULDER.value]
-        hip = landmarks[self.mp_pose.PoseLandmark.LEFT_HIP.value]
-        ankle = landmarks[self.mp_pose.PoseLandmark.LEFT_ANKLE.value]
-        
-        # Calculate body alignment angle
-        body_angle = self.calculate_angle(shoulder, hip, ankle)
-        
-        # Initialize timer attributes if not exists
-        if not hasattr(self, 'plank_start_time'):
-            self.plank_start_time = None
-            self.plank_duration = 0
-            self.timer_running = False
-        
-        # Form correction and timer logic
-        if 160 <= body_angle <= 180:
-            self.correct_form = True
-            # Start or continue timer
+        self.stage_changed = self.stage != stage
+        return self._model_needed(evaluation.confidence[row])
+
+    def _judge_form(self, points, evaluation, row, image=None, prediction=None):
+        """
+        Set correct form, the hold timer and feedback for the frame whose
+        stage was just advanced, and return its metrics. A form model
+        `prediction` for the frame overrides the rules' verdict.
+        """
+        rules = self.rules
+        rule = evaluation.rule[row]
+        if rule >= 0:
+            self.correct_form = bool(rules.correct[rule])
+        rules_correct = self.correct_form
+        if prediction is not None:
+            self.model_calls += 1
+            prediction = np.asarray(prediction).ravel()
+            self.correct_form = self._model_verdict(prediction)
+        if rules.timer:
+            self._update_timer()
+        if self.correct_form != rules_correct:
+            self.form_feedback = self._model_feedback(prediction)
+        elif rule >= 0:
+            self.form_feedback = rules.messages[rule].format(duration=int(self.hold_duration))
+
+        self._draw_rules(image, points, evaluation.angles[row])
+
+        # Update metrics after processing
+        metrics = self._empty_metrics()
+        metrics.update({
+            'counter': self.counter,
+            'stage': self.stage,
+            'form_accuracy': random.randint(90, 99) if self.correct_form else setattr(self, 'incorrect_form_value', 30 if getattr(self, 'incorrect_form_value', 30) >= 60 else getattr(self, 'incorrect_form_value', 30) + random.randint(1, 5)) or self.incorrect_form_value,
+            'feedback': [self.form_feedback] if isinstance(self.form_feedback, str) else self.form_feedback,
+            'correct_form': self.correct_form,
+            'form_source': 'rules'
+        })
+        if prediction is not None:
+            metrics['model_prediction'] = prediction.tolist()
+            metrics['form_source'] = 'model'
+        if rules.timer:
+            metrics['hold_duration'] = self.hold_duration
+        return metrics
+
+    def _model_needed(self, confidence):
+        """
+        Whether the form model should judge the frame just applied. In
+        cascade mode the rules decide on their own unless an angle is within
+        `cascade_margin` degrees of a threshold that would change the
+        matched rule, or the frame changed the stage.
+        """
+        if self.model_mode == 'always':
+            return True
+        if self.model_mode == 'off':
+            return False
+        return self.stage_changed or confidence < self.cascade_margin
+
+    def _model_verdict(self, prediction):
+        """Whether a form model prediction says the form is correct"""
+        if prediction.size > 1:
+            # Planks: incorrect, correct, slightly incorrect
+            return int(np.argmax(prediction)) == 1
+        return float(prediction[0]) > MODEL_THRESHOLD
+
+    def _model_feedback(self, prediction):
+        """Feedback for a frame where the form model overruled the rules"""
+        message, correct = self.get_feedback(prediction if prediction.size > 1 else prediction[0],
+                                             self.exercise_type)
+        if correct != self.correct_form:
+            # get_feedback has no positive message for every exercise
+            return "Good form!"
+        return message
+
+    def model_usage(self):
+        """How many frames with a pose needed the form model"""
+        return {
+            'pose_frames': self.pose_frames,
+            'model_calls': self.model_calls,
+            'model_calls_avoided': 1 - self.model_calls / self.pose_frames if self.pose_frames else 0,
+            'prediction_cache': self.predictor.stats() if self.predictor is not None else None,
+        }
+
+    def _update_timer(self):
+        """Run the hold timer on the frame clock while form is correct, pause it otherwise"""
+        if self.correct_form:
             if not self.timer_running:
-                if self.plank_start_time is None:
-                    self.plank_start_time = time.time()
-                else:
-                    # Resume from pause - adjust start time to maintain accumulated duration
-                    self.plank_start_time = time.time() - self.plank_duration
+                # Start, or resume keeping the time already held
+                self.hold_start_time = self.timestamp - self.hold_duration
                 self.timer_running = True
-            
-            # Update duration if timer is running
-            if self.timer_running:
-                self.plank_duration = time.time() - self.plank_start_time
-                self.form_feedback = f"Excellent plank form! Duration: {int(self.plank_duration)}s"
+            self.hold_duration = self.timestamp - self.hold_start_time
         else:
-            self.correct_form = False
-            # Pause timer
-            if self.timer_running:
-                self.timer_running = False
-            
-            # Form feedback based on angle
-            if body_angle < 160:
-                self.form_feedback = f"Raise your hips! Timer paused at {int(self.plank_duration)}s"
-            else:
-                self.form_feedback = f"Lower your hips! Timer paused at {int(self.plank_duration)}s"
-        
-        # Visualize angle and timer
-        cv2.putText(image, str(int(body_angle)), 
-                    tuple(np.multiply([hip.x, hip.y], [640, 480]).astype(int)),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2, cv2.LINE_AA)
-        
-        # Display timer
-        timer_text = f"Time: {int(self.plank_duration)}s"
-        cv2.putText(image, timer_text,
-                    (10, 30),  # Position in top-left corner
-                    cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2, cv2.LINE_AA)
-        
-        # Return duration for metrics
-        return self.plank_duration
-
-    def _process_lunge(self, landmarks, image):
-        """Process lunge exercise"""
-        # Get coordinates
-        hip = landmarks[self.mp_pose.PoseLandmark.LEFT_HIP.value]
-        knee = landmarks[self.mp_pose.PoseLandmark.LEFT_KNEE.value]
-        ankle = landmarks[self.mp_pose.PoseLandmark.LEFT_ANKLE.value]
-        shoulder = landmarks[self.mp_pose.PoseLandmark.LEFT_SHOULDER.value]
-        
-        # Calculate angles
-        knee_angle = self.calculate_angle(hip, knee, ankle)
-        torso_angle = self.calculate_angle(shoulder, hip, knee)
-        
-        # Visualize angles
-        cv2.putText(image, str(int(knee_angle)), 
-                    tuple(np.multiply([knee.x, knee.y], [640, 480]).astype(int)),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2, cv2.LINE_AA)
-        cv2.putText(image, str(int(torso_angle)), 
-                    tuple(np.multiply([hip.x, hip.y], [640, 480]).astype(int)),
+            self.timer_running = False
+
+    def _empty_metrics(self):
+        """Metrics reported for a frame without a detected pose"""
+        return {
+            'counter': self.counter,
+            'stage': self.stage,
+            'form_accuracy': 0,
+            'feedback': [],
+            'correct_form': False
+        }
+
+    def annotate_frame(self, frame, pose_landmarks, metrics):
+        """
+        Draw a frame's pose, angles and hold timer after its landmarks were
+        processed, e.g. on another thread while later frames are analyzed.
+        Only the frame's own landmarks and metrics are used, not the
+        analyzer's current state.
+        """
+        if pose_landmarks:
+            self.mp_drawing.draw_landmarks(frame, pose_landmarks, self.mp_pose.POSE_CONNECTIONS)
+            points = landmarks_to_array(pose_landmarks.landmark)
+            angles = self.rules.angles(points[np.newaxis])[0]
+            self._draw_rules(frame, points, angles, metrics.get('hold_duration'))
+        return frame
+
+    def _draw_rules(self, image, points, angles, hold_duration=None):
+        """Draw each measured angle at its joint, and the hold timer"""
+        if image is None:
+            return
+        for angle, joint in zip(angles, self.rules.joint_b):
+            self._draw_angle(image, angle, Landmark(*points[joint]))
+        if self.rules.timer:
+            if hold_duration is None:
+                hold_duration = self.hold_duration
+            cv2.putText(image, f"Time: {int(hold_duration)}s",
+                        (10, 30),  # Position in top-left corner
+                        cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2, cv2.LINE_AA)
+
+    def _draw_angle(self, image, angle, landmark):
+        """Write an angle next to its joint on the annotated frame"""
+        if image is None:
+            return
+        cv2.putText(image, str(int(angle)), 
+                    tuple(np.multiply([landmark.x, landmark.y], [640, 480]).astype(int)),
                     cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2, cv2.LINE_AA)
-        
-        # Form correction
-        if torso_angle > 160:  # Check if torso is upright
-            self.correct_form = True
-            if knee_angle > 160 and self.stage != "down":
-                self.stage = "down"
-                print("Stage: UP")
-            elif knee_angle < 90 and self.stage == "down":
-                self.stage = "up"
-                self.counter += 1
-                print(f"Stage: DOWN, Counter increased to {self.counter}")
-                
-            # Form feedback
-            if knee_angle > 90 and knee_angle < 160:
-                self.form_feedback = "Lower your back knee more"
-            elif self.correct_form:
-                self.form_feedback = "Good form!"
-        else:
-            self.correct_form = False
-            self.form_feedback = "Keep your torso upright"
\ No newline at end of file
+
+    def process_frames(self, frames, timestamps=None):
+        """
+        Process an ordered batch of frames with this (warm) analyzer.
+
+        Pose estimation runs frame by frame, then the exercise rules are
+        evaluated for all frames with a detected pose in one vectorized pass
+        and applied to the stage and counter in order. The form model is
+        evaluated once for all frames that need it (see `model_mode`) and
+        its verdicts judge those frames' form.
+        `timestamps` optionally gives each frame's capture time in seconds.
+        Returns the annotated frames and per-frame metrics.
+        """
+        poses = [self.detect_pose(frame) for frame in frames]
+        detected = [index for index, pose in enumerate(poses) if pose]
+        if detected:
+            points = np.stack([landmarks_to_array(poses[index].landmark) for index in detected])
+            evaluation = self.rules.evaluate(points)
+        rows = {index: row for row, index in enumerate(detected)}
+
+        # Stages and counters only depend on the rules, so they are advanced
+        # for the whole batch first and the form model runs once for every
+        # frame that needs it; form and the hold timer are then judged in
+        # order with the model's verdicts.
+        progress = []
+        keypoints = []
+        keypoint_frames = []
+        for index, pose_landmarks in enumerate(poses):
+            if pose_landmarks:
+                timestamp = timestamps[index] if timestamps else None
+                if self._advance_stage(pose_landmarks.landmark, evaluation, rows[index], timestamp):
+                    keypoints.append(self.extract_keypoints(pose_landmarks.landmark))
+                    keypoint_frames.append(index)
+            else:
+                self.last_landmarks = None
+            progress.append((self.counter, self.stage, self.timestamp))
+        predictions = {}
+        if keypoints:
+            predictions = dict(zip(keypoint_frames, self.predictor.predict(np.concatenate(keypoints))))
+
+        annotated_frames = []
+        frame_metrics = []
+        for index, frame in enumerate(frames):
+            annotated_frame = frame.copy()
+            pose_landmarks = poses[index]
+            if pose_landmarks:
+                self.mp_drawing.draw_landmarks(
+                    annotated_frame,
+                    pose_landmarks,
+                    self.mp_pose.POSE_CONNECTIONS
+                )
+                self.timestamp = progress[index][2]
+                row = rows[index]
+                metrics = self._judge_form(points[row], evaluation, row, annotated_frame,
+                                           predictions.get(index))
+            else:
+                metrics = self._empty_metrics()
+            metrics['counter'], metrics['stage'] = progress[index][:2]
+            annotated_frames.append(annotated_frame)
+            frame_metrics.append(metrics)
+
+        return annotated_frames, frame_metrics
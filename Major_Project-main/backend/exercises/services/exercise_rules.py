@@ -0,0 +1,235 @@
+from collections import namedtuple
+
+import mediapipe as mp
+import numpy as np
+
+PoseLandmark = mp.solutions.pose.PoseLandmark
+
+# Exercises as data. Each one names the joint angles it measures (angle at
+# the middle landmark), optionally a rep cycle on one angle and/or a hold
+# timer, and an ordered list of form rules. Conditions are
+# (angle, operator, value) and all of a rule's conditions must hold.
+#
+# reps:     the stage becomes `reset_stage` when the angle opens past
+#           `reset_above`, and a rep is counted when it then closes below
+#           `count_below` (stage `count_stage`). Frames failing `gate` leave
+#           the stage unchanged.
+# feedback: the first matching rule sets correct_form and the feedback
+#           message; when none matches both keep their previous values.
+#           Messages can use {duration}, the held time in whole seconds.
+# timer:    accumulate the time spent with correct form, pausing otherwise.
+EXERCISES = {
+    'bicep_curls': {
+        'angles': {
+            'elbow': ('LEFT_SHOULDER', 'LEFT_ELBOW', 'LEFT_WRIST'),
+            'shoulder': ('LEFT_HIP', 'LEFT_SHOULDER', 'LEFT_ELBOW'),
+        },
+        'reps': {
+            'angle': 'elbow',
+            'reset_above': 160, 'reset_stage': 'down',
+            'count_below': 30, 'count_stage': 'up',
+            'gate': [('shoulder', '<', 30)],
+        },
+        'feedback': [
+            ([('shoulder', '>=', 30)], False, "Incorrect form. Keep your elbows in line with your shoulders."),
+            ([('elbow', '>', 30), ('elbow', '<', 160)], True, "Complete the full range of motion"),
+            ([], True, "Good form!"),
+        ],
+    },
+    'squats': {
+        'angles': {
+            'knee': ('LEFT_HIP', 'LEFT_KNEE', 'LEFT_ANKLE'),
+        },
+        'reps': {
+            'angle': 'knee',
+            'reset_above': 160, 'reset_stage': 'up',
+            'count_below': 90, 'count_stage': 'down',
+        },
+        'feedback': [
+            ([('knee', '>', 90), ('knee', '<', 160)], False, "Squat deeper for full range of motion"),
+            ([('knee', '>', 160)], True, "Good form! Now squat down"),
+            ([('knee', '<', 90)], True, "Good depth! Now stand up"),
+        ],
+    },
+    'pushups': {
+        'angles': {
+            'elbow': ('LEFT_SHOULDER', 'LEFT_ELBOW', 'LEFT_WRIST'),
+            'body': ('LEFT_SHOULDER', 'LEFT_HIP', 'LEFT_ANKLE'),
+        },
+        'reps': {
+            'angle': 'elbow',
+            'reset_above': 160, 'reset_stage': 'down',
+            'count_below': 90, 'count_stage': 'up',
+            'gate': [('body', '>', 160)],
+        },
+        'feedback': [
+            ([('body', '<=', 160)], False, "Keep your body straight"),
+            ([('elbow', '>', 90), ('elbow', '<', 160)], True, "Lower your body more"),
+            ([], True, "Good form!"),
+        ],
+    },
+    'lunges': {
+        'angles': {
+            'knee': ('LEFT_HIP', 'LEFT_KNEE', 'LEFT_ANKLE'),
+            'torso': ('LEFT_SHOULDER', 'LEFT_HIP', 'LEFT_KNEE'),
+        },
+        'reps': {
+            'angle': 'knee',
+            'reset_above': 160, 'reset_stage': 'down',
+            'count_below': 90, 'count_stage': 'up',
+            'gate': [('torso', '>', 160)],
+        },
+        'feedback': [
+            ([('torso', '<=', 160)], False, "Keep your torso upright"),
+            ([('knee', '>', 90), ('knee', '<', 160)], True, "Lower your back knee more"),
+            ([], True, "Good form!"),
+        ],
+    },
+    'planks': {
+        'angles': {
+            'body': ('LEFT_SHOULDER', 'LEFT_HIP', 'LEFT_ANKLE'),
+        },
+        'timer': True,
+        'feedback': [
+            ([('body', '>=', 160), ('body', '<=', 180)], True, "Excellent plank form! Duration: {duration}s"),
+            ([('body', '<', 160)], False, "Raise your hips! Timer paused at {duration}s"),
+            ([], False, "Lower your hips! Timer paused at {duration}s"),
+        ],
+    },
+}
+
+OPERATORS = ('<', '<=', '>', '>=')
+
+# Per-frame outputs of CompiledRules.evaluate for a (N, 33, >=2) landmark array:
+# angles (N, A) degrees, rule (N,) index of the first matching feedback rule
+# or -1, reset / count (N,) rep triggers with the gate applied, confidence
+# (N,) distance in degrees from the nearest threshold that would change the
+# matched rule
+RuleEvaluation = namedtuple('RuleEvaluation', ['angles', 'rule', 'reset', 'count', 'confidence'])
+
+
+class CompiledRules:
+    """
+    An exercise definition compiled to index arrays.
+
+    Joint triplets become landmark index arrays, so every angle is computed
+    in one vectorized expression, and conditions become a (rules, conditions)
+    membership matrix, so all rules are matched with one comparison and one
+    matrix product. `evaluate` works on one frame or on a whole batch.
+    """
+
+    def __init__(self, exercise_type, definition):
+        self.exercise_type = exercise_type
+        self.angle_names = list(definition['angles'])
+        joints = np.array([[PoseLandmark[name].value for name in definition['angles'][angle]]
+                           for angle in self.angle_names], dtype=np.intp)
+        self.joint_a, self.joint_b, self.joint_c = joints.T
+
+        self._conditions = []
+        feedback = definition.get('feedback', [])
+        rule_conditions = [self._compile_conditions(conditions) for conditions, _, _ in feedback]
+        self.correct = np.array([correct for _, correct, _ in feedback], dtype=bool)
+        self.messages = [message for _, _, message in feedback]
+
+        reps = definition.get('reps')
+        self.has_reps = reps is not None
+        if self.has_reps:
+            self.rep_angle = self.angle_names.index(reps['angle'])
+            self.reset_above = reps['reset_above']
+            self.count_below = reps['count_below']
+            self.reset_stage = reps['reset_stage']
+            self.count_stage = reps['count_stage']
+            gate_conditions = self._compile_conditions(reps.get('gate', []))
+        else:
+            gate_conditions = []
+        self.timer = definition.get('timer', False)
+
+        # Conditions are normalized to `sign * angle < limit` (or <=) so they
+        # are all checked with two comparisons
+        self.condition_angle = np.array([angle for angle, _, _ in self._conditions], dtype=np.intp)
+        self.condition_sign = np.array([-1.0 if op[0] == '>' else 1.0 for _, op, _ in self._conditions])
+        self.condition_limit = np.array([value for _, _, value in self._conditions]) * self.condition_sign
+        self.condition_strict = np.array([op in ('<', '>') for _, op, _ in self._conditions], dtype=bool)
+        self.rule_matrix = np.zeros((len(rule_conditions), len(self._conditions)), dtype=np.int32)
+        for rule, conditions in enumerate(rule_conditions):
+            self.rule_matrix[rule, conditions] = 1
+        self.gate_conditions = np.array(gate_conditions, dtype=np.intp)
+
+    def _compile_conditions(self, conditions):
+        indices = []
+        for angle, op, value in conditions:
+            if op not in OPERATORS:
+                raise ValueError(f"Unknown operator in {self.exercise_type} rules: {op}")
+            condition = (self.angle_names.index(angle), op, float(value))
+            if condition not in self._conditions:
+                self._conditions.append(condition)
+            indices.append(self._conditions.index(condition))
+        return indices
+
+    def angles(self, points):
+        """(N, A) joint angles in degrees for a (N, 33, >=2) landmark array"""
+        points = np.asarray(points, dtype=np.float64)
+        a = points[:, self.joint_a, :2]
+        b = points[:, self.joint_b, :2]
+        c = points[:, self.joint_c, :2]
+        radians = (np.arctan2(c[..., 1] - b[..., 1], c[..., 0] - b[..., 0])
+                   - np.arctan2(a[..., 1] - b[..., 1], a[..., 0] - b[..., 0]))
+        angles = np.abs(radians * 180.0 / np.pi)
+        return np.where(angles > 180.0, 360 - angles, angles)
+
+    def evaluate(self, points):
+        """Evaluate every angle, rule and rep trigger for a batch of frames"""
+        angles = self.angles(points)
+        frames = len(angles)
+
+        values = angles[:, self.condition_angle] * self.condition_sign
+        met = np.where(self.condition_strict, values < self.condition_limit, values <= self.condition_limit)
+
+        # A rule matches when none of its conditions failed
+        failed = (~met).astype(np.int32) @ self.rule_matrix.T
+        matched = failed == 0
+        rule = np.where(matched.any(axis=1), matched.argmax(axis=1), -1) if matched.size else np.full(frames, -1)
+
+        if self.has_reps:
+            gate = met[:, self.gate_conditions].all(axis=1)
+            rep_angles = angles[:, self.rep_angle]
+            reset = gate & (rep_angles > self.reset_above)
+            count = gate & (rep_angles < self.count_below) & ~reset
+        else:
+            reset = count = np.zeros(frames, dtype=bool)
+
+        confidence = self._confidence(np.abs(values - self.condition_limit), met, rule)
+        return RuleEvaluation(angles, rule, reset, count, confidence)
+
+    def _confidence(self, margins, met, rule):
+        """
+        How far (degrees) the angles would have to move to change which rule
+        matches: every earlier rule must keep one failing condition and the
+        matched rule must keep all of its conditions.
+        """
+        frames, rules = len(margins), len(self.rule_matrix)
+        if not rules:
+            return np.full(frames, np.inf)
+        in_rule = self.rule_matrix.astype(bool)[np.newaxis]
+        margins = margins[:, np.newaxis, :]
+        # Margin of the rule's weakest condition, and of its strongest failing one
+        hold = np.where(in_rule, margins, np.inf).min(axis=2)
+        stay_failed = np.where(in_rule & ~met[:, np.newaxis, :], margins, -np.inf).max(axis=2)
+
+        earlier = np.arange(rules) < np.where(rule >= 0, rule, rules)[:, np.newaxis]
+        confidence = np.where(earlier, stay_failed, np.inf).min(axis=1)
+        matched = rule >= 0
+        confidence[matched] = np.minimum(confidence[matched], hold[matched, rule[matched]])
+        return confidence
+
+
+_compiled = {}
+
+
+def get_rules(exercise_type):
+    """Compiled rules for an exercise, built once per process"""
+    if exercise_type not in _compiled:
+        if exercise_type not in EXERCISES:
+            raise ValueError(f"No rules defined for exercise type: {exercise_type}")
+        _compiled[exercise_type] = CompiledRules(exercise_type, EXERCISES[exercise_type])
+    return _compiled[exercise_type]
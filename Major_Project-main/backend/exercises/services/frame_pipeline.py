@@ -0,0 +1,170 @@
+import base64
+import queue
+import threading
+import time
+
+import cv2
+import numpy as np
+
+# Passed down the stages to stop them
+_STOP = object()
+
+
+class LatestFrameSlot:
+    """
+    A one-item handoff where a new frame replaces one that has not been
+    picked up yet, so a busy pipeline always works on the latest frame
+    instead of building up a backlog.
+    """
+
+    def __init__(self):
+        self._item = None
+        self._stopped = False
+        self._condition = threading.Condition()
+
+    def put(self, item):
+        """
+        Offer an item, returning True when it replaced a waiting one. _STOP
+        is delivered after the waiting item, and nothing is taken after it.
+        """
+        with self._condition:
+            if self._stopped:
+                return False
+            if item is _STOP:
+                self._stopped = True
+                self._condition.notify()
+                return False
+            replaced = self._item is not None
+            self._item = item
+            self._condition.notify()
+            return replaced
+
+    def get(self):
+        with self._condition:
+            while self._item is None and not self._stopped:
+                self._condition.wait()
+            if self._item is None:
+                return _STOP
+            item, self._item = self._item, None
+            return item
+
+
+class FramePipeline:
+    """
+    Analyze one live session's frames in four overlapping stages.
+
+    Each stage runs on its own thread: JPEG decode, pose estimation, exercise
+    rules and form model, then drawing, JPEG encode and send. OpenCV and
+    MediaPipe release the GIL while they work, so while frame N is being
+    encoded frame N+1 can be in the rules stage and N+2 in pose estimation,
+    and a session's throughput is bounded by its slowest stage rather than
+    by the sum of all of them.
+
+    Frames enter through a LatestFrameSlot (a frame still waiting to be
+    decoded is dropped for a newer one) and move between stages through
+    bounded queues, so they keep their order and the analyzer sees them in
+    sequence. Only the pose stage uses the MediaPipe graph and only the rules
+    stage updates the exercise state.
+
+    `send` is called from the last stage's thread with each response dict.
+    """
+
+    STAGES = ('decode', 'pose', 'analyze', 'encode')
+
+    def __init__(self, analyzer, send, jpeg_quality=80):
+        self.analyzer = analyzer
+        self.send = send
+        self.jpeg_quality = jpeg_quality
+        self.submitted = 0
+        self.dropped = 0
+        self.completed = 0
+        self.stage_seconds = dict.fromkeys(self.STAGES, 0.0)
+
+        self._inbox = LatestFrameSlot()
+        queues = [queue.Queue(maxsize=1) for _ in self.STAGES[1:]]
+        inputs = [self._inbox] + queues
+        outputs = queues + [None]
+        self._threads = [
+            threading.Thread(target=self._run_stage, args=(name, inbox, outbox), daemon=True)
+            for name, inbox, outbox in zip(self.STAGES, inputs, outputs)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, data, timestamp):
+        """
+        Queue a client frame message ({'frame': data URL, 'frame_id'?}) captured
+        at `timestamp` seconds, replacing any frame that is still waiting.
+        """
+        self.submitted += 1
+        if self._inbox.put({'data': data, 'timestamp': timestamp}):
+            self.dropped += 1
+
+    def close(self):
+        """Stop the stages once the frames already in flight are done"""
+        self._inbox.put(_STOP)
+
+    def join(self, timeout=None):
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def stats(self):
+        return {
+            'submitted': self.submitted,
+            'dropped': self.dropped,
+            'completed': self.completed,
+            'stage_ms': {name: seconds / self.completed * 1000 if self.completed else 0
+                         for name, seconds in self.stage_seconds.items()},
+        }
+
+    def _run_stage(self, name, inbox, outbox):
+        stage = getattr(self, f'_{name}')
+        while True:
+            job = inbox.get()
+            if job is not _STOP:
+                started = time.perf_counter()
+                try:
+                    job = stage(job)
+                except Exception as e:
+                    print(f"Error in {name} stage: {str(e)}")
+                    job = None
+                self.stage_seconds[name] += time.perf_counter() - started
+                if job is None:
+                    continue
+            if outbox is not None:
+                outbox.put(job)
+            if job is _STOP:
+                return
+
+    def _decode(self, job):
+        frame_data = job['data']['frame'].split(',')[1]
+        np_arr = np.frombuffer(base64.b64decode(frame_data), np.uint8)
+        job['frame'] = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
+        return job if job['frame'] is not None else None
+
+    def _pose(self, job):
+        job['pose'] = self.analyzer.detect_pose(job['frame'])
+        return job
+
+    def _analyze(self, job):
+        if job['pose']:
+            job['metrics'] = self.analyzer.process_landmarks(job['pose'].landmark, timestamp=job['timestamp'])
+        else:
+            self.analyzer.last_landmarks = None
+            job['metrics'] = self.analyzer._empty_metrics()
+        return job
+
+    def _encode(self, job):
+        # The decoded frame is not used by earlier stages any more, so draw on it in place
+        processed_frame = self.analyzer.annotate_frame(job['frame'], job['pose'], job['metrics'])
+        _, buffer = cv2.imencode('.jpg', processed_frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        response = {
+            'type': 'frame_processed',
+            'frame': f"data:image/jpeg;base64,{base64.b64encode(buffer).decode('utf-8')}",
+            'metrics': job['metrics'],
+        }
+        # Echo the client's frame id so it can match responses to frames
+        if 'frame_id' in job['data']:
+            response['frame_id'] = job['data']['frame_id']
+        self.send(response)
+        self.completed += 1
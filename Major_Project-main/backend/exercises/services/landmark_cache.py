@@ -0,0 +1,65 @@
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+from django.conf import settings
+
+from .exercise_analysis import POSE_MODEL_VERSION
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_path(video_sha256, target_fps, dense_frames):
+    """
+    Location of the landmarks extracted from a video with the current pose
+    model. Sampling settings are part of the name because they decide which
+    frames have landmarks.
+    """
+    return os.path.join(
+        settings.LANDMARK_CACHE_DIR,
+        POSE_MODEL_VERSION,
+        video_sha256[:2],
+        f'{video_sha256}-fps{target_fps:g}-dense{dense_frames}.npz',
+    )
+
+
+def load_landmarks(video_sha256, target_fps, dense_frames):
+    """
+    Return the cached (indices, timestamps, landmarks, detected) arrays for
+    a video, or None when it has not been analyzed with these settings.
+    """
+    path = cache_path(video_sha256, target_fps, dense_frames)
+    try:
+        with np.load(path) as data:
+            return data['indices'], data['timestamps'], data['landmarks'], data['detected']
+    except (FileNotFoundError, OSError, KeyError, ValueError):
+        return None
+
+
+def save_landmarks(video_sha256, target_fps, dense_frames, indices, timestamps, landmarks, detected):
+    """Store a video's landmark series as float32 columns in an uncompressed npz"""
+    path = cache_path(video_sha256, target_fps, dense_frames)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Write next to the target and rename, so concurrent readers never see a partial file
+    fd, tmp_path = tempfile.mkstemp(suffix='.npz', dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(
+                f,
+                indices=np.asarray(indices, dtype=np.int64),
+                timestamps=np.asarray(timestamps, dtype=np.float64),
+                landmarks=np.asarray(landmarks, dtype=np.float32).reshape(-1, 33, 4),
+                detected=np.asarray(detected, dtype=bool),
+            )
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return path
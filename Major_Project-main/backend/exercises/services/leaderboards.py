@@ -0,0 +1,229 @@
+import bisect
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+
+METRICS = ('reps', 'form_accuracy', 'streak')
+WINDOWS = ('daily', 'weekly', 'all_time')
+# Streaks (each user's best) are already running values, so only ranked all-time
+METRIC_WINDOWS = {
+    'reps': WINDOWS,
+    'form_accuracy': WINDOWS,
+    'streak': ('all_time',),
+}
+# How long a finished daily or weekly board stays readable
+_WINDOW_TTL = {
+    'daily': timedelta(days=2),
+    'weekly': timedelta(days=8),
+}
+
+
+def window_period(window, day):
+    """The period of `window` a date falls in, as used in board keys"""
+    if window == 'daily':
+        return day.isoformat()
+    if window == 'weekly':
+        year, week, _ = day.isocalendar()
+        return f'{year}-W{week:02d}'
+    return 'all'
+
+
+def board_key(metric, window, exercise=None, day=None):
+    """Key of the board ranking `metric` over the `window` containing `day`, globally or for one exercise"""
+    period = window_period(window, day or timezone.localdate())
+    return f"leaderboard:{metric}:{exercise or 'all'}:{window}:{period}"
+
+
+class InMemoryLeaderboardBackend:
+    """
+    Sorted sets in process memory, for tests and single-process development.
+
+    Each board keeps its members' scores and a list of (score, member) kept
+    sorted with bisect, so ranks and pages are found by binary search. Ties
+    are ordered as Redis orders them. Nothing is shared between processes
+    or kept across restarts, and expiry is ignored.
+    """
+
+    def __init__(self):
+        self._scores = {}    # board -> {member: score}
+        self._ordered = {}   # board -> sorted [(score, member)]
+        self._totals = {}    # board -> {member: [sum, count]}
+        self._lock = threading.Lock()
+
+    def _set(self, board, member, score):
+        scores = self._scores.setdefault(board, {})
+        ordered = self._ordered.setdefault(board, [])
+        if member in scores:
+            del ordered[bisect.bisect_left(ordered, (scores[member], member))]
+        scores[member] = score
+        bisect.insort(ordered, (score, member))
+        return score
+
+    def increment(self, board, member, amount, ttl=None):
+        with self._lock:
+            return self._set(board, member, self._scores.get(board, {}).get(member, 0) + amount)
+
+    def set(self, board, member, score, ttl=None):
+        with self._lock:
+            return self._set(board, member, score)
+
+    def add_to_mean(self, board, member, value, ttl=None):
+        with self._lock:
+            totals = self._totals.setdefault(board, {}).setdefault(member, [0, 0])
+            totals[0] += value
+            totals[1] += 1
+            return self._set(board, member, totals[0] / totals[1])
+
+    def score(self, board, member):
+        with self._lock:
+            return self._scores.get(board, {}).get(member)
+
+    def rank(self, board, member):
+        """0-based position from the top, or None"""
+        with self._lock:
+            score = self._scores.get(board, {}).get(member)
+            if score is None:
+                return None
+            ordered = self._ordered[board]
+            return len(ordered) - 1 - bisect.bisect_left(ordered, (score, member))
+
+    def top(self, board, offset, limit):
+        """[(member, score)] from the `offset`-th highest score"""
+        with self._lock:
+            ordered = self._ordered.get(board, [])
+            end = len(ordered) - offset
+            return [(member, score) for score, member in reversed(ordered[max(end - limit, 0):max(end, 0)])]
+
+    def size(self, board):
+        with self._lock:
+            return len(self._scores.get(board, {}))
+
+    def clear(self):
+        with self._lock:
+            self._scores.clear()
+            self._ordered.clear()
+            self._totals.clear()
+
+
+class RedisLeaderboardBackend:
+    """
+    Sorted sets in Redis, shared by every worker. Updates are single atomic
+    commands (ZINCRBY, ZADD, or a script for running means), and ranks and
+    pages are O(log n) ZREVRANK / ZREVRANGE lookups.
+    """
+
+    # Adds a value to a member's running sum and count kept in a hash next
+    # to the board, and sets the member's score to the new mean
+    _ADD_TO_MEAN = """
+    local total = redis.call('HINCRBYFLOAT', KEYS[2], ARGV[1] .. ':sum', ARGV[2])
+    local count = redis.call('HINCRBY', KEYS[2], ARGV[1] .. ':count', 1)
+    local mean = tonumber(total) / count
+    redis.call('ZADD', KEYS[1], mean, ARGV[1])
+    if tonumber(ARGV[3]) > 0 then
+        redis.call('EXPIRE', KEYS[1], ARGV[3])
+        redis.call('EXPIRE', KEYS[2], ARGV[3])
+    end
+    return tostring(mean)
+    """
+
+    def __init__(self, url):
+        try:
+            import redis
+        except ImportError:
+            raise ImproperlyConfigured('The redis package is required for LEADERBOARD_BACKEND = "redis"')
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self._add_to_mean = self.client.register_script(self._ADD_TO_MEAN)
+
+    def _write(self, board, command, ttl):
+        pipeline = self.client.pipeline()
+        command(pipeline)
+        if ttl:
+            pipeline.expire(board, ttl)
+        return pipeline.execute()[0]
+
+    def increment(self, board, member, amount, ttl=None):
+        return self._write(board, lambda pipe: pipe.zincrby(board, amount, member), ttl)
+
+    def set(self, board, member, score, ttl=None):
+        self._write(board, lambda pipe: pipe.zadd(board, {member: score}), ttl)
+        return score
+
+    def add_to_mean(self, board, member, value, ttl=None):
+        return float(self._add_to_mean(keys=[board, f'{board}:totals'], args=[member, value, ttl or 0]))
+
+    def score(self, board, member):
+        return self.client.zscore(board, member)
+
+    def rank(self, board, member):
+        return self.client.zrevrank(board, member)
+
+    def top(self, board, offset, limit):
+        return self.client.zrevrange(board, offset, offset + limit - 1, withscores=True)
+
+    def size(self, board):
+        return self.client.zcard(board)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """The process-wide backend chosen by LEADERBOARD_BACKEND"""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            if settings.LEADERBOARD_BACKEND == 'redis':
+                _backend = RedisLeaderboardBackend(settings.LEADERBOARD_REDIS_URL)
+            elif settings.LEADERBOARD_BACKEND == 'memory':
+                _backend = InMemoryLeaderboardBackend()
+            else:
+                raise ImproperlyConfigured(f'Unknown LEADERBOARD_BACKEND {settings.LEADERBOARD_BACKEND!r}')
+        return _backend
+
+
+def record_workout(user_id, exercise=None, reps=0, form_accuracy=None, streak=None, day=None):
+    """
+    Add a completed workout to every board it counts towards: reps and form
+    accuracy for today, this week and all time, both globally and for the
+    exercise, and the user's best streak.
+    """
+    backend = get_backend()
+    day = day or timezone.localdate()
+    member = str(user_id)
+    for window in WINDOWS:
+        ttl = int(_WINDOW_TTL[window].total_seconds()) if window in _WINDOW_TTL else None
+        for scope in (None, exercise) if exercise else (None,):
+            if reps:
+                backend.increment(board_key('reps', window, scope, day), member, reps, ttl)
+            if form_accuracy is not None:
+                backend.add_to_mean(board_key('form_accuracy', window, scope, day), member, form_accuracy, ttl)
+    if streak is not None:
+        backend.set(board_key('streak', 'all_time'), member, streak)
+
+
+def _score_value(metric, score):
+    return round(score, 2) if metric == 'form_accuracy' else int(score)
+
+
+def leaderboard(metric, window, exercise=None, user_id=None, offset=0, limit=20):
+    """
+    A page of a board from its `offset`-th place, with the board's size and,
+    when `user_id` is given, that user's rank and score
+    """
+    backend = get_backend()
+    key = board_key(metric, window, exercise)
+    entries = [
+        {'rank': offset + position + 1, 'user_id': int(member), 'score': _score_value(metric, score)}
+        for position, (member, score) in enumerate(backend.top(key, offset, limit))
+    ]
+    result = {'total': backend.size(key), 'entries': entries, 'me': None}
+    if user_id is not None:
+        rank = backend.rank(key, str(user_id))
+        if rank is not None:
+            result['me'] = {'rank': rank + 1,
+                            'score': _score_value(metric, backend.score(key, str(user_id)))}
+    return result
@@ -0,0 +1,175 @@
+import atexit
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from authentication.models import User
+from ..models import Exercise, LiveSession
+from .session_ingest import ingest_sessions
+from .video_analysis import summarize_feedback
+from .write_behind import WriteBehindBuffer
+
+
+class LiveSessionTracker:
+    """
+    Per-session totals of a live WebSocket session, fed with each analyzed
+    frame's metrics, and the records checkpointed from them
+    """
+
+    def __init__(self, user_id, exercise_type, client_session_id):
+        self.user_id = user_id
+        self.exercise_type = exercise_type
+        self.client_session_id = client_session_id
+        self.reps = 0
+        self.pose_frames = 0
+        self.correct_frames = 0
+        self.feedback_counts = {}
+        self.started_at = None
+        self.last_checkpoint = None
+
+    def add_frame(self, metrics):
+        """Count a frame's metrics, returning whether a checkpoint is due"""
+        now = timezone.now()
+        if self.started_at is None:
+            self.started_at = self.last_checkpoint = now
+        self.reps = metrics.get('counter', self.reps)
+        if 'form_source' in metrics:
+            self.pose_frames += 1
+            if metrics.get('correct_form'):
+                self.correct_frames += 1
+            for item in metrics.get('feedback') or []:
+                self.feedback_counts[item] = self.feedback_counts.get(item, 0) + 1
+        if (now - self.last_checkpoint).total_seconds() >= settings.LIVE_SESSION_CHECKPOINT_INTERVAL:
+            self.last_checkpoint = now
+            return True
+        return False
+
+    def record(self, completed=False):
+        """The session's current totals, for persist_live_sessions; None before the first frame"""
+        if self.started_at is None:
+            return None
+        now = timezone.now()
+        return {
+            'client_session_id': self.client_session_id,
+            'user_id': self.user_id,
+            'exercise_type': self.exercise_type,
+            'reps': self.reps,
+            'duration': round((now - self.started_at).total_seconds()),
+            'form_accuracy': self.correct_frames / self.pose_frames * 100 if self.pose_frames else None,
+            'feedback': "\n".join(summarize_feedback(self.feedback_counts)),
+            'started_at': self.started_at,
+            'updated_at': now,
+            'completed': completed,
+        }
+
+
+def persist_live_sessions(records):
+    """
+    Write checkpoints and final summaries of live sessions in one transaction:
+    LiveSession rows are created or updated in bulk, and sessions completing
+    in this batch are recorded as workouts with one ingest per user. Each
+    user's records are written in their own savepoint, so records that fail
+    (or belong to a deleted user) are skipped without losing the others.
+    """
+    latest = {}
+    for record in records:
+        current = latest.get(record['client_session_id'])
+        if current is None or record['updated_at'] >= current['updated_at']:
+            latest[record['client_session_id']] = record
+    records = list(latest.values())
+    exercises = {}
+    for exercise in Exercise.objects.filter(
+            name__in={record['exercise_type'] for record in records}).order_by('id'):
+        exercises.setdefault(exercise.name, exercise)
+
+    with transaction.atomic():
+        # Locked so a user cannot be deleted before their sessions are committed
+        users = User.objects.select_for_update().order_by('pk').in_bulk(
+            {record['user_id'] for record in records})
+        existing = LiveSession.objects.select_for_update().in_bulk(
+            [record['client_session_id'] for record in records], field_name='client_session_id')
+        user_records = {}
+        for record in records:
+            if record['exercise_type'] not in exercises:
+                print(f"Not saving live session of unknown exercise {record['exercise_type']}")
+            elif record['user_id'] not in users:
+                print(f"Not saving live session {record['client_session_id']} of missing user {record['user_id']}")
+            else:
+                user_records.setdefault(record['user_id'], []).append(record)
+
+        for user_id, sessions in user_records.items():
+            try:
+                with transaction.atomic():
+                    _persist_user_sessions(users[user_id], sessions, existing, exercises)
+            except Exception as e:
+                print(f"Error saving {len(sessions)} live sessions of user {user_id}: {str(e)}")
+
+
+def _persist_user_sessions(user, records, existing, exercises):
+    """Create or update one user's LiveSession rows and record the completed ones as workouts"""
+    new, changed, completed = [], [], []
+    for record in records:
+        exercise = exercises[record['exercise_type']]
+        session = existing.get(record['client_session_id'])
+        if session is None:
+            session = LiveSession(user=user, exercise=exercise,
+                                  client_session_id=record['client_session_id'],
+                                  started_at=record['started_at'])
+            new.append(session)
+        elif session.user_id != user.pk:
+            print(f"Not saving live session {record['client_session_id']} of another user")
+            continue
+        elif session.completed:
+            # Already recorded; a checkpoint written late must not reopen it
+            continue
+        else:
+            changed.append(session)
+        for field in ('reps', 'duration', 'form_accuracy', 'feedback', 'completed', 'updated_at'):
+            setattr(session, field, record[field])
+        if record['completed']:
+            completed.append({
+                'client_session_id': record['client_session_id'],
+                'exercise_type': exercise.name,
+                'exercise': exercise,
+                'reps': record['reps'],
+                'duration': record['duration'],
+                'form_accuracy': record['form_accuracy'],
+                'feedback': record['feedback'],
+                'recorded_at': record['started_at'],
+            })
+
+    LiveSession.objects.bulk_create(new)
+    LiveSession.objects.bulk_update(
+        changed, ['reps', 'duration', 'form_accuracy', 'feedback', 'completed', 'updated_at'])
+    if completed:
+        ingest_sessions(user, completed)
+
+
+def _flush_live_sessions(records):
+    try:
+        persist_live_sessions(records)
+    finally:
+        # The flush thread is long-lived, like a request's thread it must not keep stale connections
+        close_old_connections()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_live_session_buffer():
+    """The process-wide write-behind buffer of live session records, drained at exit"""
+    global _buffer
+    with _buffer_lock:
+        if _buffer is None:
+            _buffer = WriteBehindBuffer(
+                _flush_live_sessions,
+                max_items=settings.LIVE_SESSION_BUFFER_SIZE,
+                flush_interval=settings.LIVE_SESSION_FLUSH_INTERVAL,
+                batch_size=settings.LIVE_SESSION_FLUSH_BATCH,
+                name='live-session-writer',
+            )
+            atexit.register(_buffer.drain)
+        return _buffer
@@ -0,0 +1,168 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from .exercise_analysis import ExerciseAnalyzer, array_to_landmarks, landmarks_to_array
+from .video_reader import FrameSampler
+
+# Warm analyzer owned by each pool process, built once by the initializer.
+# It only runs pose estimation, so the form model is never needed.
+_worker_analyzer = None
+
+# spawn, not fork: TensorFlow and MediaPipe do not survive forking a loaded process
+START_METHOD = 'spawn'
+
+
+def _init_worker(exercise_type):
+    global _worker_analyzer
+    _worker_analyzer = ExerciseAnalyzer(exercise_type, model_mode='off')
+
+
+def plan_chunks(total_frames, chunk_frames):
+    """Split [0, total_frames) into consecutive (start, stop) frame ranges"""
+    chunks = []
+    for start in range(0, total_frames, chunk_frames):
+        chunks.append((start, min(start + chunk_frames, total_frames)))
+    if chunks:
+        # The last chunk reads to EOF because container frame counts are estimates
+        chunks[-1] = (chunks[-1][0], None)
+    return chunks
+
+
+def _extract_chunk(video_path, start, stop, overlap, target_fps):
+    """
+    Run pose estimation over the sampled frames in [start, stop) of a video.
+
+    The pose tracker is reset first, so nothing carries over from a chunk
+    this process handled before, and the `overlap` frames before `start` are
+    fed through it and discarded, so tracking has converged by the first
+    frame of the chunk just as it would have in a sequential pass. Frames
+    are sampled on the fixed stride grid only: densifying around stage
+    transitions depends on the stage over the whole video, which a chunk
+    cannot know.
+    """
+    _worker_analyzer.reset_tracking()
+    sampler = FrameSampler(video_path, target_fps, start=max(0, start - overlap), stop=stop)
+    indices = []
+    timestamps = []
+    landmarks = []
+    detected = []
+    for index, timestamp, frame in sampler:
+        pose_landmarks = _worker_analyzer.detect_pose(frame)
+        if index < start:
+            continue
+        indices.append(index)
+        timestamps.append(timestamp)
+        if pose_landmarks:
+            landmarks.append(landmarks_to_array(pose_landmarks.landmark))
+            detected.append(True)
+        else:
+            landmarks.append(np.zeros((33, 4), dtype=np.float32))
+            detected.append(False)
+
+    return (start,
+            np.array(indices, dtype=np.int64),
+            np.array(timestamps, dtype=np.float64),
+            np.stack(landmarks) if landmarks else np.zeros((0, 33, 4), dtype=np.float32),
+            np.array(detected, dtype=bool))
+
+
+def extract_landmarks_parallel(exercise_type, video_path, total_frames, workers, chunk_frames,
+                               overlap, target_fps=None, progress_callback=None):
+    """
+    Extract per-frame pose landmarks for a whole video across a process pool.
+
+    Returns the sampled frame indices, their timestamps (ms), a (T, 33, 4)
+    float32 landmark array and a (T,) mask of frames where a pose was
+    detected, in frame order. Frames are sampled on the stride grid only, as
+    a sequential FrameSampler without `dense_frames` yields them; wrap the
+    result in a DensifiedReplay to add the frames sampled around stage
+    transitions. Rep counting is not done here: the caller replays the
+    stitched landmarks through a single analyzer, so the rep state machine
+    sees every frame in order and chunk boundaries cannot split or double
+    count a rep.
+    """
+    chunks = plan_chunks(total_frames, chunk_frames)
+    results = {}
+
+    context = multiprocessing.get_context(START_METHOD)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=_init_worker, initargs=(exercise_type,)) as pool:
+        futures = [pool.submit(_extract_chunk, video_path, start, stop, overlap, target_fps)
+                   for start, stop in chunks]
+        completed_frames = 0
+        for future in as_completed(futures):
+            start, *arrays = future.result()
+            results[start] = arrays
+            stop = dict(chunks)[start]
+            completed_frames += (stop if stop is not None else total_frames) - start
+            if progress_callback:
+                progress_callback(completed_frames, total_frames)
+
+    ordered = [results[start] for start, _ in chunks]
+    return tuple(np.concatenate([arrays[column] for arrays in ordered]) for column in range(4))
+
+
+class DensifiedReplay:
+    """
+    Replay landmarks extracted on the sampling grid in frame order, adding
+    the frames a sequential FrameSampler with `dense_frames` would sample.
+
+    Like FrameSampler, `densify()` (called by the consumer after a stage
+    transition) makes the next `dense_frames` source frames sampled. Grid
+    frames come from the extracted arrays; the extra frames in between are
+    decoded from the video and run through `analyzer`'s pose estimation as
+    they are reached, so the densified frames follow the stage exactly as in
+    a sequential pass while the bulk of pose estimation stays parallel.
+
+    Yields `(frame_index, timestamp_ms, landmarks or None)` tuples.
+    """
+
+    def __init__(self, analyzer, video_path, arrays, dense_frames):
+        self.analyzer = analyzer
+        self.video_path = video_path
+        self.arrays = arrays
+        self.dense_frames = dense_frames
+        self._dense_until = -1
+        self._index = -1
+        self._frames = None
+        self._next_frame = None
+
+    def densify(self, frames=None):
+        """Sample every frame for the next `frames` source frames"""
+        self._dense_until = max(self._dense_until, self._index + (frames or self.dense_frames))
+
+    def __iter__(self):
+        indices, timestamps, landmarks, detected = self.arrays
+        try:
+            for index, timestamp, frame_landmarks, has_pose in zip(indices, timestamps, landmarks, detected):
+                yield from self._dense_frames(int(index))
+                self._index = int(index)
+                yield self._index, float(timestamp), array_to_landmarks(frame_landmarks) if has_pose else None
+            # Densified frames after the last grid frame, up to the end of the video
+            yield from self._dense_frames(None)
+        finally:
+            if self._frames is not None:
+                self._frames.close()
+
+    def _dense_frames(self, stop):
+        """Frames after the current one and before `stop` that densifying samples"""
+        while self._index + 1 <= self._dense_until and (stop is None or self._index + 1 < stop):
+            frame = self._read(self._index + 1)
+            if frame is None:
+                return
+            index, timestamp, image = frame
+            self._index = index
+            pose_landmarks = self.analyzer.detect_pose(image)
+            yield index, timestamp, pose_landmarks.landmark if pose_landmarks else None
+
+    def _read(self, index):
+        """Decode source frame `index`, continuing the open reader when it is the next frame"""
+        if self._frames is None or self._next_frame != index:
+            if self._frames is not None:
+                self._frames.close()
+            self._frames = iter(FrameSampler(self.video_path, start=index))
+        frame = next(self._frames, None)
+        self._next_frame = index + 1
+        return frame
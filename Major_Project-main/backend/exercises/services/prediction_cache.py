@@ -0,0 +1,118 @@
+import threading
+from collections import OrderedDict, deque
+
+import numpy as np
+from django.conf import settings
+
+
+def pose_key(keypoints, grid):
+    """
+    Quantized, body-normalized form of a flattened (x, y, z, visibility)
+    keypoint vector. Positions are centred on the keypoints' mean and scaled
+    by their RMS distance from it, so the same pose maps to the same key
+    wherever and however large the person is in the frame.
+    """
+    points = np.asarray(keypoints, dtype=np.float64).reshape(-1, 4)
+    xyz = points[:, :3] - points[:, :3].mean(axis=0)
+    scale = np.sqrt((xyz[:, :2] ** 2).sum(axis=1).mean())
+    if scale > 0:
+        xyz /= scale
+    buckets = np.rint(np.column_stack((xyz, points[:, 3])) / grid).astype(np.int16)
+    return buckets.tobytes()
+
+
+class PredictionCache:
+    """
+    Approximate memoization of a form model's outputs, shared by every
+    analyzer that uses the model in a worker.
+
+    Outputs are kept in an LRU of `max_size` entries keyed by `pose_key`, so
+    users passing through nearly the same pose reuse one prediction. Every
+    `sample_every`-th hit is also run through the model to measure the error
+    the approximation introduces; once the mean absolute error over the last
+    `error_window` samples exceeds `max_error` the cache disables itself and
+    every call goes to the model again.
+    """
+
+    def __init__(self, model, max_size=None, grid=None, sample_every=None, max_error=None,
+                 error_window=100):
+        self.model = model
+        self.max_size = max_size if max_size is not None else settings.FORM_PREDICTION_CACHE_SIZE
+        self.grid = grid if grid is not None else settings.FORM_PREDICTION_CACHE_GRID
+        self.sample_every = sample_every if sample_every is not None else settings.FORM_PREDICTION_CACHE_SAMPLE_EVERY
+        self.max_error = max_error if max_error is not None else settings.FORM_PREDICTION_CACHE_MAX_ERROR
+        self.enabled = settings.FORM_PREDICTION_CACHE_ENABLED and self.max_size > 0
+        self.hits = 0
+        self.misses = 0
+        self.sampled = 0
+        self._errors = deque(maxlen=error_window)
+        self._entries = OrderedDict()  # pose key -> model output
+        self._lock = threading.Lock()
+
+    def predict(self, inputs):
+        """Model outputs for a batch of keypoint inputs, as model.predict would return them"""
+        inputs = np.asarray(inputs)
+        if not self.enabled or not len(inputs):
+            return self.model.predict(inputs, verbose=0)
+
+        keys = [pose_key(row, self.grid) for row in inputs]
+        outputs = [None] * len(inputs)
+        # Rows to run through the model: the first row of each missing key,
+        # and the hits sampled for the error estimate
+        rows, duplicates, sampled = [], [], []
+        with self._lock:
+            pending = set()
+            for row, key in enumerate(keys):
+                output = self._entries.get(key)
+                if output is None and key not in pending:
+                    self.misses += 1
+                    pending.add(key)
+                    rows.append(row)
+                    continue
+                self.hits += 1
+                if output is None:
+                    # Same pose as an earlier row of this batch
+                    duplicates.append(row)
+                    continue
+                self._entries.move_to_end(key)
+                outputs[row] = output
+                if self.sample_every and self.hits % self.sample_every == 0:
+                    sampled.append(row)
+
+        if rows or sampled:
+            predictions = np.asarray(self.model.predict(inputs[rows + sampled], verbose=0))
+            with self._lock:
+                for row, prediction in zip(rows + sampled, predictions):
+                    if outputs[row] is not None:
+                        self.sampled += 1
+                        self._errors.append(float(np.abs(prediction - outputs[row]).mean()))
+                    outputs[row] = prediction
+                    self._entries[keys[row]] = prediction
+                    self._entries.move_to_end(keys[row])
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+                self._check_error()
+            first_row = {keys[row]: row for row in reversed(rows)}
+            for row in duplicates:
+                outputs[row] = outputs[first_row[keys[row]]]
+        return np.stack(outputs)
+
+    def _check_error(self):
+        if len(self._errors) == self._errors.maxlen and np.mean(self._errors) > self.max_error:
+            print(f"Disabling form prediction cache: mean error {np.mean(self._errors):.3f} "
+                  f"exceeds {self.max_error}")
+            self.enabled = False
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0,
+                'sampled': self.sampled,
+                'mean_error': float(np.mean(self._errors)) if self._errors else 0,
+            }
@@ -0,0 +1,90 @@
+import numpy as np
+
+from .exercise_rules import get_rules
+
+
+def hysteresis_counts(reset, count):
+    """
+    Run the two-threshold stage machine over a whole series of rep triggers.
+
+    `reset` and `count` are the per-frame triggers from the compiled rules.
+    Returns a mask of the frames where a rep is counted: frames with a count
+    trigger whose most recent trigger before them was a reset, which is
+    exactly when the per-frame machine moves from the reset stage to the
+    count stage.
+    """
+    # Forward-fill the latest trigger: 1 = reset, 2 = count, 0 = none yet
+    trigger = np.where(reset, 1, np.where(count, 2, 0))
+    latest = np.where(trigger > 0, np.arange(len(trigger)), -1)
+    np.maximum.accumulate(latest, out=latest)
+    state = np.where(latest >= 0, trigger[np.maximum(latest, 0)], 0)
+    previous = np.concatenate(([0], state[:-1]))
+
+    return count & (previous == 1)
+
+
+def segment_reps(exercise_type, indices, timestamps, landmarks, detected=None):
+    """
+    Find the reps in a video's whole landmark series.
+
+    Takes the columns produced by offline pose extraction: frame indices,
+    timestamps (ms), a (T, 33, 4) landmark array and an optional mask of
+    frames with a detected pose (others are skipped, as the live analyzer
+    never sees them). Reps are found by vectorized hysteresis thresholding
+    on the same compiled rules as the live analyzer, so the count matches it.
+
+    Each rep runs from the last frame in the start position before it was
+    counted to the first frame back in the start position afterwards (or
+    the end of the video), with the joint's extreme angle as its peak.
+    Returns the rep count, the final stage and per-rep boundaries, range of
+    motion (degrees) and tempo (seconds).
+    """
+    rules = get_rules(exercise_type)
+    if not rules.has_reps:
+        raise ValueError(f"Rep segmentation is not supported for exercise type: {exercise_type}")
+
+    if detected is not None:
+        detected = np.asarray(detected, dtype=bool)
+        indices, timestamps, landmarks = indices[detected], timestamps[detected], landmarks[detected]
+    timestamps = np.asarray(timestamps, dtype=np.float64) / 1000
+    if not len(landmarks):
+        return {'reps': 0, 'stage': None, 'segments': []}
+
+    evaluation = rules.evaluate(landmarks)
+    angles = evaluation.angles[:, rules.rep_angle]
+    reset = evaluation.reset
+    counted = hysteresis_counts(reset, evaluation.count)
+    reset_frames = np.flatnonzero(reset)
+    count_frames = np.flatnonzero(counted)
+
+    starts = reset_frames[np.searchsorted(reset_frames, count_frames) - 1]
+    next_reset = np.searchsorted(reset_frames, count_frames, side='right')
+    complete = next_reset < len(reset_frames)
+    ends = np.where(complete, reset_frames[np.minimum(next_reset, len(reset_frames) - 1)], len(angles) - 1)
+
+    segments = []
+    for start, end, is_complete in zip(starts.tolist(), ends.tolist(), complete.tolist()):
+        window = angles[start:end + 1]
+        peak = start + int(np.argmin(window))
+        segments.append({
+            'start_frame': int(indices[start]),
+            'peak_frame': int(indices[peak]),
+            'end_frame': int(indices[end]),
+            'start': float(timestamps[start]),
+            'peak': float(timestamps[peak]),
+            'end': float(timestamps[end]),
+            'min_angle': float(window.min()),
+            'max_angle': float(window.max()),
+            'range_of_motion': float(window.max() - window.min()),
+            'time_to_peak': float(timestamps[peak] - timestamps[start]),
+            'time_from_peak': float(timestamps[end] - timestamps[peak]),
+            'duration': float(timestamps[end] - timestamps[start]),
+            'complete': bool(is_complete),
+        })
+
+    stage = None
+    if len(reset_frames):
+        last_reset = reset_frames[-1]
+        stage = rules.count_stage if len(count_frames) and count_frames[-1] > last_reset else rules.reset_stage
+
+    return {'reps': len(segments), 'stage': stage, 'segments': segments}
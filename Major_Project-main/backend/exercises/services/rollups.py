@@ -0,0 +1,73 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from ..models import DailyWorkoutRollup, UserExercise
+
+
+def summarize_rollups(rows):
+    """Total a set of daily rollup rows into one period's figures"""
+    totals = dict.fromkeys(DailyWorkoutRollup.COUNTERS, 0)
+    for row in rows:
+        for name in totals:
+            totals[name] += row[name]
+    accuracy_count = totals.pop('form_accuracy_count')
+    accuracy_sum = totals.pop('form_accuracy_sum')
+    totals['form_accuracy'] = accuracy_sum / accuracy_count if accuracy_count else None
+    return totals
+
+
+def workout_periods(user_id, today=None):
+    """
+    This week's (from Monday) and this month's workouts, reps, duration and
+    mean form accuracy, read from at most 31 daily rollup rows in one query
+    """
+    today = today or timezone.localdate()
+    week_start = today - timedelta(days=today.weekday())
+    month_start = today.replace(day=1)
+    rows = list(DailyWorkoutRollup.objects
+                .filter(user_id=user_id, date__gte=min(week_start, month_start), date__lte=today)
+                .values('date', *DailyWorkoutRollup.COUNTERS))
+    return {
+        'week': summarize_rollups(row for row in rows if row['date'] >= week_start),
+        'month': summarize_rollups(row for row in rows if row['date'] >= month_start),
+    }
+
+
+def rebuild_rollups(user_ids=None, batch_size=1000):
+    """
+    Recompute the daily rollups of `user_ids` (default: every user) from
+    their UserExercise history with one grouped query, replacing the
+    existing rows. Returns the number of rollup rows written.
+    """
+    workouts = UserExercise.objects.all()
+    rollups = DailyWorkoutRollup.objects.all()
+    if user_ids is not None:
+        workouts = workouts.filter(user_id__in=user_ids)
+        rollups = rollups.filter(user_id__in=user_ids)
+
+    days = (workouts
+            .annotate(date=TruncDate('created_at'))
+            .values('user_id', 'date')
+            .annotate(
+                total_workouts=Count('id'),
+                total_reps=Coalesce(Sum('reps'), 0),
+                total_duration=Coalesce(Sum('duration'), 0),
+                accuracy_sum=Coalesce(Sum('form_accuracy'), 0.0),
+                accuracy_count=Count('form_accuracy'),
+            )
+            .order_by())
+    with transaction.atomic():
+        rollups.delete()
+        created = DailyWorkoutRollup.objects.bulk_create((
+            DailyWorkoutRollup(
+                user_id=day['user_id'], date=day['date'], workouts=day['total_workouts'],
+                reps=day['total_reps'], duration=day['total_duration'],
+                form_accuracy_sum=day['accuracy_sum'], form_accuracy_count=day['accuracy_count'],
+            )
+            for day in days.iterator()
+        ), batch_size=batch_size)
+    return len(created)
@@ -0,0 +1,81 @@
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from authentication.cache import invalidate_dashboard
+from authentication.models import UserStats
+from ..cache import invalidate_analytics
+from ..models import DailyWorkoutRollup, UserExercise
+
+
+def ingest_sessions(user, sessions):
+    """
+    Record completed workout sessions in one transaction: one bulk INSERT of
+    the UserExercise rows, one rollup update per day and one stats update for
+    the whole batch.
+
+    `sessions` are dicts with the session's `exercise` (an Exercise),
+    `client_session_id` (a UUID or None), reps, duration, form_accuracy,
+    calories_burned, feedback and optionally `recorded_at`. Sessions whose
+    client_session_id was already recorded for the user, earlier or in the
+    same batch, are skipped, so a retried upload does not count twice.
+
+    Returns (created UserExercise rows, {client_session_id: id} of the skipped
+    sessions that were recorded before).
+    """
+    try:
+        return _ingest_sessions(user, sessions)
+    except IntegrityError:
+        # The same sessions were uploaded concurrently and committed first;
+        # now they are found as duplicates
+        return _ingest_sessions(user, sessions)
+
+
+@transaction.atomic
+def _ingest_sessions(user, sessions):
+    session_ids = [session['client_session_id'] for session in sessions if session.get('client_session_id')]
+    recorded = dict(UserExercise.objects
+                    .filter(user=user, client_session_id__in=session_ids)
+                    .values_list('client_session_id', 'id')) if session_ids else {}
+
+    now = timezone.now()
+    new_sessions, seen = [], set(recorded)
+    for session in sessions:
+        session_id = session.get('client_session_id')
+        if session_id:
+            if session_id in seen:
+                continue
+            seen.add(session_id)
+        new_sessions.append(session)
+    if not new_sessions:
+        return [], recorded
+
+    created = UserExercise.objects.bulk_create([
+        UserExercise(
+            user=user,
+            exercise=session['exercise'],
+            client_session_id=session.get('client_session_id'),
+            reps=session.get('reps', 0),
+            duration=session.get('duration', 0),
+            form_accuracy=session.get('form_accuracy'),
+            feedback=session.get('feedback', ''),
+            created_at=session.get('recorded_at') or now,
+        )
+        for session in new_sessions
+    ])
+
+    # bulk_create does not send post_save, so do what its receivers would, once
+    DailyWorkoutRollup.add_workouts(user.pk, created)
+    invalidate_dashboard(user.pk)
+    invalidate_analytics(user.pk)
+    UserStats.objects.get(user=user).record_workouts([
+        {
+            'exercise_type': session['exercise'].name,
+            'reps': session.get('reps', 0),
+            'duration': session.get('duration', 0),
+            'form_accuracy': session.get('form_accuracy'),
+            'calories_burned': session.get('calories_burned', 0),
+            'date': timezone.localdate(user_exercise.created_at),
+        }
+        for session, user_exercise in zip(new_sessions, created)
+    ])
+    return created, recorded
@@ -0,0 +1,137 @@
+import hashlib
+import shutil
+import subprocess
+import tempfile
+import threading
+
+import numpy as np
+from django.conf import settings
+
+from .exercise_analysis import ExerciseAnalyzer
+from .video_analysis import _add_rep_segments, _record_landmarks, _stack_columns, summarize_landmarks
+
+
+class StreamingVideoAnalysis:
+    """
+    Analyze a video while its bytes are still being uploaded.
+
+    Chunks passed to `feed()` are spooled to a temporary file (kept as the
+    recording) and piped into an `ffmpeg` decoder, which resamples them to a
+    constant analysis rate and writes raw BGR frames back to a reader thread
+    that runs pose estimation and the exercise rules. By the time the last
+    chunk arrives most of the video has already been analyzed, so `finish()`
+    only waits for the decoder's tail.
+
+    Streaming needs a container that can be decoded front to back (WebM or
+    fragmented MP4, as produced by MediaRecorder). When ffmpeg is not
+    installed or cannot decode the stream, e.g. an MP4 with its index at the
+    end, `finish()` returns None and the spooled file has to be analyzed
+    in the background job queue instead.
+
+    `feed()` blocks on the decoder and `finish()` on its tail, so callers on
+    an event loop should run them on their own threads.
+    """
+
+    def __init__(self, exercise_type, target_fps=None):
+        self.exercise_type = exercise_type
+        if target_fps is None:
+            target_fps = settings.VIDEO_ANALYSIS_TARGET_FPS
+        # The decoder emits frames at a constant rate, which is what times them
+        self.fps = target_fps or 30
+        self.width = settings.STREAM_ANALYSIS_FRAME_WIDTH
+        self.height = settings.STREAM_ANALYSIS_FRAME_HEIGHT
+
+        self.spool = tempfile.NamedTemporaryFile(suffix='.video', delete=False)
+        self.bytes_received = 0
+        self.sha256 = hashlib.sha256()
+        self.results = None
+        self.error = None
+        self._process = None
+        self._reader = None
+
+    def start(self):
+        ffmpeg = shutil.which('ffmpeg')
+        if ffmpeg is None:
+            self.error = 'ffmpeg is not installed'
+            return
+        scale = (f'scale={self.width}:{self.height}:force_original_aspect_ratio=decrease,'
+                 f'pad={self.width}:{self.height}:(ow-iw)/2:(oh-ih)/2')
+        self._stderr = tempfile.TemporaryFile()
+        self._process = subprocess.Popen(
+            [ffmpeg, '-hide_banner', '-loglevel', 'error', '-i', 'pipe:0',
+             '-vf', f'fps={self.fps},{scale}', '-f', 'rawvideo', '-pix_fmt', 'bgr24', 'pipe:1'],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=self._stderr,
+        )
+        self._reader = threading.Thread(target=self._analyze_frames, daemon=True)
+        self._reader.start()
+
+    def feed(self, chunk):
+        """Spool an uploaded chunk and hand it to the decoder"""
+        self.spool.write(chunk)
+        self.sha256.update(chunk)
+        self.bytes_received += len(chunk)
+        if self._process is None or self.error:
+            return
+        try:
+            # Blocks while the analyzer is behind, pushing back on the upload
+            self._process.stdin.write(chunk)
+        except (BrokenPipeError, OSError):
+            self.error = 'Decoder stopped accepting data'
+
+    def finish(self):
+        """
+        Wait for the decoder to drain and return the analysis results, or
+        None when the stream could not be analyzed (see `error`)
+        """
+        self.spool.close()
+        if self._process is not None:
+            try:
+                self._process.stdin.close()
+            except (BrokenPipeError, OSError):
+                pass
+            self._reader.join()
+            if self._process.wait() != 0 and not self.error:
+                self._stderr.seek(0)
+                self.error = self._stderr.read().decode(errors='replace').strip() or 'Decoder failed'
+            self._stderr.close()
+
+        if self.results and self.results['analyzed_frames'] and not self.error:
+            return dict(self.results, streamed=True)
+        return None
+
+    def abort(self):
+        if self._process is not None:
+            self._process.kill()
+            self._process.wait()
+            self._reader.join()
+        self.spool.close()
+
+    def _iter_decoded_landmarks(self, analyzer):
+        frame_bytes = self.width * self.height * 3
+        index = 0
+        while True:
+            data = self._process.stdout.read(frame_bytes)
+            if len(data) < frame_bytes:
+                return
+            frame = np.frombuffer(data, dtype=np.uint8).reshape(self.height, self.width, 3)
+            pose_landmarks = analyzer.detect_pose(frame)
+            yield index, index / self.fps * 1000, pose_landmarks.landmark if pose_landmarks else None
+            index += 1
+
+    def _analyze_frames(self):
+        analyzer = None
+        try:
+            analyzer = ExerciseAnalyzer(self.exercise_type)
+            columns = ([], [], [], [])
+            frames_landmarks = _record_landmarks(self._iter_decoded_landmarks(analyzer), columns)
+            results = summarize_landmarks(analyzer, frames_landmarks)
+            # The same fields as analyze_video, rep segments included
+            self.results = _add_rep_segments(results, self.exercise_type, _stack_columns(*columns))
+        except Exception as e:
+            self.error = str(e)
+            # Keep draining so the decoder never blocks on a full pipe
+            while self._process.stdout.read(65536):
+                pass
+        finally:
+            if analyzer is not None:
+                analyzer.close()
@@ -0,0 +1,188 @@
+import numpy as np
+from django.conf import settings
+
+from .exercise_analysis import (
+    ANALYSIS_VERSION,
+    POSE_MODEL_VERSION,
+    ExerciseAnalyzer,
+    array_to_landmarks,
+    landmarks_to_array,
+)
+from .exercise_rules import get_rules
+from .landmark_cache import file_sha256, load_landmarks, save_landmarks
+from .parallel_video import DensifiedReplay, extract_landmarks_parallel
+from .rep_segmentation import segment_reps
+from .video_reader import FrameSampler
+
+
+def analysis_version():
+    """Identify everything that determines analyze_video's results for a given video"""
+    return (f'{POSE_MODEL_VERSION}/rules-{ANALYSIS_VERSION}'
+            f'/fps{settings.VIDEO_ANALYSIS_TARGET_FPS:g}-dense{settings.VIDEO_ANALYSIS_DENSE_FRAMES}')
+
+
+def summarize_feedback(feedback_counts, limit=3):
+    """Return the most common feedback messages, most frequent first"""
+    ranked = sorted(feedback_counts.items(), key=lambda item: item[1], reverse=True)
+    return [message for message, _ in ranked[:limit]]
+
+
+def _iter_landmarks(analyzer, sampler):
+    """Yield (frame_index, timestamp_ms, landmarks or None) from a sequential decode"""
+    for index, timestamp, frame in sampler:
+        pose_landmarks = analyzer.detect_pose(frame)
+        yield index, timestamp, pose_landmarks.landmark if pose_landmarks else None
+
+
+def _iter_stored_landmarks(indices, timestamps, landmarks, detected):
+    for index, timestamp, frame_landmarks, has_pose in zip(indices, timestamps, landmarks, detected):
+        yield int(index), float(timestamp), array_to_landmarks(frame_landmarks) if has_pose else None
+
+
+def _record_landmarks(frames_landmarks, columns):
+    """Pass frames through while collecting them into cacheable columns"""
+    indices, timestamps, landmarks, detected = columns
+    empty = np.zeros((33, 4), dtype=np.float32)
+    for index, timestamp, frame_landmarks in frames_landmarks:
+        indices.append(index)
+        timestamps.append(timestamp)
+        landmarks.append(landmarks_to_array(frame_landmarks) if frame_landmarks is not None else empty)
+        detected.append(frame_landmarks is not None)
+        yield index, timestamp, frame_landmarks
+
+
+def analyze_video(exercise_type, video_path, progress_callback=None, workers=None, target_fps=None,
+                  use_cache=None):
+    """
+    Run the exercise analyzer over a recorded video.
+
+    Frames are sampled at `target_fps` (default VIDEO_ANALYSIS_TARGET_FPS,
+    0 analyzes every frame) and sampling is densified for a few frames after
+    each stage transition. With `workers` > 1 (default VIDEO_ANALYSIS_WORKERS)
+    pose estimation is spread over a process pool in overlapping frame-range
+    chunks on the sampling grid, then the landmarks are replayed in order
+    through one analyzer so reps match a sequential pass. Where to densify
+    depends on the stage over the whole video, so the replay detects the
+    densified frames itself as transitions are reached (DensifiedReplay).
+
+    Per-rep boundaries, range of motion and tempo are segmented from the
+    whole landmark series in one vectorized pass (`rep_segments`).
+
+    The extracted landmarks are cached on disk under the video's SHA-256
+    and the pose model version (`use_cache`, default LANDMARK_CACHE_ENABLED),
+    so analyzing the same video again only replays the rules and models.
+
+    `progress_callback(processed_frames, total_frames)` is called as frames
+    are analyzed so long running jobs can report how far along they are.
+    Returns the overall reps, form accuracy, feedback and the duration
+    covered by the analyzed frames' timestamps.
+    """
+    workers = workers or settings.VIDEO_ANALYSIS_WORKERS
+    if target_fps is None:
+        target_fps = settings.VIDEO_ANALYSIS_TARGET_FPS
+    if use_cache is None:
+        use_cache = settings.LANDMARK_CACHE_ENABLED
+    dense_frames = settings.VIDEO_ANALYSIS_DENSE_FRAMES
+
+    analyzer = ExerciseAnalyzer(exercise_type)
+
+    try:
+        video_sha256 = file_sha256(video_path) if use_cache else None
+        cached = load_landmarks(video_sha256, target_fps, dense_frames) if use_cache else None
+        if cached is not None:
+            results = summarize_landmarks(analyzer, _iter_stored_landmarks(*cached))
+            if progress_callback:
+                progress_callback(results['total_frames'], results['total_frames'])
+            return _add_rep_segments(results, exercise_type, cached)
+
+        sampler = FrameSampler(video_path, target_fps, dense_frames=dense_frames)
+        total_frames = sampler.total_frames
+
+        chunk_frames = settings.VIDEO_ANALYSIS_CHUNK_FRAMES
+        if workers > 1 and total_frames and total_frames > chunk_frames:
+            arrays = extract_landmarks_parallel(
+                exercise_type, video_path, total_frames, workers, chunk_frames,
+                settings.VIDEO_ANALYSIS_CHUNK_OVERLAP, target_fps=target_fps,
+                progress_callback=progress_callback,
+            )
+            if dense_frames:
+                replay = DensifiedReplay(analyzer, video_path, arrays, dense_frames)
+                columns = ([], [], [], [])
+                results = summarize_landmarks(analyzer, _record_landmarks(replay, columns), replay)
+                arrays = _stack_columns(*columns)
+            else:
+                results = summarize_landmarks(analyzer, _iter_stored_landmarks(*arrays))
+        else:
+            columns = ([], [], [], [])
+            frames_landmarks = _record_landmarks(_iter_landmarks(analyzer, sampler), columns)
+            results = summarize_landmarks(analyzer, frames_landmarks, sampler,
+                                          progress_callback, total_frames)
+            arrays = _stack_columns(*columns)
+
+        if use_cache:
+            save_landmarks(video_sha256, target_fps, dense_frames, *arrays)
+        return _add_rep_segments(results, exercise_type, arrays)
+    finally:
+        analyzer.close()
+
+
+def _stack_columns(indices, timestamps, landmarks, detected):
+    return (np.array(indices, dtype=np.int64),
+            np.array(timestamps, dtype=np.float64),
+            np.stack(landmarks) if landmarks else np.zeros((0, 33, 4), dtype=np.float32),
+            np.array(detected, dtype=bool))
+
+
+def _add_rep_segments(results, exercise_type, arrays):
+    """Attach per-rep boundaries, range of motion and tempo from the landmark series"""
+    if get_rules(exercise_type).has_reps:
+        results['rep_segments'] = segment_reps(exercise_type, *arrays)['segments']
+    return results
+
+def summarize_landmarks(analyzer, frames_landmarks, sampler=None, progress_callback=None, total_frames=None):
+    """
+    Replay `(frame_index, timestamp_ms, landmarks or None)` through the
+    analyzer in order and aggregate the per-frame metrics into the video
+    results. When the frames come straight from a `sampler`, sampling is
+    densified around stage transitions and progress is reported per frame.
+    """
+    analyzed_frames = 0
+    correct_frames = 0
+    feedback_counts = {}
+    first_timestamp = last_timestamp = None
+    last_index = -1
+
+    for index, timestamp, landmarks in frames_landmarks:
+        analyzed_frames += 1
+        last_index = index
+        if first_timestamp is None:
+            first_timestamp = timestamp
+        last_timestamp = timestamp
+
+        if landmarks is not None:
+            stage = analyzer.stage
+            metrics = analyzer.process_landmarks(landmarks, timestamp=timestamp / 1000)
+            if sampler and analyzer.stage != stage:
+                sampler.densify()
+            if metrics.get('correct_form'):
+                correct_frames += 1
+            for item in metrics.get('feedback') or []:
+                feedback_counts[item] = feedback_counts.get(item, 0) + 1
+
+        if sampler and progress_callback:
+            progress_callback(index + 1, total_frames)
+
+    form_accuracy = (correct_frames / analyzed_frames * 100
+                     if analyzed_frames > 0 else 0)
+    duration = (last_timestamp - first_timestamp) / 1000 if analyzed_frames else 0
+
+    return {
+        'reps': analyzer.counter,
+        'form_accuracy': form_accuracy,
+        'feedback': summarize_feedback(feedback_counts),
+        'duration': duration,
+        'total_frames': last_index + 1,
+        'analyzed_frames': analyzed_frames,
+        'correct_frames': correct_frames,
+        'model_usage': analyzer.model_usage(),
+    }
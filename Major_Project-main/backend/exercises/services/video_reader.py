@@ -0,0 +1,62 @@
+import cv2
+
+
+class FrameSampler:
+    """
+    Iterate over a video file at a target analysis rate.
+
+    Frames that are not sampled are skipped with `grab()`, which advances
+    the demuxer without the cost of a full `retrieve()`/colour conversion.
+    Calling `densify()` temporarily samples every frame, e.g. around a
+    detected stage transition where timing matters most.
+
+    Yields `(frame_index, timestamp_ms, frame)` tuples. Timestamps come from
+    the container (`CAP_PROP_POS_MSEC`), falling back to index / FPS for
+    backends that do not report them.
+    """
+
+    def __init__(self, video_path, target_fps=None, start=0, stop=None, dense_frames=0):
+        self.video_path = video_path
+        self.start = start
+        self.stop = stop
+        self.dense_frames = dense_frames
+        self._dense_until = -1
+        self._cap = cv2.VideoCapture(video_path)
+        if not self._cap.isOpened():
+            raise ValueError(f'Could not open video: {video_path}')
+
+        self.source_fps = self._cap.get(cv2.CAP_PROP_FPS) or 0
+        self.total_frames = int(self._cap.get(cv2.CAP_PROP_FRAME_COUNT)) or None
+        if target_fps and self.source_fps > target_fps:
+            self.stride = max(1, round(self.source_fps / target_fps))
+        else:
+            self.stride = 1
+
+    def densify(self, frames=None):
+        """Sample every frame for the next `frames` source frames"""
+        self._dense_until = max(self._dense_until, self._index + (frames or self.dense_frames))
+
+    def __iter__(self):
+        if self.start:
+            self._cap.set(cv2.CAP_PROP_POS_FRAMES, self.start)
+        self._index = self.start
+        try:
+            while self.stop is None or self._index < self.stop:
+                # Sample on a grid anchored at frame 0 so chunked readers pick
+                # the same frames as a single sequential pass
+                if self._index % self.stride == 0 or self._index <= self._dense_until:
+                    ret, frame = self._cap.read()
+                    if not ret:
+                        break
+                    yield self._index, self._timestamp(self._index), frame
+                elif not self._cap.grab():
+                    break
+                self._index += 1
+        finally:
+            self._cap.release()
+
+    def _timestamp(self, index):
+        timestamp = self._cap.get(cv2.CAP_PROP_POS_MSEC)
+        if timestamp <= 0 and index > 0 and self.source_fps:
+            return index / self.source_fps * 1000
+        return timestamp
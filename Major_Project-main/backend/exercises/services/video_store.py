@@ -0,0 +1,66 @@
+import hashlib
+import os
+
+from django.core.files.storage import default_storage
+from django.db.models import F
+
+from ..models import AnalysisJob, UserExercise, VideoBlob
+from .video_analysis import analysis_version
+
+
+def _sha256(uploaded_file):
+    digest = hashlib.sha256()
+    for chunk in uploaded_file.chunks():
+        digest.update(chunk)
+    uploaded_file.seek(0)
+    return digest.hexdigest()
+
+
+def store_video(uploaded_file, sha256=None):
+    """
+    Store an uploaded video under its content address and take a reference
+    to it. Identical uploads share one VideoBlob and one file on disk.
+    """
+    sha256 = sha256 or getattr(uploaded_file, 'sha256', None) or _sha256(uploaded_file)
+    extension = os.path.splitext(uploaded_file.name or '')[1].lower() or '.mp4'
+
+    while True:
+        blob = VideoBlob.objects.filter(sha256=sha256).first()
+        if blob is None:
+            name = default_storage.save(f'exercise_videos/{sha256[:2]}/{sha256}{extension}', uploaded_file)
+            blob, created = VideoBlob.objects.get_or_create(
+                sha256=sha256, defaults={'file': name, 'size': uploaded_file.size})
+            if not created:
+                # Another request stored the same bytes first
+                default_storage.delete(name)
+        # Fails only if the last reference was released in the meantime
+        if VideoBlob.objects.filter(id=blob.id).update(ref_count=F('ref_count') + 1):
+            return blob
+
+
+def create_user_exercise(user, exercise, uploaded_file):
+    """Create a UserExercise whose recording is the deduplicated upload"""
+    blob = store_video(uploaded_file)
+    return UserExercise.objects.create(
+        user=user,
+        exercise=exercise,
+        video_blob=blob,
+        video_recording=blob.file.name,
+    )
+
+
+def previous_result(user_exercise):
+    """
+    Results of an earlier analysis of the same video bytes for the same
+    exercise by the current analysis version, or None.
+    """
+    if not user_exercise.video_blob_id:
+        return None
+    job = (AnalysisJob.objects
+           .filter(status=AnalysisJob.STATUS_SUCCEEDED,
+                   analysis_version=analysis_version(),
+                   user_exercise__video_blob_id=user_exercise.video_blob_id,
+                   user_exercise__exercise_id=user_exercise.exercise_id)
+           .order_by('-finished_at')
+           .first())
+    return job.result if job else None
@@ -0,0 +1,154 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class WriteBehindBuffer:
+    """
+    Records waiting to be written by a background thread, so callers on the
+    event loop never wait for the database.
+
+    Records are keyed, and a record replaces one still pending under the same
+    key (a newer checkpoint of a session supersedes the older one), so each
+    key is written at most once per flush. The thread calls `flush(records)`
+    with up to `batch_size` records every `flush_interval` seconds, or as
+    soon as a batch has filled up or `flush_soon` is called. Records of a
+    failed flush are retried with the next one, up to `max_attempts` times.
+
+    At most `max_items` records are held. When full, a new record evicts the
+    oldest droppable one (a checkpoint); if there is none, `put` refuses it
+    and the caller has to write it itself. `drain` writes everything still
+    pending and stops the thread; call it at shutdown.
+    """
+
+    def __init__(self, flush, max_items=1000, flush_interval=5.0, batch_size=200, max_attempts=3,
+                 name='write-behind'):
+        self.flush = flush
+        self.max_items = max_items
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.written = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.failed_flushes = 0
+        self._pending = OrderedDict()  # key -> (record, droppable, attempts)
+        self._condition = threading.Condition()
+        self._flushing = False
+        self._urgent = False
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def put(self, key, record, droppable=False):
+        """Queue a record, returning False when the buffer is full and the record was not taken"""
+        with self._condition:
+            if self._stopping:
+                return False
+            if key in self._pending:
+                self.coalesced += 1
+                # A record that must be kept stays so even when superseded by a droppable one
+                droppable = droppable and self._pending[key][1]
+                del self._pending[key]
+            elif len(self._pending) >= self.max_items and not self._evict_droppable():
+                if droppable:
+                    self.dropped += 1
+                return False
+            self._pending[key] = (record, droppable, 0)
+            if len(self._pending) >= self.batch_size:
+                self._condition.notify()
+            return True
+
+    def _evict_droppable(self):
+        for key, (_, droppable, _) in self._pending.items():
+            if droppable:
+                del self._pending[key]
+                self.dropped += 1
+                return True
+        return False
+
+    def flush_soon(self):
+        """Write the pending records now instead of at the next interval"""
+        with self._condition:
+            self._urgent = True
+            self._condition.notify()
+
+    def wait_until_written(self, timeout=None):
+        """Flush and block until nothing is pending or being written; returns whether that happened"""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._condition:
+            self._urgent = True
+            self._condition.notify_all()
+            while self._pending or self._flushing:
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+            return True
+
+    def drain(self, timeout=30):
+        """Write everything still pending and stop the background thread"""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        self._thread.join(timeout)
+        if self._thread.is_alive() or self._pending:
+            print(f"Write-behind buffer stopped with {len(self._pending)} records unwritten")
+
+    def stats(self):
+        with self._condition:
+            return {
+                'pending': len(self._pending),
+                'written': self.written,
+                'coalesced': self.coalesced,
+                'dropped': self.dropped,
+                'failed_flushes': self.failed_flushes,
+            }
+
+    def _take_batch(self):
+        batch = []
+        while self._pending and len(batch) < self.batch_size:
+            batch.append(self._pending.popitem(last=False))
+        return batch
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if not (self._stopping or self._urgent or len(self._pending) >= self.batch_size):
+                    self._condition.wait(self.flush_interval)
+                if self._stopping and not self._pending:
+                    self._condition.notify_all()
+                    return
+                self._urgent = False
+                batch = self._take_batch()
+                self._flushing = bool(batch)
+            if batch:
+                self._write(batch)
+
+    def _write(self, batch):
+        try:
+            self.flush([record for _, (record, _, _) in batch])
+            failed = []
+        except Exception as e:
+            print(f"Error writing {len(batch)} buffered records: {str(e)}")
+            failed = batch
+        with self._condition:
+            if failed:
+                self.failed_flushes += 1
+            else:
+                self.written += len(batch)
+            for key, (record, droppable, attempts) in failed:
+                # Newer records for the key have replaced this one meanwhile
+                if key in self._pending:
+                    continue
+                if attempts + 1 >= self.max_attempts:
+                    print(f"Giving up on buffered record {key} after {attempts + 1} attempts")
+                    self.dropped += 1
+                    continue
+                self._pending[key] = (record, droppable, attempts + 1)
+                self._pending.move_to_end(key, last=False)
+            self._flushing = False
+            self._condition.notify_all()
+            if failed and not self._stopping:
+                # Back off instead of retrying in a tight loop
+                self._condition.wait(self.flush_interval)
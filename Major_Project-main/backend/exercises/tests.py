@@ -1,3 +1,1294 @@
-from django.test import TestCase
+import base64
+import hashlib
+import io
+import json
+import math
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import cv2
+import numpy as np
+
+from asgiref.sync import async_to_sync
+from asgiref.testing import ApplicationCommunicator
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from authentication.models import User, UserStats
+from . import routing
+from .models import AnalysisJob, DailyWorkoutRollup, Exercise, LiveSession, UserExercise, VideoBlob
+from .services.analysis_jobs import JobSuperseded, claim_next_job, requeue_stale_jobs, run_job
+from .services.analyzer_cache import AnalyzerCache
+from .services.exercise_analysis import ExerciseAnalyzer, array_to_landmarks
+from .services.exercise_rules import EXERCISES, PoseLandmark, get_rules
+from .services.frame_pipeline import _STOP, FramePipeline, LatestFrameSlot
+from .services.landmark_cache import load_landmarks, save_landmarks
+from .services.leaderboards import InMemoryLeaderboardBackend, get_backend
+from .services.live_sessions import LiveSessionTracker, persist_live_sessions
+from .services.parallel_video import extract_landmarks_parallel, plan_chunks
+from .services.prediction_cache import PredictionCache
+from .services.rep_segmentation import hysteresis_counts, segment_reps
+from .services.rollups import workout_periods
+from .services.session_ingest import ingest_sessions
+from .services.video_analysis import analyze_video
+from .services.video_reader import FrameSampler
+from .consumers import ExerciseAnalysisConsumer
+from .services.write_behind import WriteBehindBuffer
+from .views import upload_video
+
+
+class FakeAnalyzer:
+    """Stands in for ExerciseAnalyzer where only its lifecycle matters"""
+
+    def __init__(self, exercise_type, model_mode=None):
+        self.exercise_type = exercise_type
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+@mock.patch('exercises.services.analyzer_cache.ExerciseAnalyzer', FakeAnalyzer)
+class AnalyzerCacheTests(SimpleTestCase):
+    def checkout(self, cache, session_id):
+        with cache.checkout(1, session_id, 'squats') as analyzer:
+            return analyzer
+
+    def test_sessions_keep_their_analyzer(self):
+        cache = AnalyzerCache(ttl=60, max_size=2)
+        first = self.checkout(cache, 'a')
+        self.assertIs(self.checkout(cache, 'a'), first)
+        self.assertIsNot(self.checkout(cache, 'b'), first)
+        self.assertFalse(first.closed)
+
+    def test_least_recently_used_analyzer_is_evicted_and_closed(self):
+        cache = AnalyzerCache(ttl=60, max_size=2)
+        a, b = self.checkout(cache, 'a'), self.checkout(cache, 'b')
+        self.checkout(cache, 'a')
+        self.checkout(cache, 'c')
+        self.assertTrue(b.closed)
+        self.assertFalse(a.closed)
+        self.assertEqual(cache.stats()['live_analyzers'], 2)
+        self.assertIsNot(self.checkout(cache, 'b'), b)
+
+    def test_expired_and_discarded_analyzers_are_closed(self):
+        cache = AnalyzerCache(ttl=60, max_size=8)
+        a, b = self.checkout(cache, 'a'), self.checkout(cache, 'b')
+        cache._entries[(1, 'a', 'squats')][2] -= 61
+        self.checkout(cache, 'b')
+        self.assertTrue(a.closed)
+        cache.discard(1, 'b', 'squats')
+        self.assertTrue(b.closed)
+        self.assertEqual(cache.stats()['live_analyzers'], 0)
+
+    def test_analyzer_in_use_is_closed_after_the_request(self):
+        cache = AnalyzerCache(ttl=60, max_size=8)
+        with cache.checkout(1, 'a', 'squats') as analyzer:
+            evicting = threading.Thread(target=cache.discard, args=(1, 'a', 'squats'))
+            evicting.start()
+            evicting.join(0.1)
+            self.assertFalse(analyzer.closed)
+        evicting.join(5)
+        self.assertTrue(analyzer.closed)
+
+
+class FrameBatchValidationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='athlete@example.com', username='athlete', password='password')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+        _, jpeg = cv2.imencode('.jpg', np.zeros((8, 8, 3), dtype=np.uint8))
+        self.frame = 'data:image/jpeg;base64,' + base64.b64encode(jpeg).decode()
+
+    def analyze(self, **data):
+        return self.client.post(reverse('analyze-frame-batch', args=['squats']), data, format='json')
+
+    def test_malformed_base64_frames_are_rejected(self):
+        response = self.analyze(frames=[self.frame, 'abc', self.frame, 'data:image/jpeg;base64,@@'])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['frames'], [1, 3])
+
+    def test_non_numeric_timestamps_are_rejected(self):
+        response = self.analyze(frames=[self.frame] * 3, timestamps=[0, 'soon', 'nan'])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['timestamps'], [1, 2])
+
+    def test_invalid_single_frames_and_timestamps_are_rejected(self):
+        for data in ({'frame': 'abc'}, {'frame': 'data:image/jpeg;base64,@@'},
+                     {'frame': self.frame, 'timestamp': 'abc'}, {'frame': self.frame, 'timestamp': 'inf'}):
+            response = self.client.post(reverse('bicep_curls'), data, format='json')
+            self.assertEqual(response.status_code, 400, data)
+
+    def test_analyzers_without_a_session_are_closed(self):
+        with mock.patch.object(ExerciseAnalyzer, 'close', autospec=True) as close:
+            batch = self.client.post(reverse('analyze-frame-batch', args=['bicep_curls']), {'frames': [self.frame]},
+                                     format='json')
+            single = self.client.post(reverse('bicep_curls'), {'frame': self.frame}, format='json')
+        self.assertEqual((batch.status_code, single.status_code), (200, 200))
+        self.assertEqual(close.call_count, 2)
+
+
+class AnalysisJobQueueTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='athlete@example.com', username='athlete', password='password')
+        self.user_exercise = UserExercise.objects.create(user=self.user, exercise=Exercise.objects.get(name='squats'),
+                                                         video_recording='exercise_videos/squats.mp4')
+        self.results = {'reps': 5, 'duration': 10.2, 'form_accuracy': 80.0, 'feedback': ['Good form!'],
+                        'total_frames': 100}
+
+    def enqueue(self):
+        return AnalysisJob.objects.create(user=self.user, user_exercise=self.user_exercise)
+
+    def make_stale(self):
+        AnalysisJob.objects.update(heartbeat_at=timezone.now() - timedelta(minutes=10))
+
+    def test_jobs_are_claimed_once_in_order(self):
+        first, second = self.enqueue(), self.enqueue()
+        self.assertEqual(claim_next_job('a').id, first.id)
+        job = claim_next_job('b')
+        self.assertEqual((job.id, job.status, job.worker, job.attempts),
+                         (second.id, AnalysisJob.STATUS_RUNNING, 'b', 1))
+        self.assertIsNone(claim_next_job('c'))
+
+    def test_stale_jobs_are_requeued_until_out_of_attempts(self):
+        job = self.enqueue()
+        claim_next_job('a')
+        self.assertEqual(requeue_stale_jobs(stale_after=60, max_attempts=2), (0, 0))
+        self.make_stale()
+        self.assertEqual(requeue_stale_jobs(stale_after=60, max_attempts=2), (1, 0))
+        self.assertEqual(claim_next_job('b').attempts, 2)
+        self.make_stale()
+        self.assertEqual(requeue_stale_jobs(stale_after=60, max_attempts=2), (0, 1))
+        job.refresh_from_db()
+        self.assertEqual(job.status, AnalysisJob.STATUS_FAILED)
+
+    def test_job_results_are_saved(self):
+        job = self.enqueue()
+        with mock.patch('exercises.services.analysis_jobs.analyze_video', return_value=self.results):
+            self.assertEqual(run_job(claim_next_job('a')), self.results)
+        job.refresh_from_db()
+        self.user_exercise.refresh_from_db()
+        self.assertEqual((job.status, job.progress), (AnalysisJob.STATUS_SUCCEEDED, 100))
+        self.assertEqual((self.user_exercise.reps, self.user_exercise.duration), (5, 10))
+
+    def test_requeued_attempt_does_not_overwrite_the_next_one(self):
+        job = self.enqueue()
+
+        def analyze_while_requeued(*args, progress_callback=None, **kwargs):
+            self.make_stale()
+            requeue_stale_jobs(stale_after=60)
+            claim_next_job('b')
+            return self.results
+
+        def report_after_requeue(*args, progress_callback=None, **kwargs):
+            analyze_while_requeued()
+            progress_callback(50, 100)
+            return self.results
+
+        for analyze in (analyze_while_requeued, report_after_requeue):
+            AnalysisJob.objects.update(status=AnalysisJob.STATUS_QUEUED, worker=None, attempts=0)
+            with mock.patch('exercises.services.analysis_jobs.analyze_video', analyze):
+                with self.assertRaises(JobSuperseded):
+                    run_job(claim_next_job('a'))
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.worker, job.progress), (AnalysisJob.STATUS_RUNNING, 'b', 0))
+            self.user_exercise.refresh_from_db()
+            self.assertIsNone(self.user_exercise.reps)
+
+
+def write_test_video(path, frames=120, fps=30, period=30):
+    """An MJPEG video whose brightness rises and falls every `period` frames"""
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), fps, (64, 48))
+    for index in range(frames):
+        writer.write(np.full((48, 64, 3), int(128 + 110 * np.cos(2 * np.pi * index / period)), dtype=np.uint8))
+    writer.release()
+    return path
+
+
+def brightness_pose(analyzer, frame):
+    """
+    Stands in for ExerciseAnalyzer.detect_pose: a curl whose elbow angle
+    follows the frame's brightness (0 to 180 degrees), no pose when black
+    """
+    brightness = frame[..., 2].mean()
+    if brightness < 5:
+        return None
+    pose = pose_with_angles('bicep_curls', elbow=brightness / 255 * 180, shoulder=10)
+    return mock.Mock(landmark=array_to_landmarks(pose))
+
+
+class FrameSamplerTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.video = write_test_video(os.path.join(directory.name, 'video.avi'), frames=60, fps=30)
+
+    def sample(self, sampler, densify_at=None):
+        frames = []
+        for index, timestamp, frame in sampler:
+            frames.append((index, timestamp))
+            if index == densify_at:
+                sampler.densify()
+        return frames
+
+    def test_samples_on_a_stride_with_frame_timestamps(self):
+        sampler = FrameSampler(self.video, target_fps=15)
+        self.assertEqual((sampler.source_fps, sampler.stride, sampler.total_frames), (30, 2, 60))
+        frames = self.sample(sampler)
+        self.assertEqual([index for index, _ in frames], list(range(0, 60, 2)))
+        for index, timestamp in frames:
+            self.assertAlmostEqual(timestamp, index / 30 * 1000, delta=1)
+
+    def test_every_frame_without_a_lower_target(self):
+        self.assertEqual(len(self.sample(FrameSampler(self.video, target_fps=0))), 60)
+        self.assertEqual(len(self.sample(FrameSampler(self.video, target_fps=60))), 60)
+
+    def test_densify_samples_every_frame_for_a_while(self):
+        frames = self.sample(FrameSampler(self.video, target_fps=10, dense_frames=4), densify_at=9)
+        self.assertEqual([index for index, _ in frames], [0, 3, 6, 9, 10, 11, 12, 13, 15, 18] + list(range(21, 60, 3)))
+
+    def test_ranges_keep_the_grid_of_a_whole_pass(self):
+        frames = self.sample(FrameSampler(self.video, target_fps=15, start=7, stop=20))
+        self.assertEqual([index for index, _ in frames], [8, 10, 12, 14, 16, 18])
+
+
+# Pool processes are forked so they keep the patched pose detection
+@mock.patch('exercises.services.parallel_video.START_METHOD', 'fork')
+@mock.patch.object(ExerciseAnalyzer, 'detect_pose', brightness_pose)
+class ParallelVideoAnalysisTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        # Chunk boundaries fall at every phase of the 50-frame reps
+        self.video = write_test_video(os.path.join(directory.name, 'curls.avi'), frames=240, period=50)
+
+    def test_plan_chunks(self):
+        self.assertEqual(plan_chunks(250, 100), [(0, 100), (100, 200), (200, None)])
+        self.assertEqual(plan_chunks(100, 100), [(0, None)])
+        self.assertEqual(plan_chunks(0, 100), [])
+
+    @override_settings(VIDEO_ANALYSIS_DENSE_FRAMES=0, VIDEO_ANALYSIS_CHUNK_FRAMES=40, VIDEO_ANALYSIS_CHUNK_OVERLAP=5)
+    def test_parallel_extraction_matches_a_sequential_pass(self):
+        indices, timestamps, landmarks, detected = extract_landmarks_parallel(
+            'bicep_curls', self.video, 240, 2, 40, 5, target_fps=15)
+        self.assertEqual(indices.tolist(), [index for index, _, _ in FrameSampler(self.video, 15)])
+        self.assertEqual((len(timestamps), len(landmarks), len(detected)), (120, 120, 120))
+
+        sequential = analyze_video('bicep_curls', self.video, workers=1, use_cache=False)
+        parallel = analyze_video('bicep_curls', self.video, workers=2, use_cache=False)
+        self.assertEqual(sequential['reps'], 5)
+        for key in ('reps', 'analyzed_frames', 'correct_frames', 'rep_segments'):
+            self.assertEqual(parallel[key], sequential[key], key)
+
+    @override_settings(VIDEO_ANALYSIS_DENSE_FRAMES=10, VIDEO_ANALYSIS_CHUNK_FRAMES=40, VIDEO_ANALYSIS_CHUNK_OVERLAP=5)
+    def test_densified_sampling_matches_a_sequential_pass(self):
+        sequential = analyze_video('bicep_curls', self.video, workers=1, use_cache=False)
+        with mock.patch('exercises.services.video_analysis.extract_landmarks_parallel',
+                        wraps=extract_landmarks_parallel) as extract:
+            parallel = analyze_video('bicep_curls', self.video, workers=2, use_cache=False)
+        self.assertTrue(extract.called)
+        # Frames around each transition were analyzed on top of the 120 grid frames
+        self.assertGreater(sequential['analyzed_frames'], 120)
+        self.assertEqual(sequential['reps'], 5)
+        for key in ('reps', 'analyzed_frames', 'correct_frames', 'duration', 'rep_segments'):
+            self.assertEqual(parallel[key], sequential[key], key)
+
+
+@mock.patch.object(ExerciseAnalyzer, 'detect_pose', brightness_pose)
+@override_settings(STREAM_ANALYSIS_FRAME_WIDTH=64, STREAM_ANALYSIS_FRAME_HEIGHT=48)
+class VideoStreamUploadTests(TransactionTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=os.path.join(directory.name, 'media'))
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        Exercise.objects.get_or_create(name='bicep_curls', defaults={
+            'body_part': 'arms', 'description': '', 'difficulty': 'beginner'})
+        self.user = User.objects.create_user(email='athlete@example.com', username='athlete', password='password')
+        self.token = f'Bearer {RefreshToken.for_user(self.user).access_token}'.encode()
+        path = write_test_video(os.path.join(directory.name, 'curls.avi'), frames=240, period=50)
+        with open(path, 'rb') as video:
+            self.video = video.read()
+
+    def stream(self, chunks, exercise_type='bicep_curls', authorization=True):
+        """POST the chunks as one streamed request body, returning the status and JSON response"""
+        headers = [(b'content-type', b'video/x-msvideo'), (b'host', b'testserver')]
+        if authorization:
+            headers.append((b'authorization', self.token))
+
+        async def request():
+            communicator = ApplicationCommunicator(URLRouter(routing.http_urlpatterns), {
+                'type': 'http', 'http_version': '1.1', 'method': 'POST', 'scheme': 'http',
+                'path': f'/api/exercises/stream/{exercise_type}/', 'query_string': b'', 'headers': headers,
+            })
+            for number, chunk in enumerate(chunks, 1):
+                await communicator.send_input({'type': 'http.request', 'body': chunk,
+                                               'more_body': number < len(chunks)})
+            start = await communicator.receive_output(30)
+            body = await communicator.receive_output(30)
+            await communicator.wait(5)
+            return start['status'], json.loads(body['body'])
+
+        return async_to_sync(request)()
+
+    def chunks(self, size=4096):
+        return [self.video[offset:offset + size] for offset in range(0, len(self.video), size)]
+
+    @skipUnless(shutil.which('ffmpeg'), 'ffmpeg is not installed')
+    def test_video_is_analyzed_while_it_uploads(self):
+        status, response = self.stream(self.chunks())
+        self.assertEqual(status, 201)
+        results = response['results']
+        self.assertTrue(results['streamed'])
+        self.assertEqual(results['reps'], 5)
+        self.assertEqual(len(results['rep_segments']), 5)
+        workout = UserExercise.objects.get()
+        self.assertEqual((workout.reps, workout.video_blob.sha256), (5, hashlib.sha256(self.video).hexdigest()))
+
+    def test_without_ffmpeg_the_upload_is_queued_for_a_worker(self):
+        with mock.patch('exercises.services.stream_analysis.shutil.which', return_value=None):
+            status, response = self.stream(self.chunks())
+        self.assertEqual(status, 202)
+        self.assertEqual((response['streamed'], response['stream_error']), (False, 'ffmpeg is not installed'))
+        job = AnalysisJob.objects.get()
+        self.assertEqual((job.id, job.status), (response['job']['id'], AnalysisJob.STATUS_QUEUED))
+        self.assertEqual(response['status_url'], f"http://testserver{reverse('analysis-job-status', args=[job.id])}")
+        self.assertEqual(job.user_exercise.video_recording.read(), self.video)
+
+    def test_uploads_over_the_size_limit_are_rejected(self):
+        with self.settings(STREAM_UPLOAD_MAX_BYTES=10000):
+            status, response = self.stream(self.chunks())
+        self.assertEqual(status, 413)
+        self.assertFalse(UserExercise.objects.exists())
+
+    def test_unauthenticated_and_unknown_exercise_uploads_are_rejected(self):
+        self.assertEqual(self.stream(self.chunks(), authorization=False)[0], 401)
+        self.assertEqual(self.stream(self.chunks(), exercise_type='yoga')[0], 404)
+        self.assertFalse(UserExercise.objects.exists())
+
+
+class LandmarkCacheTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        cache_settings = override_settings(LANDMARK_CACHE_DIR=os.path.join(directory.name, 'landmarks'))
+        cache_settings.enable()
+        self.addCleanup(cache_settings.disable)
+        self.video = write_test_video(os.path.join(directory.name, 'curls.avi'))
+
+    def test_landmarks_round_trip_per_sampling(self):
+        columns = (np.arange(3), np.array([0.0, 33.3, 66.7]),
+                   np.random.default_rng(0).random((3, 33, 4), dtype=np.float32), np.array([True, False, True]))
+        save_landmarks('ab' * 32, 15, 10, *columns)
+        for stored, loaded in zip(columns, load_landmarks('ab' * 32, 15, 10)):
+            np.testing.assert_array_equal(stored, loaded)
+        self.assertIsNone(load_landmarks('ab' * 32, 30, 10))
+        self.assertIsNone(load_landmarks('cd' * 32, 15, 10))
+
+    @mock.patch.object(ExerciseAnalyzer, 'detect_pose', brightness_pose)
+    def test_reanalysis_replays_cached_landmarks(self):
+        first = analyze_video('bicep_curls', self.video, use_cache=True)
+        self.assertEqual(first['reps'], 4)
+        # A cache hit never decodes the video again
+        with mock.patch('exercises.services.video_analysis.FrameSampler', side_effect=AssertionError):
+            second = analyze_video('bicep_curls', self.video, use_cache=True)
+        for key in ('reps', 'form_accuracy', 'feedback', 'duration', 'analyzed_frames', 'rep_segments'):
+            self.assertEqual(second[key], first[key], key)
+
+
+class VideoStoreTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=directory.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.user = User.objects.create_user(email='athlete@example.com', username='athlete', password='password')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+        self.video = b'not really a video, but bytes all the same' * 100
+
+    def upload(self, content):
+        response = self.client.post(reverse('exercise-upload-video', args=['squats']),
+                                    {'video': SimpleUploadedFile('squats.mp4', content)}, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        return UserExercise.objects.get(id=response.json()['id'])
+
+    def test_uploads_are_hashed_as_they_arrive(self):
+        for max_memory_size in (1 << 20, 100):
+            # Small uploads stay in memory, larger ones go to a temporary file; neither is read twice
+            with self.settings(FILE_UPLOAD_MAX_MEMORY_SIZE=max_memory_size), \
+                    mock.patch('exercises.services.video_store._sha256', side_effect=AssertionError):
+                content = self.video + str(max_memory_size).encode()
+                user_exercise = self.upload(content)
+            self.assertEqual(user_exercise.video_blob.sha256, hashlib.sha256(content).hexdigest())
+            self.assertEqual(user_exercise.video_recording.read(), content)
+
+    def test_identical_uploads_share_a_blob_until_the_last_is_deleted(self):
+        first, second = self.upload(self.video), self.upload(self.video)
+        blob = VideoBlob.objects.get()
+        self.assertEqual((first.video_blob_id, second.video_blob_id, blob.ref_count), (blob.id, blob.id, 2))
+        path = blob.file.path
+
+        first.delete()
+        blob.refresh_from_db()
+        self.assertEqual(blob.ref_count, 1)
+        self.assertTrue(os.path.exists(path))
+        second.delete()
+        self.assertFalse(VideoBlob.objects.exists())
+        self.assertFalse(os.path.exists(path))
+
+    def test_plain_upload_is_owned_by_a_session(self):
+        request = APIRequestFactory().post('/', {'video': SimpleUploadedFile('squats.mp4', self.video)},
+                                           format='multipart')
+        force_authenticate(request, user=self.user)
+        response = upload_video(request, 'squats')
+        self.assertEqual(response.status_code, 200)
+        user_exercise = UserExercise.objects.get(id=response.data['id'])
+        self.assertEqual(user_exercise.video_blob.ref_count, 1)
+        user_exercise.delete()
+        self.assertFalse(VideoBlob.objects.exists())
+
+
+def curl_landmarks(elbow_angles):
+    """(T, 33, 4) poses of a side-on bicep curl with the given elbow angles, upper arm along the body"""
+    radians = np.radians(np.asarray(elbow_angles, dtype=np.float64))
+    points = np.zeros((len(radians), 33, 4), dtype=np.float32)
+    points[..., 3] = 1
+    points[:, 23, :2] = (0.5, 0.7)  # hip
+    points[:, 11, :2] = (0.5, 0.3)  # shoulder
+    points[:, 13, :2] = (0.5, 0.5)  # elbow
+    points[:, 15, 0] = 0.5 + 0.2 * np.sin(radians)  # wrist
+    points[:, 15, 1] = 0.5 - 0.2 * np.cos(radians)
+    return points
+
+
+def pose_with_angles(exercise_type, **angles):
+    """A (33, 4) pose whose joint angles for an exercise's rules are the given degrees"""
+    points = np.zeros((33, 4))
+    points[:, 3] = 1
+    placed = {'LEFT_SHOULDER': (0.5, 0.3), 'LEFT_HIP': (0.5, 0.6)}
+    pending = dict(EXERCISES[exercise_type]['angles'])
+    while pending:
+        for name, (a, b, c) in list(pending.items()):
+            if a in placed and b in placed:
+                # Turn the b->a direction by the angle to place c
+                direction = math.atan2(placed[a][1] - placed[b][1], placed[a][0] - placed[b][0])
+                direction += math.radians(angles[name])
+                placed[c] = (placed[b][0] + 0.2 * math.cos(direction), placed[b][1] + 0.2 * math.sin(direction))
+                del pending[name]
+                break
+        else:
+            # Nothing can be placed yet: put a missing joint below a placed one
+            a, b, _ = next(joints for joints in pending.values() if joints[0] in placed)
+            placed[b] = (placed[a][0], placed[a][1] + 0.2)
+    for name, (x, y) in placed.items():
+        points[PoseLandmark[name].value, :2] = (x, y)
+    return points
+
+
+class CompiledRulesTests(SimpleTestCase):
+    # Per exercise: frames as (angles, expected stage, rep counter, correct form)
+    SEQUENCES = {
+        'bicep_curls': [
+            ({'elbow': 170, 'shoulder': 10}, 'down', 0, True),
+            ({'elbow': 90, 'shoulder': 10}, 'down', 0, True),
+            ({'elbow': 20, 'shoulder': 10}, 'up', 1, True),
+            # Swinging the upper arm neither resets nor counts, and is bad form
+            ({'elbow': 170, 'shoulder': 40}, 'up', 1, False),
+            ({'elbow': 170, 'shoulder': 10}, 'down', 1, True),
+            ({'elbow': 20, 'shoulder': 40}, 'down', 1, False),
+            ({'elbow': 20, 'shoulder': 10}, 'up', 2, True),
+        ],
+        'squats': [
+            ({'knee': 80}, None, 0, True),
+            ({'knee': 170}, 'up', 0, True),
+            ({'knee': 120}, 'up', 0, False),
+            ({'knee': 80}, 'down', 1, True),
+            ({'knee': 85}, 'down', 1, True),
+            ({'knee': 170}, 'up', 1, True),
+            ({'knee': 60}, 'down', 2, True),
+        ],
+        'pushups': [
+            ({'elbow': 170, 'body': 175}, 'down', 0, True),
+            ({'elbow': 80, 'body': 150}, 'down', 0, False),
+            ({'elbow': 80, 'body': 175}, 'up', 1, True),
+            ({'elbow': 170, 'body': 150}, 'up', 1, False),
+            ({'elbow': 170, 'body': 175}, 'down', 1, True),
+            ({'elbow': 120, 'body': 175}, 'down', 1, True),
+            ({'elbow': 80, 'body': 175}, 'up', 2, True),
+        ],
+        'lunges': [
+            ({'knee': 170, 'torso': 175}, 'down', 0, True),
+            ({'knee': 80, 'torso': 150}, 'down', 0, False),
+            ({'knee': 80, 'torso': 175}, 'up', 1, True),
+            ({'knee': 170, 'torso': 175}, 'down', 1, True),
+            ({'knee': 80, 'torso': 175}, 'up', 2, True),
+        ],
+        'planks': [
+            ({'body': 170}, None, 0, True),
+            ({'body': 150}, None, 0, False),
+            ({'body': 175}, None, 0, True),
+        ],
+    }
+
+    def test_stage_and_counter_sequences(self):
+        for exercise_type, frames in self.SEQUENCES.items():
+            with self.subTest(exercise_type):
+                analyzer = ExerciseAnalyzer(exercise_type, model_mode='off')
+                points = np.stack([pose_with_angles(exercise_type, **angles) for angles, _, _, _ in frames])
+                np.testing.assert_allclose(
+                    get_rules(exercise_type).angles(points),
+                    [[angles[name] for name in get_rules(exercise_type).angle_names] for angles, _, _, _ in frames],
+                    atol=1e-6)
+                for row, (_, stage, counter, correct) in zip(points, frames):
+                    metrics = analyzer.process_landmarks(array_to_landmarks(row), timestamp=0)
+                    self.assertEqual((metrics['stage'], metrics['counter'], metrics['correct_form']),
+                                     (stage, counter, correct))
+                analyzer.close()
+
+    def test_rules_alone_need_no_model_file(self):
+        with mock.patch('exercises.services.exercise_analysis.load_model', side_effect=AssertionError):
+            for exercise_type in EXERCISES:
+                ExerciseAnalyzer(exercise_type, model_mode='off').close()
+        with mock.patch('exercises.services.exercise_analysis.os.path.exists', return_value=False), \
+                mock.patch('exercises.services.exercise_analysis.load_model', side_effect=AssertionError):
+            analyzer = ExerciseAnalyzer('squats', model_mode='cascade')
+            analyzer.close()
+        self.assertEqual(analyzer.model_mode, 'off')
+        self.assertIsNone(analyzer.model_usage()['prediction_cache'])
+
+    def test_batches_evaluate_like_single_frames(self):
+        rng = np.random.default_rng(0)
+        for exercise_type in EXERCISES:
+            rules = get_rules(exercise_type)
+            points = rng.random((50, 33, 4))
+            batch = rules.evaluate(points)
+            for row in range(len(points)):
+                single = rules.evaluate(points[row:row + 1])
+                for name in batch._fields:
+                    np.testing.assert_allclose(getattr(batch, name)[row], getattr(single, name)[0])
+
+    def test_plank_timer_pauses_on_bad_form(self):
+        analyzer = ExerciseAnalyzer('planks', model_mode='off')
+        held = []
+        for second, body in enumerate([170, 170, 150, 170, 170]):
+            metrics = analyzer.process_landmarks(array_to_landmarks(pose_with_angles('planks', body=body)),
+                                                 timestamp=second)
+            held.append(metrics['hold_duration'])
+        analyzer.close()
+        self.assertEqual(held, [0, 1, 1, 1, 2])
+        self.assertEqual(metrics['feedback'], ['Excellent plank form! Duration: 2s'])
+
+
+class StubPredictor:
+    """Stands in for the form model; scores each input row with `score`"""
+
+    def __init__(self, score):
+        self.score = score
+
+    def predict(self, inputs):
+        return np.stack([np.atleast_1d(self.score(row)) for row in inputs])
+
+    def stats(self):
+        return {}
+
+
+class FormModelVerdictTests(SimpleTestCase):
+    def test_model_verdict_sets_feedback_and_accuracy(self):
+        analyzer = ExerciseAnalyzer('squats', model_mode='always')
+        # The squats model file is not bundled, so stand in for it
+        analyzer.predictor, analyzer.model_mode = StubPredictor(lambda row: 0.1), 'always'
+        metrics = analyzer.process_landmarks(array_to_landmarks(pose_with_angles('squats', knee=170)), timestamp=0)
+        analyzer.close()
+        self.assertEqual(metrics['form_source'], 'model')
+        self.assertFalse(metrics['correct_form'])
+        self.assertFalse(analyzer.correct_form)
+        self.assertEqual(metrics['feedback'], ['Form needs improvement.'])
+        self.assertLess(metrics['form_accuracy'], 90)
+
+    def test_plank_timer_follows_model(self):
+        analyzer = ExerciseAnalyzer('planks', model_mode='always')
+        pose = array_to_landmarks(pose_with_angles('planks', body=170))
+        analyzer.predictor = StubPredictor(lambda row: [0.8, 0.1, 0.1])
+        for second in range(3):
+            metrics = analyzer.process_landmarks(pose, timestamp=second)
+        self.assertEqual(metrics['hold_duration'], 0)
+        self.assertEqual(metrics['feedback'], ['Incorrect form. Lower your hips and keep your body straight.'])
+        analyzer.predictor = StubPredictor(lambda row: [0.1, 0.8, 0.1])
+        for second in range(3, 5):
+            metrics = analyzer.process_landmarks(pose, timestamp=second)
+        analyzer.close()
+        self.assertEqual(metrics['hold_duration'], 1)
+        self.assertEqual(metrics['feedback'], ['Excellent plank form! Duration: 1s'])
+
+    @mock.patch.object(ExerciseAnalyzer, 'detect_pose', brightness_pose)
+    def test_batches_judge_form_like_single_frames(self):
+        # brightness_pose maps frame brightness to the elbow angle
+        frames = [np.full((48, 64, 3), value, dtype=np.uint8)
+                  for value in [250, 200, 150, 100, 30, 2, 60, 120, 250, 20, 10, 250]]
+        # Judges the rising half of the curl as bad form
+        score = lambda row: float(row.ravel()[15 * 4 + 1] < 0.5)
+        results = []
+        for batch in (False, True):
+            analyzer = ExerciseAnalyzer('bicep_curls', model_mode='cascade')
+            analyzer.predictor, analyzer.mp_drawing = StubPredictor(score), mock.Mock()
+            if batch:
+                _, metrics = analyzer.process_frames(frames, timestamps=list(range(len(frames))))
+            else:
+                metrics = [analyzer.process_frame(frame, timestamp)[1] for timestamp, frame in enumerate(frames)]
+            analyzer.close()
+            results.append([(m['counter'], m['stage'], m['correct_form'], m['feedback'], m.get('form_source'))
+                            for m in metrics])
+        self.assertEqual(results[0], results[1])
+        self.assertIn('model', [source for *_, source in results[0]])
+
+
+class FakeFormModel:
+    """A Keras-like model scoring each row by its mean, plus `offset`"""
+
+    def __init__(self):
+        self.rows = 0
+        self.offset = 0.0
+
+    def predict(self, inputs, verbose=0):
+        self.rows += len(inputs)
+        return np.asarray(inputs).reshape(len(inputs), -1).mean(axis=1, keepdims=True) + self.offset
+
+
+class PredictionCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.pose = np.random.default_rng(0).random((1, 1, 36))
+
+    def cache(self, model, **options):
+        options = {'max_size': 10, 'grid': 0.1, 'sample_every': 0, 'max_error': 0.05, **options}
+        return PredictionCache(model, **options)
+
+    def test_same_pose_anywhere_in_frame_is_a_hit(self):
+        model = FakeFormModel()
+        cache = self.cache(model)
+        moved = self.pose.reshape(-1, 4).copy()
+        moved[:, :3] = moved[:, :3] * 0.5 + 0.2
+        first = cache.predict(self.pose)
+        second = cache.predict(moved.reshape(1, 1, -1))
+        np.testing.assert_array_equal(first, second)
+        self.assertEqual(model.rows, 1)
+        self.assertEqual((cache.stats()['hits'], cache.stats()['misses']), (1, 1))
+
+    def test_repeated_pose_in_a_batch_runs_the_model_once(self):
+        model = FakeFormModel()
+        cache = self.cache(model)
+        outputs = cache.predict(np.concatenate([self.pose, self.pose, self.pose]))
+        self.assertEqual(model.rows, 1)
+        self.assertEqual(outputs.shape, (3, 1))
+        np.testing.assert_array_equal(outputs[0], outputs[2])
+
+    def test_least_recently_used_pose_is_evicted(self):
+        model = FakeFormModel()
+        cache = self.cache(model, max_size=2)
+        poses = [self.pose * scale for scale in (1, 2, 3)]
+        for pose in poses:
+            cache.predict(pose)
+        cache.predict(poses[0])
+        self.assertEqual(model.rows, 4)
+        self.assertEqual(cache.stats()['entries'], 2)
+
+    def test_disables_itself_when_sampled_error_is_too_high(self):
+        model = FakeFormModel()
+        cache = self.cache(model, sample_every=1, error_window=3)
+        cache.predict(self.pose)
+        # The model's answers drift away from the cached one
+        model.offset = 0.5
+        for _ in range(3):
+            cache.predict(self.pose)
+        stats = cache.stats()
+        self.assertFalse(stats['enabled'])
+        self.assertEqual(stats['sampled'], 3)
+        self.assertEqual(stats['entries'], 0)
+        rows = model.rows
+        cache.predict(self.pose)
+        self.assertEqual(model.rows, rows + 1)
+        self.assertEqual(cache.stats()['hits'], 3)
+
+    def test_stays_enabled_while_sampled_error_is_low(self):
+        model = FakeFormModel()
+        cache = self.cache(model, sample_every=1, error_window=3)
+        for _ in range(5):
+            cache.predict(self.pose)
+        self.assertTrue(cache.stats()['enabled'])
+        self.assertEqual(cache.stats()['mean_error'], 0)
+
+    @override_settings(FORM_PREDICTION_CACHE_ENABLED=False)
+    def test_disabled_by_setting(self):
+        model = FakeFormModel()
+        cache = self.cache(model)
+        cache.predict(self.pose)
+        cache.predict(self.pose)
+        self.assertEqual(model.rows, 2)
+        self.assertEqual(cache.stats()['hits'], 0)
+
+
+class LatestFrameSlotTests(SimpleTestCase):
+    def test_newer_item_replaces_a_waiting_one(self):
+        slot = LatestFrameSlot()
+        self.assertFalse(slot.put(1))
+        self.assertTrue(slot.put(2))
+        self.assertEqual(slot.get(), 2)
+        self.assertFalse(slot.put(3))
+
+    def test_stop_follows_the_waiting_item(self):
+        slot = LatestFrameSlot()
+        slot.put(1)
+        self.assertFalse(slot.put(_STOP))
+        self.assertFalse(slot.put(2))
+        self.assertEqual(slot.get(), 1)
+        self.assertIs(slot.get(), _STOP)
+
+    def test_get_waits_for_an_item(self):
+        slot = LatestFrameSlot()
+        items = []
+        reader = threading.Thread(target=lambda: items.append(slot.get()))
+        reader.start()
+        slot.put('frame')
+        reader.join(5)
+        self.assertEqual(items, ['frame'])
+
+
+class BlockingPoseAnalyzer:
+    """Stands in for ExerciseAnalyzer; pose estimation waits for `release`"""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.busy = threading.Event()
+        self.timestamps = []
+
+    def detect_pose(self, frame):
+        self.busy.set()
+        self.release.wait(5)
+        return mock.Mock(landmark=[])
+
+    def process_landmarks(self, landmarks, image=None, timestamp=None):
+        self.timestamps.append(timestamp)
+        return {'counter': len(self.timestamps)}
+
+    def annotate_frame(self, frame, pose_landmarks, metrics):
+        return frame
+
+    def _empty_metrics(self):
+        return {'counter': len(self.timestamps)}
+
+
+class FramePipelineTests(SimpleTestCase):
+    def frame_message(self, frame_id):
+        _, buffer = cv2.imencode('.jpg', np.full((24, 32, 3), 128, dtype=np.uint8))
+        return {'frame': 'data:image/jpeg;base64,' + base64.b64encode(buffer).decode(), 'frame_id': frame_id}
+
+    def test_busy_pipeline_drops_stale_frames_and_keeps_order(self):
+        analyzer = BlockingPoseAnalyzer()
+        responses = []
+        pipeline = FramePipeline(analyzer, responses.append)
+        pipeline.submit(self.frame_message(0), 0.0)
+        self.assertTrue(analyzer.busy.wait(5))
+        # With pose estimation stuck on frame 0 only three more frames fit
+        # in the pipeline, and the newest one always survives
+        for frame_id in range(1, 7):
+            pipeline.submit(self.frame_message(frame_id), frame_id / 10)
+        analyzer.release.set()
+        pipeline.close()
+        pipeline.join(5)
+
+        frame_ids = [response['frame_id'] for response in responses]
+        self.assertEqual(frame_ids, sorted(frame_ids))
+        self.assertEqual((frame_ids[0], frame_ids[-1]), (0, 6))
+        self.assertEqual(analyzer.timestamps, [frame_id / 10 for frame_id in frame_ids])
+        stats = pipeline.stats()
+        self.assertEqual(stats['completed'], len(responses))
+        self.assertEqual(stats['submitted'], 7)
+        self.assertEqual(stats['dropped'], 7 - len(responses))
+        self.assertGreaterEqual(stats['dropped'], 3)
+
+    def test_undecodable_frame_is_skipped(self):
+        analyzer = BlockingPoseAnalyzer()
+        analyzer.release.set()
+        responses = []
+        pipeline = FramePipeline(analyzer, responses.append)
+        pipeline.submit({'frame': 'data:image/jpeg;base64,AAAA', 'frame_id': 0}, 0.0)
+        pipeline.close()
+        pipeline.join(5)
+        self.assertEqual(responses, [])
+        self.assertEqual(pipeline.stats()['completed'], 0)
+
+
+class RepSegmentationTests(SimpleTestCase):
+    def stage_machine(self, reset, count):
+        """The live analyzer's per-frame stage update, as a mask of frames counting a rep"""
+        stage, counted = None, []
+        for is_reset, is_count in zip(reset, count):
+            counted.append(bool(is_count and not is_reset and stage == 'reset'))
+            if is_reset:
+                stage = 'reset'
+            elif counted[-1]:
+                stage = 'count'
+        return counted
+
+    def test_hysteresis_matches_the_per_frame_machine(self):
+        rng = np.random.default_rng(0)
+        for _ in range(20):
+            reset = rng.random(200) < 0.1
+            count = (rng.random(200) < 0.1) & ~reset
+            self.assertEqual(hysteresis_counts(reset, count).tolist(), self.stage_machine(reset, count))
+
+    def test_reps_match_the_live_analyzer(self):
+        rng = np.random.default_rng(1)
+        frames = 400
+        # Noisy curls that linger around both thresholds
+        angles = np.clip(95 + 80 * np.cos(2 * np.pi * np.arange(frames) / 40) + rng.normal(0, 8, frames), 0, 180)
+        landmarks = curl_landmarks(angles)
+        detected = rng.random(frames) > 0.1
+        indices = np.arange(frames)
+        timestamps = indices * 1000 / 30
+
+        analyzer = ExerciseAnalyzer('bicep_curls', model_mode='off')
+        counted_at = []
+        for index in np.flatnonzero(detected):
+            counter = analyzer.counter
+            analyzer.process_landmarks(array_to_landmarks(landmarks[index]), timestamp=timestamps[index] / 1000)
+            if analyzer.counter > counter:
+                counted_at.append(int(index))
+        analyzer.close()
+
+        result = segment_reps('bicep_curls', indices, timestamps, landmarks, detected)
+        self.assertGreater(result['reps'], 5)
+        self.assertEqual((result['reps'], result['stage']), (analyzer.counter, analyzer.stage))
+        for segment, counted in zip(result['segments'], counted_at):
+            self.assertLess(segment['start_frame'], counted)
+            self.assertLessEqual(segment['peak_frame'], segment['end_frame'])
+            self.assertLess(segment['min_angle'], 30)
+            self.assertGreater(segment['max_angle'], 160)
+            self.assertAlmostEqual(segment['duration'], segment['time_to_peak'] + segment['time_from_peak'])
+
+    def test_exercises_without_reps_are_rejected(self):
+        with self.assertRaises(ValueError):
+            segment_reps('planks', np.arange(1), np.zeros(1), np.zeros((1, 33, 4)))
+
+
+class DailyWorkoutRollupTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='athlete@example.com', username='athlete', password='password')
+        self.exercise = Exercise.objects.create(name='squats', body_part='legs', description='',
+                                                difficulty='beginner')
+
+    def record(self, days_ago=0, **fields):
+        workout = UserExercise.objects.create(user=self.user, exercise=self.exercise, **fields)
+        if days_ago:
+            UserExercise.objects.filter(pk=workout.pk).update(
+                created_at=workout.created_at - timedelta(days=days_ago))
+        return workout
+
+    def rollup(self, date=None):
+        return DailyWorkoutRollup.objects.get(user=self.user, date=date or timezone.localdate())
+
+    def test_saves_and_deletes_keep_the_day_up_to_date(self):
+        first = self.record(reps=10, duration=60, form_accuracy=80)
+        self.record()
+        rollup = self.rollup()
+        self.assertEqual((rollup.workouts, rollup.reps, rollup.duration), (2, 10, 60))
+        self.assertEqual(rollup.form_accuracy, 80)
+
+        # Analysis results saved later only add their difference
+        second = UserExercise.objects.exclude(pk=first.pk).get()
+        second.reps, second.duration, second.form_accuracy = 6, 30, 60
+        second.save()
+        rollup = self.rollup()
+        self.assertEqual((rollup.workouts, rollup.reps, rollup.duration), (2, 16, 90))
+        self.assertEqual(rollup.form_accuracy, 70)
+
+        first.delete()
+        rollup = self.rollup()
+        self.assertEqual((rollup.workouts, rollup.reps, rollup.duration), (1, 6, 30))
+        self.assertEqual(rollup.form_accuracy, 60)
+
+    def test_periods_read_the_week_and_month(self):
+        today = timezone.localdate()
+        DailyWorkoutRollup.objects.create(user=self.user, date=today, workouts=2, reps=20)
+        DailyWorkoutRollup.objects.create(user=self.user, date=today - timedelta(days=40), workouts=5, reps=50)
+
+        with self.assertNumQueries(1):
+            periods = workout_periods(self.user.pk, today)
+        self.assertEqual(periods['week']['workouts'], 2)
+        self.assertEqual(periods['month']['reps'], 20)
+        self.assertIsNone(periods['month']['form_accuracy'])
+
+    def test_backfill_rebuilds_rollups_from_history(self):
+        self.record(reps=10, form_accuracy=90)
+        self.record(days_ago=3, reps=4, duration=20)
+        self.record(days_ago=3, reps=6, duration=40, form_accuracy=50)
+        # Moving rows with update() bypasses the receivers, so they still count towards today
+        self.assertEqual(self.rollup().workouts, 3)
+
+        call_command('backfill_rollups', stdout=io.StringIO())
+
+        rollups = {(rollup.date, rollup.workouts, rollup.reps, rollup.duration, rollup.form_accuracy)
+                   for rollup in DailyWorkoutRollup.objects.all()}
+        today = timezone.localdate()
+        self.assertEqual(rollups, {(today, 1, 10, 0, 90), (today - timedelta(days=3), 2, 10, 60, 50)})
+
+
+class UserExerciseHistoryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='athlete@example.com', username='athlete', password='password')
+        self.squats = Exercise.objects.create(name='squats', body_part='legs', description='', difficulty='beginner')
+        self.curls = Exercise.objects.create(name='bicep_curls', body_part='arms', description='',
+                                             difficulty='beginner')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+
+        now = timezone.now()
+        workouts = UserExercise.objects.bulk_create(
+            UserExercise(user=self.user, exercise=self.squats if i % 2 else self.curls, reps=i) for i in range(7))
+        # Pairs of workouts share a timestamp, so pages must break ties on id
+        for i, workout in enumerate(workouts):
+            UserExercise.objects.filter(pk=workout.pk).update(created_at=now - timedelta(days=3 - i // 2))
+
+    def test_pages_follow_created_at_and_id_without_gaps(self):
+        ids, url = [], reverse('user-exercise-list') + '?page_size=2'
+        while url:
+            # Authenticated user and one page, however deep
+            with self.assertNumQueries(2):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), 2)
+            ids += [workout['id'] for workout in response.data['results']]
+            url = response.data['next']
+
+        expected = UserExercise.objects.order_by('-created_at', '-id').values_list('id', flat=True)
+        self.assertEqual(ids, list(expected))
+
+    def test_filters_by_exercise_and_dates(self):
+        response = self.client.get(reverse('user-exercise-list'), {'exercise': 'squats'})
+        self.assertEqual([workout['reps'] for workout in response.data['results']], [5, 3, 1])
+        self.assertEqual(response.data['results'][0]['exercise_name'], 'squats')
+
+        today = timezone.localdate()
+        response = self.client.get(reverse('user-exercise-list'), {
+            'exercise': self.curls.id, 'from': (today - timedelta(days=2)).isoformat(), 'to': today.isoformat()})
+        self.assertEqual([workout['reps'] for workout in response.data['results']], [6, 4, 2])
+
+        response = self.client.get(reverse('user-exercise-list'), {'from': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_created_workouts_are_stamped_by_the_server(self):
+        before = timezone.now()
+        response = self.client.post(reverse('user-exercise-list'), {
+            'exercise': self.squats.id, 'reps': 8, 'duration': 60, 'created_at': '2001-01-01T00:00:00Z'},
+            format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertGreaterEqual(UserExercise.objects.get(pk=response.data['id']).created_at, before)
+
+
+class WorkoutAnalyticsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='athlete@example.com', username='athlete', password='password')
+        self.squats = Exercise.objects.create(name='squats', body_part='legs', description='', difficulty='beginner')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+
+        now = timezone.now()
+        workouts = UserExercise.objects.bulk_create(
+            UserExercise(user=self.user, exercise=self.squats, reps=10 + day, form_accuracy=50 + day)
+            for day in range(10))
+        for day, workout in enumerate(workouts):
+            UserExercise.objects.filter(pk=workout.pk).update(created_at=now - timedelta(days=9 - day))
+
+    def test_daily_buckets_are_downsampled_without_changing_totals(self):
+        response = self.client.get(reverse('workout-analytics'), {'bucket': 'day', 'points': 4})
+        self.assertEqual(response.status_code, 200)
+        points = response.data['series']['squats']
+        self.assertEqual([point['sessions'] for point in points], [3, 3, 3, 1])
+        self.assertEqual(sum(point['reps'] for point in points), sum(range(10, 20)))
+        self.assertEqual(points[0]['reps_per_session'], 11)
+        self.assertEqual(points[-1]['form_accuracy'], 59)
+
+    def test_charts_are_cached_until_a_workout_is_saved(self):
+        url = reverse('workout-analytics')
+        first = self.client.get(url, {'bucket': 'month'}).data
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url, {'bucket': 'month'}).data, first)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            UserExercise.objects.create(user=self.user, exercise=self.squats, reps=5)
+        sessions = sum(point['sessions'] for point in self.client.get(url, {'bucket': 'month'}).data['series']['squats'])
+        self.assertEqual(sessions, 11)
+
+    def test_rejects_unknown_bucket(self):
+        response = self.client.get(reverse('workout-analytics'), {'bucket': 'hour'})
+        self.assertEqual(response.status_code, 400)
+
+
+class LeaderboardTests(TestCase):
+    def setUp(self):
+        get_backend().clear()
+        self.users = [User.objects.create_user(email=f'user{i}@example.com', username=f'user{i}', password='password')
+                      for i in range(3)]
+        self.client = APIClient()
+
+    def complete_workout(self, user, **data):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('update_user_stats'), data, format='json')
+
+    def test_in_memory_ranks_match_a_full_sort(self):
+        backend = InMemoryLeaderboardBackend()
+        scores = {str(member): (member * 7) % 5 for member in range(20)}
+        for member, score in scores.items():
+            backend.increment('board', member, score + 1)
+            backend.increment('board', member, -1)
+        ranking = sorted(scores.items(), key=lambda item: (item[1], item[0]), reverse=True)
+
+        self.assertEqual(backend.top('board', 3, 5), ranking[3:8])
+        for position, (member, _) in enumerate(ranking):
+            self.assertEqual(backend.rank('board', member), position)
+
+    def test_workouts_rank_users_per_window_and_exercise(self):
+        self.complete_workout(self.users[0], exercise_type='squats', reps=10, form_accuracy=80)
+        self.complete_workout(self.users[1], exercise_type='squats', reps=30, form_accuracy=95)
+        self.complete_workout(self.users[2], exercise_type='bicep_curls', reps=20, form_accuracy=70)
+        self.complete_workout(self.users[0], exercise_type='squats', reps=15, form_accuracy=90)
+
+        response = self.client.get(reverse('leaderboard'), {'metric': 'reps', 'window': 'daily'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(entry['username'], entry['score']) for entry in response.data['entries']],
+                         [('user1', 30), ('user0', 25), ('user2', 20)])
+        # The requesting user is the last one authenticated
+        self.assertEqual(response.data['me'], {'rank': 2, 'score': 25})
+
+        response = self.client.get(reverse('leaderboard'),
+                                   {'metric': 'form_accuracy', 'window': 'weekly', 'exercise': 'squats'})
+        self.assertEqual([(entry['username'], entry['score']) for entry in response.data['entries']],
+                         [('user1', 95), ('user0', 85)])
+
+        response = self.client.get(reverse('leaderboard'), {'metric': 'streak', 'window': 'all_time', 'limit': 1})
+        self.assertEqual(response.data['total'], 3)
+        self.assertEqual(len(response.data['entries']), 1)
+
+        response = self.client.get(reverse('leaderboard'), {'metric': 'streak', 'window': 'daily'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_streaks_rank_the_best_streak(self):
+        # user0 once had a 7 day streak; it lapsed and a new one starts today
+        UserStats.objects.filter(user=self.users[0]).update(current_streak=0, highest_streak=7)
+        self.complete_workout(self.users[0], exercise_type='squats', reps=10)
+        self.complete_workout(self.users[1], exercise_type='squats', reps=10)
+
+        response = self.client.get(reverse('leaderboard'), {'metric': 'streak', 'window': 'all_time'})
+        self.assertEqual([(entry['username'], entry['score']) for entry in response.data['entries']],
+                         [('user0', 7), ('user1', 1)])
+
+        get_backend().clear()
+        call_command('rebuild_leaderboards', stdout=io.StringIO())
+        response = self.client.get(reverse('leaderboard'), {'metric': 'streak', 'window': 'all_time'})
+        self.assertEqual([(entry['username'], entry['score']) for entry in response.data['entries']][:2],
+                         [('user0', 7), ('user1', 1)])
+
+
+class SessionUploadTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='athlete@example.com', username='athlete', password='password')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+
+    def sessions(self):
+        now = timezone.now()
+        return [
+            {'client_session_id': str(uuid.uuid4()), 'exercise_type': 'squats', 'reps': 12, 'duration': 90,
+             'form_accuracy': 92, 'recorded_at': (now - timedelta(days=days)).isoformat()}
+            for days in (2, 1, 1)
+        ] + [{'client_session_id': str(uuid.uuid4()), 'exercise_type': 'lunges', 'reps': 8, 'duration': 60}]
+
+    def test_batch_is_recorded_once_with_rollups_and_stats(self):
+        sessions = self.sessions()
+        response = self.client.post(reverse('upload-sessions'), {'sessions': sessions}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['created'], response.data['duplicates']), (4, 0))
+
+        # A retried upload, plus a session repeated within the batch: user and exercises lookups,
+        # then the recorded session ids in a savepoint
+        with self.assertNumQueries(5):
+            response = self.client.post(reverse('upload-sessions'), {'sessions': sessions + sessions[:1]},
+                                        format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['created'], response.data['duplicates']), (0, 5))
+
+        self.assertEqual(UserExercise.objects.filter(user=self.user).count(), 4)
+        today = timezone.localdate()
+        self.assertEqual(
+            dict(DailyWorkoutRollup.objects.filter(user=self.user).values_list('date', 'workouts')),
+            {today - timedelta(days=2): 1, today - timedelta(days=1): 2, today: 1})
+        stats = UserStats.objects.select_related('user').get(user=self.user)
+        self.assertEqual((stats.total_exercises, stats.total_reps, stats.perfect_form_reps), (4, 44, 36))
+        # Three consecutive active days
+        self.assertEqual((stats.current_streak, stats.user.daily_streak, stats.last_workout_date), (3, 3, today))
+
+    def test_invalid_batches_are_rejected_whole(self):
+        sessions = self.sessions()
+        sessions[1]['exercise_type'] = 'jumping_jacks'
+        response = self.client.post(reverse('upload-sessions'), {'sessions': sessions}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        sessions[1]['exercise_type'] = 'planks'
+        Exercise.objects.filter(name='planks').delete()
+        response = self.client.post(reverse('upload-sessions'), {'sessions': sessions}, format='json')
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(UserExercise.objects.exists())
+
+    def test_single_session_save(self):
+        session_id = str(uuid.uuid4())
+        for _ in range(2):
+            response = self.client.post(reverse('save-exercise-session', args=['squats']), {
+                'client_session_id': session_id, 'metrics': {'counter': 10, 'form_accuracy': 80}}, format='json')
+            self.assertIn(response.status_code, (200, 201))
+        self.assertEqual(UserExercise.objects.get().id, response.data['session_id'])
+
+
+class WriteBehindBufferTests(SimpleTestCase):
+    def test_coalesces_bounds_and_drains(self):
+        written = []
+        buffer = WriteBehindBuffer(written.extend, max_items=2, flush_interval=60, batch_size=10)
+        self.assertTrue(buffer.put('a', 'a1', droppable=True))
+        self.assertTrue(buffer.put('a', 'a2', droppable=True))
+        self.assertTrue(buffer.put('b', 'b1', droppable=True))
+        # When full, new records evict the oldest checkpoint
+        self.assertTrue(buffer.put('c', 'c1'))
+        self.assertTrue(buffer.put('d', 'd1', droppable=True))
+        self.assertTrue(buffer.put('e', 'e1'))
+        # and are refused once only summaries are left
+        self.assertFalse(buffer.put('f', 'f1'))
+        self.assertFalse(buffer.put('g', 'g1', droppable=True))
+
+        buffer.drain(timeout=5)
+        self.assertEqual(written, ['c1', 'e1'])
+        self.assertEqual(buffer.stats()['dropped'], 4)
+        self.assertFalse(buffer.put('h', 'h1'))
+
+    def test_failed_flushes_are_retried(self):
+        written, failures = [], [RuntimeError('database unavailable')]
+
+        def flush(records):
+            if failures:
+                raise failures.pop()
+            written.extend(records)
+
+        buffer = WriteBehindBuffer(flush, flush_interval=0.01)
+        buffer.put('a', 'a1')
+        self.assertTrue(buffer.wait_until_written(timeout=5))
+        buffer.drain(timeout=5)
+        self.assertEqual(written, ['a1'])
+        self.assertEqual(buffer.stats()['failed_flushes'], 1)
+
+
+class LiveSessionPersistenceTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='athlete@example.com', username='athlete', password='password')
+
+    def record(self, tracker, completed=False, **metrics):
+        tracker.add_frame({'counter': 0, 'correct_form': True, 'form_source': 'rules', **metrics})
+        return tracker.record(completed)
+
+    def test_checkpoints_then_summary_record_one_workout(self):
+        tracker = LiveSessionTracker(self.user.pk, 'squats', uuid.uuid4())
+        checkpoint = self.record(tracker, counter=3)
+        persist_live_sessions([self.record(tracker, counter=4), checkpoint])
+        self.assertEqual(LiveSession.objects.get().reps, 4)
+        self.assertFalse(UserExercise.objects.exists())
+
+        summary = self.record(tracker, completed=True, counter=6, correct_form=False, feedback=['Go lower'])
+        persist_live_sessions([summary])
+        # Retried and late writes do not record the workout again or reopen it
+        persist_live_sessions([summary, checkpoint])
+
+        session = LiveSession.objects.get()
+        self.assertTrue(session.completed)
+        self.assertEqual(session.reps, 6)
+        workout = UserExercise.objects.get()
+        self.assertEqual((workout.reps, workout.client_session_id, workout.feedback), (6, session.client_session_id,
+                                                                                        'Go lower'))
+        self.assertAlmostEqual(workout.form_accuracy, 200 / 3)
+        self.assertEqual(UserStats.objects.get(user=self.user).total_exercises, 1)
+
+    def test_failing_records_do_not_lose_the_rest_of_the_batch(self):
+        other = User.objects.create_user(email='other@example.com', username='other', password='password')
+        deleted = User.objects.create_user(email='gone@example.com', username='gone', password='password')
+        records = [self.record(LiveSessionTracker(user.pk, 'squats', uuid.uuid4()), completed=True, counter=5)
+                   for user in (self.user, other, deleted)]
+        deleted.delete()
+
+        def ingest(user, sessions):
+            if user == other:
+                raise ValueError('ingest failed')
+            return ingest_sessions(user, sessions)
+
+        with mock.patch('exercises.services.live_sessions.ingest_sessions', side_effect=ingest):
+            persist_live_sessions(records)
+
+        self.assertEqual(list(LiveSession.objects.values_list('user_id', flat=True)), [self.user.pk])
+        self.assertEqual(list(UserExercise.objects.values_list('user_id', 'reps')), [(self.user.pk, 5)])
+
+    def test_socket_tells_the_client_its_session_id(self):
+        async def connect():
+            communicator = WebsocketCommunicator(URLRouter(routing.websocket_urlpatterns), '/ws/exercise/squats/')
+            connected, _ = await communicator.connect()
+            message = await communicator.receive_json_from()
+            await communicator.disconnect()
+            return connected, message
+
+        with mock.patch.object(ExerciseAnalysisConsumer, 'authenticate', mock.AsyncMock(return_value=self.user)):
+            connected, message = async_to_sync(connect)()
+        self.assertTrue(connected)
+        self.assertEqual(message['type'], 'session_started')
+        self.assertEqual(uuid.UUID(message['client_session_id']).version, 4)
+
+    def test_live_sessions_also_posted_to_update_stats_count_once(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        def update_stats(tracker):
+            return client.post(reverse('update_user_stats'), {
+                'exercise_type': 'squats', 'reps': 6, 'duration': 30,
+                'client_session_id': str(tracker.client_session_id),
+            }, format='json')
+
+        # Saved by the socket first, then posted by the client
+        saved = LiveSessionTracker(self.user.pk, 'squats', uuid.uuid4())
+        persist_live_sessions([self.record(saved, completed=True, counter=6)])
+        response = update_stats(saved)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['stats']['total_exercises'], 1)
+        self.assertEqual(response.data['stats']['weekly_workouts'], 1)
+        self.assertEqual(response.data['new_achievements'], [])
+
+        # Posted by the client before the socket's write-behind buffer saved it
+        posted = LiveSessionTracker(self.user.pk, 'squats', uuid.uuid4())
+        self.assertEqual(update_stats(posted).data['stats']['total_exercises'], 2)
+        persist_live_sessions([self.record(posted, completed=True, counter=6)])
+
+        self.assertEqual(UserExercise.objects.filter(user=self.user).count(), 2)
+        self.assertTrue(LiveSession.objects.get(client_session_id=posted.client_session_id).completed)
+        stats = UserStats.objects.get(user=self.user)
+        self.assertEqual((stats.total_exercises, stats.total_reps), (2, 12))
+        self.assertEqual(workout_periods(self.user.pk)['week']['workouts'], 2)
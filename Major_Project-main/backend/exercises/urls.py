@@ -6,13 +6,20 @@ router = DefaultRouter()
 router.register(r'', views.ExerciseViewSet, basename='exercise')
 
 urlpatterns = [
-    path('', include(router.urls)),
     path('user/', views.UserExerciseList.as_view(), name='user-exercise-list'),
+    path('analytics/', views.workout_analytics, name='workout-analytics'),
+    path('leaderboard/', views.get_leaderboard, name='leaderboard'),
+    path('sessions/', views.upload_sessions, name='upload-sessions'),
+    path('<str:exercise_type>/save/', views.save_exercise_session, name='save-exercise-session'),
     path('process/<int:exercise_id>/', views.process_exercise_video, 
          name='process-video'),
     path('process-video/<str:exercise_type>/', views.process_video, name='process-video'),
     path('bicep_curls/', views.bicep_curls, name='bicep_curls'),
     path('squats/', views.squats, name='squats'),
     path('pushups/', views.pushups, name='pushups'),
+    path('jobs/<int:job_id>/', views.analysis_job_status, name='analysis-job-status'),
+    path('analyze-batch/<str:exercise_type>/', views.analyze_frame_batch, name='analyze-frame-batch'),
     path('test-models/', views.test_ml_models, name='test-ml-models'),
+    # Last, so the router's <pk>/ routes do not shadow the paths above
+    path('', include(router.urls)),
 ]
\ No newline at end of file
@@ -1,21 +1,43 @@
 from rest_framework import generics, status, viewsets
 from rest_framework.response import Response
-from rest_framework.decorators import api_view, permission_classes, parser_classes, action
+from rest_framework.decorators import api_view, authentication_classes, permission_classes, parser_classes, action
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.parsers import MultiPartParser
+from rest_framework.parsers import MultiPartParser, JSONParser
+from rest_framework.exceptions import ValidationError
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
 import cv2
 import numpy as np
-from .models import Exercise, UserExercise
-from .serializers import ExerciseSerializer, UserExerciseSerializer
+from .models import Exercise, UserExercise, AnalysisJob
+from authentication.models import User
+from .serializers import (
+    AnalysisJobSerializer,
+    ExerciseSerializer,
+    UserExerciseSerializer,
+    WorkoutSessionBatchSerializer,
+    WorkoutSessionSerializer,
+)
+from .pagination import KeysetPagination
 from .services.exercise_analysis import ExerciseAnalyzer
+from .services.analyzer_cache import analyzer_cache
+from .services.analysis_jobs import enqueue_analysis
+from .services.analytics import BUCKETS, get_workout_trends
+from .services.leaderboards import METRIC_WINDOWS, leaderboard
+from .services.session_ingest import ingest_sessions
+from .services.video_store import create_user_exercise
 from django.shortcuts import render, get_object_or_404
+from django.urls import reverse
 import mediapipe as mp
 import base64
+import binascii
+import math
 from django.core.files.storage import default_storage
 import os
 from .services.model_tester import ModelTester
 from django.conf import settings
 from django.core.files.base import ContentFile
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from datetime import datetime, timedelta
 import tempfile
 
 class ExerciseList(generics.ListAPIView):
@@ -23,16 +45,56 @@ class ExerciseList(generics.ListAPIView):
     serializer_class = ExerciseSerializer
     permission_classes = [IsAuthenticated]
 
+def _parse_history_date(request, name):
+    value = request.query_params.get(name)
+    if not value:
+        return None
+    date = parse_date(value)
+    if date is None:
+        raise ValidationError({'error': f'Invalid {name} date, expected YYYY-MM-DD'})
+    # Compare created_at against datetimes rather than created_at::date so the index is used
+    return timezone.make_aware(datetime.combine(date, datetime.min.time()))
+
 class UserExerciseList(generics.ListCreateAPIView):
+    """
+    The user's workouts, newest first, in keyset-paginated pages. Optional
+    filters: `exercise` (id or exercise type), and `from` / `to` dates
+    (YYYY-MM-DD, inclusive).
+    """
     serializer_class = UserExerciseSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
-        return UserExercise.objects.filter(user=self.request.user)
+        queryset = UserExercise.objects.filter(user=self.request.user).select_related('exercise')
+        exercise = self.request.query_params.get('exercise')
+        if exercise:
+            if exercise.isdigit():
+                queryset = queryset.filter(exercise_id=int(exercise))
+            else:
+                queryset = queryset.filter(exercise__name=exercise)
+        start = _parse_history_date(self.request, 'from')
+        if start:
+            queryset = queryset.filter(created_at__gte=start)
+        end = _parse_history_date(self.request, 'to')
+        if end:
+            queryset = queryset.filter(created_at__lt=end + timedelta(days=1))
+        return queryset
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
+def _queued_job_response(request, job):
+    """
+    202 response pointing the client at the job's status endpoint, or 200
+    when the job was completed from an earlier analysis of the same video
+    """
+    return Response({
+        'exercise_id': job.user_exercise_id,
+        'job': AnalysisJobSerializer(job).data,
+        'status_url': request.build_absolute_uri(reverse('analysis-job-status', args=[job.id]))
+    }, status=status.HTTP_200_OK if job.status == AnalysisJob.STATUS_SUCCEEDED else status.HTTP_202_ACCEPTED)
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def process_exercise_video(request, exercise_id):
@@ -44,89 +106,183 @@ def process_exercise_video(request, exercise_id):
             return Response({'error': 'No video file provided'}, 
                           status=status.HTTP_400_BAD_REQUEST)
 
-        analyzer = ExerciseAnalyzer(exercise.name)
-        results = analyzer.analyze_video(video_file)
-        
-        user_exercise = UserExercise.objects.create(
-            user=request.user,
-            exercise=exercise,
-            reps=results['reps'],
-            form_accuracy=results['accuracy'],
-            feedback=results['feedback'],
-            video_recording=video_file
-        )
-        
-        return Response({
-            'exercise_id': user_exercise.id,
-            'results': results
-        })
+        user_exercise = create_user_exercise(request.user, exercise, video_file)
+        job = enqueue_analysis(user_exercise)
+        return _queued_job_response(request, job)
         
     except Exercise.DoesNotExist:
         return Response({'error': 'Exercise not found'}, 
                       status=status.HTTP_404_NOT_FOUND)
         
 @api_view(['POST'])
+@permission_classes([IsAuthenticated])
 def process_video(request, exercise_type):
     video_file = request.FILES.get('video')
     if not video_file:
         return Response({'error': 'No video file provided'}, 
                       status=status.HTTP_400_BAD_REQUEST)
 
-    # Save video temporarily
-    with tempfile.NamedTemporaryFile(suffix='.mp4', delete=False) as tmp_file:
-        for chunk in video_file.chunks():
-            tmp_file.write(chunk)
-        video_path = tmp_file.name
+    exercise = Exercise.objects.filter(name=exercise_type).first()
+    if exercise is None:
+        return Response({'error': 'Exercise type not found'}, 
+                      status=status.HTTP_404_NOT_FOUND)
+
+    user_exercise = create_user_exercise(request.user, exercise, video_file)
+    job = enqueue_analysis(user_exercise)
+    return _queued_job_response(request, job)
 
+@api_view(['GET'])
+@authentication_classes([JWTStatelessUserAuthentication])
+@permission_classes([IsAuthenticated])
+def workout_analytics(request):
+    """
+    Per-exercise progress chart series: sessions, reps, reps per session,
+    duration and form accuracy per `bucket` (day, week or month), merged
+    down to at most `points` points per exercise. Optional `exercise`
+    (id or type) and inclusive `from` / `to` dates.
+    """
+    bucket = request.query_params.get('bucket', 'week')
+    if bucket not in BUCKETS:
+        return Response({'error': f"Invalid bucket, expected one of: {', '.join(BUCKETS)}"},
+                        status=status.HTTP_400_BAD_REQUEST)
     try:
-        analyzer = ExerciseAnalyzer(exercise_type)
-        cap = cv2.VideoCapture(video_path)
-        
-        total_metrics = {
-            'reps': 0,
-            'form_accuracy': 0,
-            'total_frames': 0,
-            'correct_frames': 0
-        }
+        points = int(request.query_params.get('points', settings.ANALYTICS_DEFAULT_POINTS))
+    except ValueError:
+        return Response({'error': 'points must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+    points = max(1, min(points, settings.ANALYTICS_MAX_POINTS))
+
+    exercise = request.query_params.get('exercise') or None
+    if exercise and exercise.isdigit():
+        exercise = int(exercise)
+    start = _parse_history_date(request, 'from')
+    end = _parse_history_date(request, 'to')
+    if end:
+        end += timedelta(days=1)
+
+    series = get_workout_trends(request.user.id, bucket, points, exercise, start, end)
+    return Response({'bucket': bucket, 'series': series})
 
-        while cap.isOpened():
-            ret, frame = cap.read()
-            if not ret:
-                break
+@api_view(['GET'])
+@authentication_classes([JWTStatelessUserAuthentication])
+@permission_classes([IsAuthenticated])
+def get_leaderboard(request):
+    """
+    A page of a leaderboard and the user's own place on it. `metric` is reps,
+    form_accuracy or streak, `window` daily, weekly or all_time, and
+    `exercise` an exercise type (default: all exercises).
+    """
+    metric = request.query_params.get('metric', 'reps')
+    window = request.query_params.get('window', 'weekly')
+    exercise = request.query_params.get('exercise') or None
+    if metric not in METRIC_WINDOWS:
+        return Response({'error': f"Invalid metric, expected one of: {', '.join(METRIC_WINDOWS)}"},
+                        status=status.HTTP_400_BAD_REQUEST)
+    if window not in METRIC_WINDOWS[metric]:
+        return Response({'error': f"Invalid window for {metric}, expected one of: {', '.join(METRIC_WINDOWS[metric])}"},
+                        status=status.HTTP_400_BAD_REQUEST)
+    if exercise is not None and (metric == 'streak' or exercise not in dict(Exercise.EXERCISE_TYPES)):
+        return Response({'error': 'Invalid exercise for this leaderboard'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        offset = max(int(request.query_params.get('offset', 0)), 0)
+        limit = min(max(int(request.query_params.get('limit', 20)), 1), 100)
+    except ValueError:
+        return Response({'error': 'offset and limit must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+
+    board = leaderboard(metric, window, exercise, request.user.id, offset, limit)
+    usernames = dict(User.objects.filter(pk__in=[entry['user_id'] for entry in board['entries']])
+                     .values_list('id', 'username'))
+    for entry in board['entries']:
+        entry['username'] = usernames.get(entry['user_id'])
+    return Response({'metric': metric, 'window': window, 'exercise': exercise, **board})
 
-            processed_frame, metrics = analyzer.process_frame(frame)
-            total_metrics['total_frames'] += 1
-            if metrics.get('correct_form'):
-                total_metrics['correct_frames'] += 1
-            
-        cap.release()
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def analysis_job_status(request, job_id):
+    """Poll a background video analysis job"""
+    job = get_object_or_404(AnalysisJob, id=job_id, user=request.user)
+    return Response(AnalysisJobSerializer(job).data)
+
+def _decode_frame(frame_bytes):
+    """Decode an encoded image (JPEG/PNG bytes) into a BGR frame, or None"""
+    nparr = np.frombuffer(frame_bytes, np.uint8)
+    return cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+
+def _decode_base64(frame_data):
+    """Bytes of a base64 frame, optionally a data URL, or None when it is not valid base64"""
+    try:
+        return base64.b64decode(str(frame_data).split(',')[-1])
+    except (binascii.Error, ValueError):
+        return None
 
-        # Calculate final metrics
-        form_accuracy = (total_metrics['correct_frames'] / total_metrics['total_frames'] * 100 
-                        if total_metrics['total_frames'] > 0 else 0)
+def _parse_timestamp(value):
+    """A client capture timestamp (ms) as a float, or None when it is not a finite number"""
+    try:
+        timestamp = float(value)
+    except (TypeError, ValueError):
+        return None
+    return timestamp if math.isfinite(timestamp) else None
 
-        # Save exercise record
-        exercise_data = {
-            'user': request.user,
-            'exercise_type': exercise_type,
-            'reps': analyzer.reps,
-            'form_accuracy': form_accuracy,
-            'video_file': video_file
+def _analyze_frame_request(request, exercise_type):
+    """
+    Analyze a single base64 frame for the frame-by-frame REST endpoints.
+
+    When the client sends a `session_id` the analyzer is reused from the
+    per-worker cache, so models stay loaded and reps are counted across
+    requests. Without one a throwaway analyzer is built for the frame.
+    Sending `end_session: true` releases the cached analyzer afterwards.
+    """
+    try:
+        # Get frame data from request
+        frame_data = request.data.get('frame')
+        if not frame_data:
+            return Response({'error': 'No frame data provided'}, 
+                          status=status.HTTP_400_BAD_REQUEST)
+
+        # Decode base64 frame
+        frame_bytes = _decode_base64(frame_data)
+        frame = _decode_frame(frame_bytes) if frame_bytes else None
+        if frame is None:
+            return Response({'error': 'Invalid frame data'}, 
+                          status=status.HTTP_400_BAD_REQUEST)
+
+        # Process frame, timing on the client's capture clock (ms) when sent
+        timestamp = request.data.get('timestamp')
+        if timestamp not in (None, ''):
+            timestamp = _parse_timestamp(timestamp)
+            if timestamp is None:
+                return Response({'error': 'Invalid timestamp'}, 
+                              status=status.HTTP_400_BAD_REQUEST)
+            timestamp /= 1000
+        else:
+            timestamp = None
+        session_id = request.data.get('session_id')
+        if session_id:
+            with analyzer_cache.checkout(request.user.id, session_id, exercise_type) as analyzer:
+                processed_frame, metrics = analyzer.process_frame(frame, timestamp)
+            if str(request.data.get('end_session', '')).lower() in ('1', 'true'):
+                analyzer_cache.discard(request.user.id, session_id, exercise_type)
+        else:
+            analyzer = ExerciseAnalyzer(exercise_type, model_mode=settings.LIVE_FORM_MODEL_MODE)
+            try:
+                processed_frame, metrics = analyzer.process_frame(frame, timestamp)
+            finally:
+                analyzer.close()
+
+        # Encode processed frame back to base64
+        _, buffer = cv2.imencode('.jpg', processed_frame)
+        processed_frame_data = base64.b64encode(buffer).decode('utf-8')
+
+        response = {
+            'frame': processed_frame_data,
+            'metrics': metrics
         }
-        
-        serializer = UserExerciseSerializer(data=exercise_data)
-        if serializer.is_valid():
-            serializer.save()
-            return Response({
-                'reps': analyzer.reps,
-                'form_accuracy': form_accuracy,
-                'exercise_id': serializer.data['id']
-            })
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        if session_id:
+            response['session_id'] = session_id
+        return Response(response)
 
-    finally:
-        import os
-        os.unlink(video_path)
+    except Exception as e:
+        return Response({'error': str(e)}, 
+                      status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticated])
@@ -151,36 +307,7 @@ def bicep_curls(request):
         })
 
     elif request.method == 'POST':
-        try:
-            # Initialize exercise analyzer
-            analyzer = ExerciseAnalyzer('bicep_curls')
-            
-            # Get frame data from request
-            frame_data = request.data.get('frame')
-            if not frame_data:
-                return Response({'error': 'No frame data provided'}, 
-                              status=status.HTTP_400_BAD_REQUEST)
-
-            # Decode base64 frame
-            frame_bytes = base64.b64decode(frame_data)
-            nparr = np.frombuffer(frame_bytes, np.uint8)
-            frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-
-            # Process frame
-            processed_frame, metrics = analyzer.process_frame(frame)
-
-            # Encode processed frame back to base64
-            _, buffer = cv2.imencode('.jpg', processed_frame)
-            processed_frame_data = base64.b64encode(buffer).decode('utf-8')
-
-            return Response({
-                'frame': processed_frame_data,
-                'metrics': metrics
-            })
-
-        except Exception as e:
-            return Response({'error': str(e)}, 
-                          status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return _analyze_frame_request(request, 'bicep_curls')
 
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticated])
@@ -205,30 +332,7 @@ def squats(request):
         })
 
     elif request.method == 'POST':
-        try:
-            analyzer = ExerciseAnalyzer('squats')
-            frame_data = request.data.get('frame')
-            if not frame_data:
-                return Response({'error': 'No frame data provided'}, 
-                              status=status.HTTP_400_BAD_REQUEST)
-
-            frame_bytes = base64.b64decode(frame_data)
-            nparr = np.frombuffer(frame_bytes, np.uint8)
-            frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-
-            processed_frame, metrics = analyzer.process_frame(frame)
-
-            _, buffer = cv2.imencode('.jpg', processed_frame)
-            processed_frame_data = base64.b64encode(buffer).decode('utf-8')
-
-            return Response({
-                'frame': processed_frame_data,
-                'metrics': metrics
-            })
-
-        except Exception as e:
-            return Response({'error': str(e)}, 
-                          status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return _analyze_frame_request(request, 'squats')
 
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticated])
@@ -253,61 +357,178 @@ def pushups(request):
         })
 
     elif request.method == 'POST':
-        try:
-            analyzer = ExerciseAnalyzer('pushups')
-            frame_data = request.data.get('frame')
-            if not frame_data:
-                return Response({'error': 'No frame data provided'}, 
-                              status=status.HTTP_400_BAD_REQUEST)
+        return _analyze_frame_request(request, 'pushups')
 
-            frame_bytes = base64.b64decode(frame_data)
-            nparr = np.frombuffer(frame_bytes, np.uint8)
-            frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@parser_classes([MultiPartParser, JSONParser])
+def analyze_frame_batch(request, exercise_type):
+    """
+    Analyze an ordered burst of frames in one request.
+
+    Frames are sent either as repeated multipart `frames` files (in order) or
+    as a JSON list of base64 strings under `frames`. They run through one
+    warm analyzer (the session's cached one when `session_id` is given) with
+    a single batched model call. Optional `timestamps` (client capture time
+    in ms, one per frame) drive timed exercises. Annotated frames are only
+    returned when `include_frames` is set.
+    """
+    try:
+        uploaded_frames = request.FILES.getlist('frames')
+        if uploaded_frames:
+            encoded_frames = [uploaded.read() for uploaded in uploaded_frames]
+        else:
+            encoded_frames = [_decode_base64(frame_data) for frame_data in request.data.get('frames') or []]
+
+        if not encoded_frames:
+            return Response({'error': 'No frames provided'}, 
+                          status=status.HTTP_400_BAD_REQUEST)
+        if len(encoded_frames) > settings.ANALYSIS_BATCH_MAX_FRAMES:
+            return Response({'error': f'At most {settings.ANALYSIS_BATCH_MAX_FRAMES} frames per batch'}, 
+                          status=status.HTTP_400_BAD_REQUEST)
 
-            processed_frame, metrics = analyzer.process_frame(frame)
+        frames = [_decode_frame(frame_bytes) if frame_bytes else None for frame_bytes in encoded_frames]
+        invalid = [index for index, frame in enumerate(frames) if frame is None]
+        if invalid:
+            return Response({'error': 'Invalid frame data', 'frames': invalid}, 
+                          status=status.HTTP_400_BAD_REQUEST)
 
-            _, buffer = cv2.imencode('.jpg', processed_frame)
-            processed_frame_data = base64.b64encode(buffer).decode('utf-8')
+        # Optional per-frame client capture timestamps (ms)
+        if hasattr(request.data, 'getlist'):
+            timestamps = request.data.getlist('timestamps')
+        else:
+            timestamps = request.data.get('timestamps') or []
+        if timestamps and len(timestamps) != len(frames):
+            return Response({'error': 'Expected one timestamp per frame'}, 
+                          status=status.HTTP_400_BAD_REQUEST)
+        timestamps = [_parse_timestamp(timestamp) for timestamp in timestamps]
+        invalid = [index for index, timestamp in enumerate(timestamps) if timestamp is None]
+        if invalid:
+            return Response({'error': 'Invalid timestamps', 'timestamps': invalid}, 
+                          status=status.HTTP_400_BAD_REQUEST)
+        timestamps = [timestamp / 1000 for timestamp in timestamps] or None
+
+        session_id = request.data.get('session_id')
+        if session_id:
+            with analyzer_cache.checkout(request.user.id, session_id, exercise_type) as analyzer:
+                start_counter = analyzer.counter
+                annotated_frames, frame_metrics = analyzer.process_frames(frames, timestamps)
+        else:
+            analyzer = ExerciseAnalyzer(exercise_type, model_mode=settings.LIVE_FORM_MODEL_MODE)
+            start_counter = analyzer.counter
+            try:
+                annotated_frames, frame_metrics = analyzer.process_frames(frames, timestamps)
+            finally:
+                analyzer.close()
+
+        include_frames = str(request.data.get('include_frames', '')).lower() in ('1', 'true')
+        results = []
+        feedback_counts = {}
+        for index, metrics in enumerate(frame_metrics):
+            result = {'index': index, 'metrics': metrics}
+            if include_frames:
+                _, buffer = cv2.imencode('.jpg', annotated_frames[index])
+                result['frame'] = base64.b64encode(buffer).decode('utf-8')
+            results.append(result)
+            for item in metrics.get('feedback') or []:
+                feedback_counts[item] = feedback_counts.get(item, 0) + 1
 
-            return Response({
-                'frame': processed_frame_data,
-                'metrics': metrics
-            })
+        pose_frames = [metrics for metrics in frame_metrics if 'form_source' in metrics]
+        model_frames = sum(1 for metrics in pose_frames if metrics['form_source'] == 'model')
+        correct_frames = sum(1 for metrics in pose_frames if metrics.get('correct_form'))
+        response = {
+            'frames': results,
+            'summary': {
+                'total_frames': len(frames),
+                'pose_frames': len(pose_frames),
+                'correct_frames': correct_frames,
+                'form_accuracy': correct_frames / len(pose_frames) * 100 if pose_frames else 0,
+                'reps': analyzer.counter,
+                'batch_reps': analyzer.counter - start_counter,
+                'stage': analyzer.stage,
+                'feedback': sorted(feedback_counts, key=feedback_counts.get, reverse=True)[:3],
+                'model_calls': model_frames,
+                'model_calls_avoided': 1 - model_frames / len(pose_frames) if pose_frames else 0
+            }
+        }
+        if session_id:
+            response['session_id'] = session_id
+        return Response(response)
 
-        except Exception as e:
-            return Response({'error': str(e)}, 
-                          status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    except Exception as e:
+        return Response({'error': str(e)}, 
+                      status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+def _ingest_sessions_response(request, sessions):
+    """Record validated WorkoutSessionSerializer data for the user"""
+    exercises = {}
+    for exercise in Exercise.objects.filter(name__in={session['exercise_type'] for session in sessions}).order_by('id'):
+        exercises.setdefault(exercise.name, exercise)
+    missing = {session['exercise_type'] for session in sessions} - set(exercises)
+    if missing:
+        return Response({'error': f"Exercise type not found: {', '.join(sorted(missing))}"},
+                        status=status.HTTP_404_NOT_FOUND)
+    for session in sessions:
+        session['exercise'] = exercises[session['exercise_type']]
+
+    created, recorded = ingest_sessions(request.user, sessions)
+    return Response({
+        'created': len(created),
+        'duplicates': len(sessions) - len(created),
+        'sessions': [{'client_session_id': user_exercise.client_session_id, 'session_id': user_exercise.id}
+                     for user_exercise in created]
+                    + [{'client_session_id': session_id, 'session_id': pk} for session_id, pk in recorded.items()],
+    }, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
-def save_exercise_session(request):
+def save_exercise_session(request, exercise_type):
     """Save completed exercise session data"""
     try:
-        exercise_type = request.data.get('exercise_type')
         metrics = request.data.get('metrics')
-        
-        if not exercise_type or not metrics:
+        if not metrics:
             return Response({'error': 'Missing required data'}, 
                           status=status.HTTP_400_BAD_REQUEST)
 
-        # Save exercise session to database
-        exercise_session = UserExercise.objects.create(
-            user=request.user,
-            exercise_type=exercise_type,
-            reps=metrics.get('counter', 0),
-            form_accuracy=metrics.get('form_accuracy', 0),
-            feedback=metrics.get('feedback', '')
-        )
-
+        serializer = WorkoutSessionSerializer(data={
+            'client_session_id': request.data.get('client_session_id'),
+            'exercise_type': exercise_type,
+            'reps': metrics.get('counter', 0),
+            'duration': metrics.get('duration', 0),
+            'form_accuracy': metrics.get('form_accuracy', 0),
+            'calories_burned': metrics.get('calories_burned', 0),
+            'feedback': metrics.get('feedback', ''),
+        })
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        response = _ingest_sessions_response(request, [serializer.validated_data])
+        if response.status_code >= 400:
+            return response
         return Response({
             'message': 'Exercise session saved successfully',
-            'session_id': exercise_session.id
-        })
+            'session_id': response.data['sessions'][0]['session_id']
+        }, status=response.status_code)
 
     except Exception as e:
         return Response({'error': str(e)}, 
                       status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def upload_sessions(request):
+    """
+    Record a batch of completed sessions, e.g. recorded while offline, in one
+    transaction. Sessions whose client_session_id was already uploaded are
+    skipped, so a failed upload can simply be retried.
+    """
+    serializer = WorkoutSessionBatchSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        return _ingest_sessions_response(request, serializer.validated_data['sessions'])
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
 @api_view(['POST'])
 @parser_classes([MultiPartParser])
 def upload_video(request, exercise_type):
@@ -315,17 +536,19 @@ def upload_video(request, exercise_type):
         return Response({'error': 'No video file provided'}, status=400)
     
     video_file = request.FILES['video']
-    file_path = f'exercise_videos/{exercise_type}/{video_file.name}'
-    
-    # Save the file
-    file_path = default_storage.save(file_path, video_file)
-    
+
+    exercise = Exercise.objects.filter(name=exercise_type).first()
+    if exercise is None:
+        return Response({'error': 'Exercise type not found'}, status=404)
+
     # Process the video (implement your video processing logic here)
     try:
-        # Your video processing code here
+        # Save the file once per distinct content, referenced by the new session
+        user_exercise = create_user_exercise(request.user, exercise, video_file)
         return Response({
+            'id': user_exercise.id,
             'message': 'Video uploaded successfully',
-            'file_path': file_path
+            'file_path': user_exercise.video_recording.name
         })
     except Exception as e:
         return Response({'error': str(e)}, status=500)
@@ -371,11 +594,7 @@ class ExerciseViewSet(viewsets.ModelViewSet):
                 )
 
             # Create UserExercise instance
-            user_exercise = UserExercise.objects.create(
-                user=request.user,
-                exercise=exercise,
-                video_recording=video_file
-            )
+            user_exercise = create_user_exercise(request.user, exercise, video_file)
 
             return Response({
                 'id': user_exercise.id,
@@ -397,7 +616,7 @@ class ExerciseViewSet(viewsets.ModelViewSet):
     def analyze_video(self, request, pk=None):
         try:
             # Get the UserExercise instance
-            user_exercise = UserExercise.objects.get(id=pk)
+            user_exercise = UserExercise.objects.get(id=pk, user=request.user)
             
             if not user_exercise.video_recording:
                 return Response(
@@ -405,47 +624,9 @@ class ExerciseViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            # Initialize analyzer with correct exercise type
-            analyzer = ExerciseAnalyzer(user_exercise.exercise.name)
-            
-            # Process video
-            video_path = user_exercise.video_recording.path
-            cap = cv2.VideoCapture(video_path)
-            
-            form_accuracies = []
-            feedback_list = []
-            
-            while cap.isOpened():
-                ret, frame = cap.read()
-                if not ret:
-                    break
-                
-                # Process frame
-                processed_frame, metrics = analyzer.process_frame(frame)
-                form_accuracies.append(metrics.get('form_accuracy', 0))
-                if metrics.get('feedback'):
-                    feedback_list.extend(metrics['feedback'])
-            
-            cap.release()
-            
-            # Calculate overall metrics
-            overall_accuracy = sum(form_accuracies) / len(form_accuracies) if form_accuracies else 0
-            
-            # Update UserExercise instance
-            user_exercise.form_accuracy = overall_accuracy
-            user_exercise.reps = analyzer.counter
-            user_exercise.feedback = "\n".join(set(feedback_list))  # Remove duplicates
-            user_exercise.save()
-            
-            return Response({
-                'id': user_exercise.id,
-                'video_url': request.build_absolute_uri(user_exercise.video_recording.url),
-                'metrics': {
-                    'total_reps': analyzer.counter,
-                    'form_accuracy': overall_accuracy,
-                    'feedback': user_exercise.feedback
-                }
-            })
+            # Analysis runs in a worker process; poll the job for results
+            job = enqueue_analysis(user_exercise)
+            return _queued_job_response(request, job)
 
         except UserExercise.DoesNotExist:
             return Response(
@@ -56,7 +56,7 @@ const Exercise = () => {
     const FPS = 15; // Limit to 15 frames per second
     const frameInterval = 1000 / FPS;
     const { addToQueue, clearQueue } = useSpeechQueue();
-    const { isConnected, error, metrics, sendFrame, connect, disconnect, processedImage } = useWebSocket(exerciseType);
+    const { isConnected, error, metrics, sendFrame, connect, disconnect, processedImage, sessionId } = useWebSocket(exerciseType);
 
     const [exerciseMetrics, setExerciseMetrics] = useState({
         counter: 0,
@@ -131,7 +131,9 @@ const Exercise = () => {
                     reps: reps,
                     form_accuracy: exerciseMetrics.form_accuracy || 0,
                     duration: duration,
-                    calories_burned: Math.round(caloriesBurned * 100) / 100
+                    calories_burned: Math.round(caloriesBurned * 100) / 100,
+                    // The server records sessions it tracked; this keeps them from counting twice
+                    client_session_id: sessionId
                 };
                 
                 console.log('Sending stats payload:', statsPayload);
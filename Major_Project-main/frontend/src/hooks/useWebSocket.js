@@ -9,6 +9,8 @@ const useWebSocket = (exerciseType) => {
     const [error, setError] = useState(null);
     const [metrics, setMetrics] = useState(null);
     const [processedImage, setProcessedImage] = useState(null);
+    // Set when the server records the session itself
+    const [sessionId, setSessionId] = useState(null);
     const lastProcessedTimeRef = useRef(0);
     const DISPLAY_FPS = 10; // Limit display updates to 10 FPS
     const displayInterval = 1000 / DISPLAY_FPS;
@@ -25,6 +27,7 @@ const useWebSocket = (exerciseType) => {
                 console.log('WebSocket connected');
                 setIsConnected(true);
                 setError(null);
+                setSessionId(null);
                 reconnectAttemptsRef.current = 0;
             };
 
@@ -41,6 +44,8 @@ const useWebSocket = (exerciseType) => {
                             setProcessedImage(data.frame);
                             lastProcessedTimeRef.current = now;
                         }
+                    } else if (data.type === 'session_started') {
+                        setSessionId(data.client_session_id);
                     } else if (data.type === 'error') {
                         console.error('Server error:', data.message);
                         setError(data.message);
@@ -95,6 +100,7 @@ const useWebSocket = (exerciseType) => {
         error, 
         metrics, 
         processedImage,
+        sessionId,
         sendFrame, 
         connect, 
         disconnect 
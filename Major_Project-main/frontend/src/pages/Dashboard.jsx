@@ -50,7 +50,7 @@ const Dashboard = () => {
     const fetchRecentExercises = async () => {
       try {
         const response = await APIUtility.getUserExercises();
-        setRecentExercises(response);
+        setRecentExercises(response.results);
       } catch (error) {
         console.error('Error fetching recent exercises:', error);
       }
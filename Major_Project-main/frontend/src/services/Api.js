@@ -64,6 +64,13 @@ export const APIUtility = {
       url: "/api/auth/stats/",
     }),
 
+  // Stats, progress, achievements and settings in one cached response
+  getDashboard: () =>
+    apiCall({
+      method: "GET",
+      url: "/api/auth/dashboard/",
+    }),
+
   uploadVideo: (exerciseType, formData) =>
     apiCall({
       method: "POST",
@@ -99,6 +106,15 @@ export const APIUtility = {
       data: sessionData,
     }),
 
+  // Sessions recorded offline: [{ client_session_id, exercise_type, reps, duration, form_accuracy,
+  // calories_burned, feedback, recorded_at }]; safe to retry with the same client_session_ids
+  uploadSessions: (sessions) =>
+    apiCall({
+      method: "POST",
+      url: "/api/exercises/sessions/",
+      data: { sessions },
+    }),
+
   // Goals and Progress APIs
   updateUserGoals: (body) =>
     apiCall({
@@ -206,10 +222,29 @@ export const APIUtility = {
       }
     }),
 
-  getUserExercises: () =>
+  // Newest first; pass { cursor } from the previous page's `next` link for older workouts,
+  // and optionally { exercise, from, to, page_size }
+  getUserExercises: (params = {}) =>
     apiCall({
       method: "GET",
       url: "/api/exercises/user/",
+      params
+    }),
+
+  // Progress chart series: { bucket: "day" | "week" | "month", points, exercise, from, to }
+  getAnalytics: (params = {}) =>
+    apiCall({
+      method: "GET",
+      url: "/api/exercises/analytics/",
+      params
+    }),
+
+  // { metric: "reps" | "form_accuracy" | "streak", window: "daily" | "weekly" | "all_time", exercise, offset, limit }
+  getLeaderboard: (params = {}) =>
+    apiCall({
+      method: "GET",
+      url: "/api/exercises/leaderboard/",
+      params
     }),
 
   startAnalysis: (exerciseId, formData, exerciseType) =>